@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from .message_index import estimate_tokens
+from .milestones import RawMilestone
+from .rollups import DirectoryRollup
+from .routing import FULL_ROUTE, route_milestone
+
+# Input tokens a single batched call may spend on milestone digests.
+default_batch_token_budget = 6000
+
+# Most milestones summarized by one batched call.
+default_max_batch_size = 8
+
+# Limits on what a digest lists of a milestone.
+digest_max_messages = 20
+digest_max_message_length = 200
+digest_max_files = 15
+
+
+def milestone_digest(position: int, milestone: RawMilestone) -> str:
+    """Compact text description of a milestone for the batched prompt."""
+    start = datetime.fromtimestamp(milestone.time_start).strftime("%Y-%m-%d %H:%M")
+    end = datetime.fromtimestamp(milestone.time_end).strftime("%Y-%m-%d %H:%M")
+    lines = [f"### Milestone {position}", f"Time: {start} to {end}"]
+
+    index = milestone.get_message_index()
+    lines.append(f"Commits ({index.total}, {index.distinct} distinct subjects):")
+    shown = index.top(digest_max_messages)
+    for message in shown:
+        lines.append(f"- {message[:digest_max_message_length]}")
+    if index.distinct > len(shown):
+        lines.append(f"- ... and {index.distinct - len(shown)} more")
+
+    entries = milestone.get_rollup()
+    insertions = sum(max(c.insertions, 0) for c in milestone.changes)
+    deletions = sum(max(c.deletions, 0) for c in milestone.changes)
+    lines.append(f"Changed files ({len(milestone.changes)}, +{insertions} -{deletions}):")
+    largest = sorted(
+        entries,
+        key=lambda e: max(e.insertions, 0) + max(e.deletions, 0),
+        reverse=True,
+    )
+    for entry in largest[:digest_max_files]:
+        if isinstance(entry, DirectoryRollup):
+            lines.append(
+                f"- {entry.path} ({entry.file_count} files, mostly {entry.dominant_status}) "
+                f"+{entry.insertions} -{entry.deletions}"
+            )
+        else:
+            lines.append(
+                f"- {entry.status} {entry.path} "
+                f"+{max(entry.insertions, 0)} -{max(entry.deletions, 0)}"
+            )
+    if len(largest) > digest_max_files:
+        lines.append(f"- ... and {len(largest) - digest_max_files} more")
+    return "\n".join(lines)
+
+
+def batch_input(milestones: List[RawMilestone], prev_summary: Optional[str] = None) -> str:
+    parts = [f"Summarize these {len(milestones)} milestones."]
+    if prev_summary is not None:
+        parts.append(f"Summary of the milestone before them: {prev_summary}")
+    parts.extend(milestone_digest(i + 1, m) for i, m in enumerate(milestones))
+    return "\n\n".join(parts)
+
+
+class MilestoneBatcher:
+    """
+    Collects consecutive milestones that do not need the full agent, until their
+    digests would exceed the token budget or the batch size limit.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = default_batch_token_budget,
+        max_size: int = default_max_batch_size,
+    ):
+        self.token_budget = token_budget
+        self.max_size = max_size
+        self.pending: List[Tuple[int, RawMilestone]] = []
+        self.tokens = 0
+
+    def accepts(self, milestone: RawMilestone) -> bool:
+        return route_milestone(milestone).route != FULL_ROUTE
+
+    def fits(self, milestone: RawMilestone) -> bool:
+        if not self.pending:
+            return True
+        tokens = estimate_tokens(milestone_digest(len(self.pending) + 1, milestone))
+        return (
+            len(self.pending) < self.max_size
+            and self.tokens + tokens <= self.token_budget
+        )
+
+    def add(self, index: int, milestone: RawMilestone):
+        self.pending.append((index, milestone))
+        self.tokens += estimate_tokens(milestone_digest(len(self.pending), milestone))
+
+    def take(self) -> List[Tuple[int, RawMilestone]]:
+        batch, self.pending, self.tokens = self.pending, [], 0
+        return batch
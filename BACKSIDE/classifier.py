@@ -0,0 +1,388 @@
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from . import gitexec
+
+# --- Categories ---
+SOURCE = "source"
+SETUP = "setup"
+LOCKFILE = "lockfile"
+DATA = "data"
+VENDORED = "vendored"
+GENERATED = "generated"
+DOCUMENTATION = "documentation"
+OTHER = "other"
+
+# Categories whose diffs are not worth reading and that rollups may collapse.
+LOW_SIGNAL_CATEGORIES = {LOCKFILE, DATA, VENDORED, GENERATED}
+
+# --- Churn Weight Configuration ---
+BASE_WEIGHT = 0.70
+IMPORTANT_EXT_WEIGHT = 20  # Boost for important file types
+SETUP_WEIGHT = 0.04
+DATA_EXT_WEIGHT = 0.01
+VENDORED_WEIGHT = 0.01
+
+CATEGORY_WEIGHTS = {
+    SOURCE: BASE_WEIGHT * IMPORTANT_EXT_WEIGHT,
+    SETUP: BASE_WEIGHT * SETUP_WEIGHT,
+    LOCKFILE: BASE_WEIGHT * SETUP_WEIGHT,
+    DATA: BASE_WEIGHT * DATA_EXT_WEIGHT,
+    VENDORED: BASE_WEIGHT * VENDORED_WEIGHT,
+    GENERATED: BASE_WEIGHT * VENDORED_WEIGHT,
+    DOCUMENTATION: BASE_WEIGHT,
+    OTHER: BASE_WEIGHT,
+}
+
+IMPORTANT_EXTENSIONS = {
+    # Core Source
+    ".py",
+    ".c",
+    ".h",
+    ".cpp",
+    ".hpp",
+    ".cc",
+    ".java",
+    ".kt",
+    ".cs",
+    ".js",
+    ".ts",
+    ".jsx",
+    ".tsx",
+    ".go",
+    ".rs",
+    ".swift",
+    ".rb",
+    ".php",
+}
+SETUP_EXTENSIONS = {
+    # Build & Config
+    ".yml",
+    ".yaml",
+    # Infra & Schema
+    ".sql",
+    ".proto",
+    ".graphql",
+    ".tf",
+    ".hcl",
+    ".json",
+    ".lock",
+}
+SETUP_FILENAMES = {
+    "Makefile",
+    "Dockerfile",
+    "pom.xml",
+    "build.gradle",
+    "pyproject.toml",
+    "go.mod",
+    "CMakeLists.txt",
+}
+LOCKFILE_FILENAMES = {
+    "package-lock.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "bun.lockb",
+    "Cargo.lock",
+    "Gemfile.lock",
+    "composer.lock",
+    "poetry.lock",
+    "Pipfile.lock",
+    "uv.lock",
+    "go.sum",
+    "flake.lock",
+    "Podfile.lock",
+}
+DATA_EXTENSIONS = {
+    # -- Images --
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".bmp",
+    ".tiff",
+    ".webp",
+    ".psd",
+    ".ai",
+    ".svg",  # Can be large if complex
+    ".ico",
+    # -- Audio --
+    ".mp3",
+    ".wav",
+    ".flac",
+    ".aac",
+    ".ogg",
+    ".m4a",
+    # -- Video --
+    ".mp4",
+    ".mov",
+    ".avi",
+    ".mkv",
+    ".webm",
+    ".flv",
+    ".wmv",
+    # -- Documents & Archives --
+    ".pdf",
+    ".zip",
+    ".gz",
+    ".tar",
+    ".rar",
+    ".7z",
+    ".iso",
+    ".doc",
+    ".docx",
+    ".ppt",
+    ".pptx",
+    ".xls",
+    ".xlsx",
+    # -- Models & 3D Assets --
+    ".obj",
+    ".fbx",
+    ".blend",
+    ".dae",
+    ".stl",
+    ".glb",
+    ".gltf",
+    # -- Data & Databases --
+    ".db",
+    ".sqlite",
+    ".mdb",
+    ".accdb",
+    ".csv",  # Can be very large
+    ".parquet",
+    ".hdf5",
+    ".pkl",
+    ".bin",
+    ".dat",
+    # -- Executables & Libraries --
+    ".exe",
+    ".dll",
+    ".so",
+    ".a",
+    ".lib",
+    # -- Fonts --
+    ".ttf",
+    ".otf",
+    ".woff",
+    ".woff2",
+}
+DOCUMENTATION_EXTENSIONS = {".md", ".rst", ".txt", ".adoc"}
+
+# Directory names whose contents are third-party code.
+VENDORED_DIRECTORIES = {
+    "node_modules",
+    "bower_components",
+    "vendor",
+    "vendors",
+    "third_party",
+    "thirdparty",
+    "external",
+    "site-packages",
+    ".venv",
+    "venv",
+    "Pods",
+    "Carthage",
+    ".yarn",
+    ".pnpm-store",
+}
+# Directory names whose contents are build output or generated by tools.
+GENERATED_DIRECTORIES = {
+    "__pycache__",
+    "dist",
+    "build",
+    "out",
+    "target",
+    ".next",
+    ".nuxt",
+    "coverage",
+    "generated",
+    "__generated__",
+}
+
+# Glob rules checked against the full path, in order, first match wins.
+GLOB_RULES: List[Tuple[str, str]] = [
+    ("*.min.js", GENERATED),
+    ("*.min.css", GENERATED),
+    ("*.map", GENERATED),
+    ("*.pb.go", GENERATED),
+    ("*_pb2.py", GENERATED),
+    ("*_pb2_grpc.py", GENERATED),
+    ("*.pb.h", GENERATED),
+    ("*.pb.cc", GENERATED),
+    ("*.generated.*", GENERATED),
+    ("*.config.ts", SETUP),
+    ("*.config.js", SETUP),
+    ("*.config.mjs", SETUP),
+]
+
+
+def _directory_regex(names) -> re.Pattern:
+    alternatives = "|".join(re.escape(name) for name in sorted(names))
+    return re.compile(rf"(?:^|/)(?:{alternatives})/")
+
+
+@dataclass(frozen=True)
+class Classification:
+    category: str
+    weight: float
+
+
+def parse_gitattributes(text: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Extracts (pattern, category) overrides from .gitattributes content. A category
+    of None cancels the built-in rules (e.g. `linguist-vendored=false`).
+    """
+    rules = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        pattern, *attributes = line.split()
+        for attribute in attributes:
+            name, _, value = attribute.lstrip("-!").partition("=")
+            unset = attribute.startswith(("-", "!")) or value == "false"
+            if name == "linguist-vendored":
+                rules.append((pattern, None if unset else VENDORED))
+            elif name == "linguist-generated":
+                rules.append((pattern, None if unset else GENERATED))
+            elif name == "linguist-documentation":
+                rules.append((pattern, None if unset else DOCUMENTATION))
+            elif (name == "binary" and not unset) or attribute == "-diff":
+                rules.append((pattern, DATA))
+    return rules
+
+
+def compile_glob(glob: str) -> re.Pattern:
+    """
+    gitattributes-style glob -> regex over repository-relative paths.
+    Without a slash the glob matches a file or directory name at any depth,
+    otherwise it is anchored to the root. Either way, matching a directory
+    also matches everything below it.
+    """
+    glob = glob.rstrip("/")
+    anchored = "/" in glob
+    glob = glob.lstrip("/")
+    parts = []
+    i = 0
+    while i < len(glob):
+        if glob.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        else:
+            char = glob[i]
+            if char == "*":
+                parts.append("[^/]*")
+            elif char == "?":
+                parts.append("[^/]")
+            else:
+                parts.append(re.escape(char))
+            i += 1
+    body = "".join(parts)
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(rf"{prefix}{body}(?:/.*)?\Z", re.DOTALL)
+
+
+class PathClassifier:
+    """
+    Assigns a category and a churn weight to repository paths.
+    Rules are compiled once; results are memoized per path.
+    Precedence: .gitattributes overrides, vendored/generated directories,
+    lockfile and setup names, glob rules, then extensions.
+    """
+
+    def __init__(self, gitattributes: str = "", memo_size: int = 65536):
+        self.overrides = [
+            (compile_glob(pattern), category)
+            for pattern, category in parse_gitattributes(gitattributes)
+        ]
+        # last matching .gitattributes line wins, so check them in reverse
+        self.overrides.reverse()
+        self.glob_rules = [
+            (compile_glob(glob), category)
+            for glob, category in GLOB_RULES
+        ]
+        self.vendored_directories = _directory_regex(VENDORED_DIRECTORIES)
+        self.generated_directories = _directory_regex(GENERATED_DIRECTORIES)
+        self.classify = lru_cache(maxsize=memo_size)(self._classify)
+
+    def _category(self, path: str) -> str:
+        for regex, category in self.overrides:
+            if regex.match(path):
+                if category is not None:
+                    return category
+                break
+        else:
+            # no override: directories only count when not explicitly cancelled
+            if self.vendored_directories.search(path):
+                return VENDORED
+            if self.generated_directories.search(path):
+                return GENERATED
+
+        filename = os.path.basename(path)
+        if filename in LOCKFILE_FILENAMES:
+            return LOCKFILE
+        if filename in SETUP_FILENAMES:
+            return SETUP
+        for regex, category in self.glob_rules:
+            if regex.match(path):
+                return category
+        _, ext = os.path.splitext(filename)
+        if ext in IMPORTANT_EXTENSIONS:
+            return SOURCE
+        if ext in SETUP_EXTENSIONS:
+            return SETUP
+        if ext in DATA_EXTENSIONS:
+            return DATA
+        if ext in DOCUMENTATION_EXTENSIONS:
+            return DOCUMENTATION
+        return OTHER
+
+    def _classify(self, path: str) -> Classification:
+        category = self._category(path)
+        return Classification(category, CATEGORY_WEIGHTS[category])
+
+    def weight(self, path: str) -> float:
+        return self.classify(path).weight
+
+    def is_low_signal(self, path: str) -> bool:
+        return self.classify(path).category in LOW_SIGNAL_CATEGORIES
+
+    def is_low_signal_directory(self, directory: str) -> bool:
+        """True if everything below directory (e.g. 'web/node_modules/') is vendored or generated."""
+        # classify a placeholder child: only directory-level rules can match it
+        child = directory.rstrip("/") + "/\0"
+        return self.classify(child).category in (VENDORED, GENERATED, DATA)
+
+
+default_classifier = PathClassifier()
+
+
+def get_file_weight(file_path: str) -> float:
+    """Churn multiplier for a path under the default rules (no .gitattributes)."""
+    return default_classifier.weight(file_path)
+
+
+@gitexec.repository_cache()
+def get_repo_classifier(repo_path: Optional[str]) -> PathClassifier:
+    """
+    Classifier honouring the repository's .gitattributes at HEAD.
+    Cached per repository; call get_repo_classifier.forget(repo_path) after HEAD
+    moves. Runs git on a miss: call it from a worker thread, not the event loop
+    (RawMilestone.get_classifier holds the one resolved with the milestone).
+    """
+    if repo_path is None:
+        return default_classifier
+    result = gitexec.run(
+        ["git", "show", "HEAD:.gitattributes"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0 or not result.stdout.strip():
+        return default_classifier
+    return PathClassifier(result.stdout)
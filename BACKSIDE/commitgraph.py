@@ -0,0 +1,271 @@
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from . import gitexec
+
+# Set COMMIT_GRAPH=0 to always ask git instead.
+default_use_commit_graph = os.getenv("COMMIT_GRAPH", "1") != "0"
+
+GRAPH_PATH = os.path.join(".git", "objects", "info", "commit-graph")
+
+SIGNATURE = b"CGPH"
+HASH_LENGTHS = {1: 20, 2: 32}  # hash version: SHA-1, SHA-256
+CHUNK_FANOUT = b"OIDF"
+CHUNK_OIDS = b"OIDL"
+CHUNK_DATA = b"CDAT"
+CHUNK_EXTRA_EDGES = b"EDGE"
+
+UINT32 = struct.Struct(">I")
+RECORD = struct.Struct(">IIII")
+
+NO_PARENT = 0x70000000
+EXTRA_EDGE = 0x80000000  # second parent field points into EDGE (octopus merges)
+LAST_EDGE = 0x80000000
+
+
+class CommitGraphFormatException(Exception):
+    pass
+
+
+class CommitGraph:
+    """
+    Memory-mapped .git/objects/info/commit-graph. Commits are addressed by their
+    position in the file's sorted object id list. Parent, generation number and
+    commit date lookups read fixed offsets of the mapping: no git process, no
+    per-commit objects. Only knows the commits the file was written for, so every
+    query returns None for anything it cannot answer and callers fall back to git.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, version, hash_version, num_chunks, num_bases = struct.unpack_from(
+            ">4sBBBB", self.map, 0
+        )
+        if signature != SIGNATURE or version != 1 or hash_version not in HASH_LENGTHS:
+            raise CommitGraphFormatException(f"Unsupported commit-graph file {path}")
+        if num_bases:
+            raise CommitGraphFormatException(f"{path} is part of a split commit-graph chain")
+        self.hash_length = HASH_LENGTHS[hash_version]
+
+        chunks: Dict[bytes, int] = {}
+        for i in range(num_chunks):
+            chunk_id, offset = struct.unpack_from(">4sQ", self.map, 8 + 12 * i)
+            chunks[chunk_id] = offset
+        for required in (CHUNK_FANOUT, CHUNK_OIDS, CHUNK_DATA):
+            if required not in chunks:
+                raise CommitGraphFormatException(f"{path} has no {required.decode()} chunk")
+        self.fanout = chunks[CHUNK_FANOUT]
+        self.oids = chunks[CHUNK_OIDS]
+        self.data = chunks[CHUNK_DATA]
+        self.extra_edges = chunks.get(CHUNK_EXTRA_EDGES)
+        self.data_width = self.hash_length + 16
+        self.count = self._fanout(255)
+        # first-parent chains by head position: (positions oldest first, index of each)
+        self._chains: Dict[int, Tuple[List[int], Dict[int, int]]] = {}
+
+    def _fanout(self, byte: int) -> int:
+        return UINT32.unpack_from(self.map, self.fanout + 4 * byte)[0]
+
+    def _oid_bytes(self, position: int) -> bytes:
+        start = self.oids + position * self.hash_length
+        return self.map[start : start + self.hash_length]
+
+    def position(self, oid: str) -> Optional[int]:
+        """Position of a commit (full hex id), None if the graph does not have it."""
+        try:
+            key = bytes.fromhex(oid)
+        except ValueError:
+            return None
+        if len(key) != self.hash_length:
+            return None
+        # the fanout narrows the search to ids sharing the first byte
+        low = self._fanout(key[0] - 1) if key[0] else 0
+        high = self._fanout(key[0])
+        while low < high:
+            mid = (low + high) // 2
+            found = self._oid_bytes(mid)
+            if found < key:
+                low = mid + 1
+            elif found > key:
+                high = mid
+            else:
+                return mid
+        return None
+
+    def oid(self, position: int) -> str:
+        return self._oid_bytes(position).hex()
+
+    def _record(self, position: int) -> Tuple[int, int, int, int]:
+        """(first parent field, second parent field, generation, commit time)"""
+        parent1, parent2, high, low = RECORD.unpack_from(
+            self.map, self.data + position * self.data_width + self.hash_length
+        )
+        # 30 bits of topological level, then 34 bits of commit time
+        return parent1, parent2, high >> 2, ((high & 0x3) << 32) | low
+
+    def first_parent(self, position: int) -> Optional[int]:
+        parent = UINT32.unpack_from(
+            self.map, self.data + position * self.data_width + self.hash_length
+        )[0]
+        return None if parent == NO_PARENT else parent
+
+    def parents(self, position: int) -> List[int]:
+        parent1, parent2, _, _ = self._record(position)
+        if parent1 == NO_PARENT:
+            return []
+        if parent2 == NO_PARENT:
+            return [parent1]
+        if not parent2 & EXTRA_EDGE:
+            return [parent1, parent2]
+        parents = [parent1]
+        edge = parent2 & ~EXTRA_EDGE
+        while True:
+            value = UINT32.unpack_from(self.map, self.extra_edges + 4 * edge)[0]
+            parents.append(value & ~LAST_EDGE)
+            if value & LAST_EDGE:
+                return parents
+            edge += 1
+
+    def generation(self, position: int) -> int:
+        """Topological level: 1 for root commits, one more than the highest parent."""
+        return self._record(position)[2]
+
+    def commit_time(self, position: int) -> int:
+        return self._record(position)[3]
+
+    def _chain(self, head: int) -> Tuple[List[int], Dict[int, int]]:
+        """First-parent chain of head, walked once per head and graph file."""
+        chain = self._chains.get(head)
+        if chain is None:
+            positions = []
+            position = head
+            while position is not None:
+                positions.append(position)
+                position = self.first_parent(position)
+            positions.reverse()
+            chain = self._chains[head] = (positions, {p: i for i, p in enumerate(positions)})
+        return chain
+
+    def first_parent_chain(self, head: str, stop: Optional[str] = None) -> Optional[List[str]]:
+        """
+        Commits on the first-parent chain of head, oldest first, like
+        `git rev-list --first-parent --reverse [stop..]head`. None if a commit is
+        missing from the graph or stop is not on the chain.
+        """
+        position = self.position(head)
+        if position is None:
+            return None
+        positions, index = self._chain(position)
+        start = 0
+        if stop is not None:
+            start = index.get(self.position(stop), -1) + 1
+            if not start:
+                return None
+        return [self.oid(p) for p in positions[start:]]
+
+    def first_parent_root(self, head: str) -> Optional[str]:
+        """Oldest commit of the first-parent chain of head."""
+        position = self.position(head)
+        if position is None:
+            return None
+        return self.oid(self._chain(position)[0][0])
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> Optional[bool]:
+        """
+        Reachability like `git merge-base --is-ancestor`. Generation numbers prune
+        the walk: nothing below the ancestor's level can lead to it.
+        """
+        target = self.position(ancestor)
+        start = self.position(descendant)
+        if target is None or start is None:
+            return None
+        positions, index = self._chain(start)
+        if target in index:
+            return True
+        level = self.generation(target)
+        seen = {start}
+        stack = [start]
+        while stack:
+            position = stack.pop()
+            if position == target:
+                return True
+            for parent in self.parents(position):
+                if parent not in seen and self.generation(parent) >= level:
+                    seen.add(parent)
+                    stack.append(parent)
+        return False
+
+    def close(self):
+        self.map.close()
+
+
+_graphs: Dict[str, Tuple[int, CommitGraph]] = {}
+_lock = threading.Lock()
+
+
+def get_commit_graph(repo_path: str) -> Optional[CommitGraph]:
+    """
+    The repository's commit-graph, reopened whenever git rewrites the file. None
+    if there is none (e.g. shallow clones, which git never writes one for).
+    """
+    if not default_use_commit_graph:
+        return None
+    path = os.path.join(os.path.abspath(repo_path), GRAPH_PATH)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    with _lock:
+        cached = _graphs.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            graph = CommitGraph(path)
+        except (CommitGraphFormatException, ValueError, struct.error) as e:
+            print(f"Warning: Not using commit-graph {path}: {e}")
+            return None
+        # the old mapping may still be in use by another thread; it is unmapped
+        # when its last reference goes away
+        _graphs[path] = (mtime, graph)
+        return graph
+
+
+def write_commit_graph(repo_path: str):
+    """Writes (or rewrites) the commit-graph of every reachable commit."""
+    if not default_use_commit_graph:
+        return
+    result = gitexec.run(
+        ["git", "commit-graph", "write", "--reachable"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        print(f"Warning: Failed to write commit-graph: {result.stderr.strip()}")
+
+
+def resolve_head(repo_path: str) -> Optional[str]:
+    """Commit id of HEAD from .git/HEAD and the (loose or packed) refs, or None."""
+    git_dir = os.path.join(repo_path, ".git")
+    try:
+        with open(os.path.join(git_dir, "HEAD"), "r") as f:
+            head = f.read().strip()
+        if not head.startswith("ref: "):
+            return head
+        ref = head[5:]
+        loose = os.path.join(git_dir, ref)
+        if os.path.exists(loose):
+            with open(loose, "r") as f:
+                return f.read().strip()
+        with open(os.path.join(git_dir, "packed-refs"), "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except OSError:
+        return None
+    return None
@@ -1,14 +1,44 @@
+import fcntl
 import subprocess as sp
 import string
 import random
 import os
+import re
+import shutil
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
 from sys import stdout
+from .scoring import NUMSTAT_MODE, calculate_score
+from .classifier import get_repo_classifier
+from .commitgraph import get_commit_graph, resolve_head, write_commit_graph
 from .gitmodels import Commit
-from typing import Optional
+from . import gitexec, tracing
+from typing import List, Optional, Tuple
 
 default_cloning_depth = 310
 
 
+_repository_locks = defaultdict(threading.Lock)
+
+
+@contextmanager
+def repository_lock(path: str):
+    """
+    Serializes cloning and updating one workspace clone, between the pipelines of
+    this process (threads) and other processes sharing the workspace (a lock file
+    next to the clone).
+    """
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _repository_locks[path], open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def generate_slug(length=12):
     """Generate a random alphanumeric slug of specified length."""
     characters = string.ascii_letters + string.digits  # a-z, A-Z, 0-9
@@ -57,6 +87,9 @@ class DataFetcher:
         while os.path.exists(path):
             slug = generate_slug()
             path = os.path.join(workspace_path, slug)
+        return self._clone_repository(repo, path, depth, use_https)
+
+    def _clone_repository(self, repo: str, path: str, depth: int, use_https: bool):
         if use_https:
             url = f"https://github.com/{repo}.git"
         else:
@@ -71,7 +104,8 @@ class DataFetcher:
             path,
         ]
         try:
-            result = sp.run(command, capture_output=True, text=True, check=True)
+            with tracing.span("clone", repo=repo, depth=depth):
+                result = gitexec.run(command, capture_output=True, text=True, check=True)
             if not os.path.exists(path):
                 print("Failed to execute command. Stdout:")
                 print(result.stdout)
@@ -80,12 +114,98 @@ class DataFetcher:
                 raise RepoNotFoundException
             empty_repo_check = ["git", "rev-list", "-n", "1", "--all"]
             try:
-                sp.run(empty_repo_check, check=True)
+                gitexec.run(empty_repo_check, check=True)
             except sp.CalledProcessError:
                 raise EmptyRepositoryException(f"Repo {repo} is empty.")
+            # ancestry queries read it instead of running git (not for shallow clones)
+            write_commit_graph(path)
             return path
         except sp.CalledProcessError:
             raise RepoNotFoundException(f"Failed to find repository {repo}.")
+        except gitexec.GitCancelled:
+            # a killed clone leaves a half-written repository behind
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+
+    def fetch_or_update_repository(
+        self,
+        repo: str,
+        workspace_path: str,
+        depth: int = default_cloning_depth,
+        use_https: bool = False,
+    ) -> str:
+        """
+        Like fetch_github_repository, but keeps one clone per repository in the
+        workspace. If the repository was cloned before, only new commits are fetched
+        and HEAD is moved to the remote HEAD. Concurrent calls for one repository
+        run one after another, so a clone removed after cancellation was never
+        handed to anyone else.
+        returns: file path to the cloned folder.
+        """
+        path = os.path.join(workspace_path, repo.replace("/", "__"))
+        with repository_lock(path):
+            if not os.path.exists(os.path.join(path, ".git")):
+                return self._clone_repository(repo, path, depth, use_https)
+            return self._update_repository(repo, path)
+
+    def _update_repository(self, repo: str, path: str) -> str:
+        commands = [
+            ["git", "fetch", "--filter=blob:none", "origin"],
+            ["git", "update-ref", "HEAD", "refs/remotes/origin/HEAD"],
+        ]
+        try:
+            with tracing.span("update", repo=repo):
+                for command in commands:
+                    gitexec.run(
+                        command, cwd=path, capture_output=True, text=True, check=True
+                    )
+        except sp.CalledProcessError as e:
+            raise RepoNotFoundException(
+                f"Failed to update repository {repo}.\nstderr:{e.stderr}"
+            )
+        write_commit_graph(path)
+        # HEAD moved, .gitattributes may have changed with it
+        get_repo_classifier.forget(path)
+        return path
+
+    def get_commit(self, repository: str, ref: str) -> Commit:
+        """Loads a single commit by hash or ref name."""
+        format_string = "%H%x00%P%x00%an%x00%at%x00%ct%x00%s"
+        command = ["git", "log", "-n", "1", ref, f"--format={format_string}"]
+        try:
+            output = gitexec.run(
+                command, cwd=repository, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except sp.CalledProcessError as e:
+            raise FailedGitLogException(
+                f"Failed to execute following command:\n{' '.join(command)}\nin folder {repository}\n\nstderr:{e.stderr}"
+            )
+        parts = output.split("\x00")
+        return Commit(
+            hash=parts[0],
+            parent_hashes=parts[1].split(),
+            author_name=parts[2],
+            author_date_unix=int(parts[3]),
+            committer_date_unix=int(parts[4]),
+            subject=parts[5],
+            repository=repository,
+        )
+
+    def is_ancestor(self, repository: str, ancestor: str, ref: str = "HEAD") -> bool:
+        """True if commit `ancestor` is still part of the history of ref."""
+        graph = get_commit_graph(repository)
+        if graph is not None and ref == "HEAD":
+            head = resolve_head(repository)
+            found = graph.is_ancestor(ancestor, head) if head is not None else None
+            if found is not None:
+                return found
+        result = gitexec.run(
+            ["git", "merge-base", "--is-ancestor", ancestor, ref],
+            cwd=repository,
+            capture_output=True,
+            text=True,
+        )
+        return result.returncode == 0
 
     def get_merge_commit_log(self, repository: str):
         format_string = "%x1e%H%x1f%P%x1f%an%x1f%at%x1f%ct%x1f%s"
@@ -103,7 +223,7 @@ class DataFetcher:
         result = None
         print("Grabbing commits...")
         try:
-            result = sp.run(
+            result = gitexec.run(
                 git_cmd, cwd=repository, capture_output=True, text=True, check=True
             )
             commits = []
@@ -137,6 +257,70 @@ class DataFetcher:
                 f"Failed to run following command:\n{' '.join(git_cmd)}\nin directory {repository}"
             )
 
+    def get_first_parent_numstat(
+        self, repository: str
+    ) -> List[Tuple[Commit, List[Tuple[int, int, str]]]]:
+        """
+        Walks the first-parent chain of HEAD, oldest commit first, in a single git call.
+        returns: (commit, [(insertions, deletions, path), ...]) for every commit, where the
+        stats are the commit's diff against its first parent.
+        """
+        format_string = "%x1e%H%x1f%P%x1f%an%x1f%at%x1f%ct%x1f%s"
+        git_cmd = [
+            "git",
+            "--no-pager",
+            "log",
+            "--first-parent",
+            "--diff-merges=first-parent",
+            "--numstat",
+            f"--pretty=format:{format_string}",
+            "--reverse",
+            "HEAD",
+        ]
+        try:
+            result = gitexec.run(
+                git_cmd, cwd=repository, capture_output=True, text=True, check=True
+            )
+        except sp.CalledProcessError:
+            raise FailedGitLogException(
+                f"Failed to run following command:\n{' '.join(git_cmd)}\nin directory {repository}"
+            )
+
+        history = []
+        for record in result.stdout.split("\x1e")[1:]:
+            header, *stat_lines = record.split("\n")
+            try:
+                chash, parents_str, aname, adate, cdate, subject = header.split("\x1f")
+            except ValueError:
+                raise FailedLogParseException(f"Failed to parse log record: {header}")
+            commit = Commit(
+                hash=chash,
+                parent_hashes=parents_str.split(),
+                author_name=aname,
+                author_date_unix=int(adate),
+                committer_date_unix=int(cdate),
+                subject=subject,
+                repository=repository,
+            )
+            stats = []
+            for line in stat_lines:
+                if not line:
+                    continue
+                insertions, deletions, path = line.split("\t", 2)
+                # renames are printed as "dir/{old => new}.py" or "old => new"
+                if " => " in path:
+                    path = re.sub(r"\{[^{}]* => ([^{}]*)\}", r"\1", path)
+                    path = path.split(" => ")[-1].replace("//", "/")
+                stats.append(
+                    (
+                        int(insertions) if insertions != "-" else 0,
+                        int(deletions) if deletions != "-" else 0,
+                        path,
+                    )
+                )
+            history.append((commit, stats))
+        return history
+
     def get_boundary_commit(self, repository: str, first: bool = True) -> Commit:
         """Finds the very first (oldest) or last (newest) commit of a branch."""
         # --reverse finds the oldest commit first. Without it, we get the newest.
@@ -151,6 +335,19 @@ class DataFetcher:
             f'--pretty=format:"{format_string}"',
         ]
         if first:
+            graph = get_commit_graph(repository)
+            head = resolve_head(repository) if graph is not None else None
+            root_hash = graph.first_parent_root(head) if head is not None else None
+        if first and root_hash is not None:
+            command = [
+                "git",
+                "--no-pager",
+                "show",
+                root_hash,
+                f'--pretty=format:"{format_string}"',
+                "--no-patch",
+            ]
+        elif first:
             try:
                 # STEP 1: Run the inner command to get the root commit hash
                 rev_list_command = [
@@ -160,7 +357,7 @@ class DataFetcher:
                     "--max-parents=0",
                     "HEAD",
                 ]
-                rev_list_result = sp.run(
+                rev_list_result = gitexec.run(
                     rev_list_command,
                     cwd=repository,
                     capture_output=True,
@@ -184,7 +381,7 @@ class DataFetcher:
 
         print(" ".join(command))
         try:
-            result = sp.run(
+            result = gitexec.run(
                 command,
                 cwd=repository,
                 capture_output=True,
@@ -216,78 +413,73 @@ class DataFetcher:
                 f"Failed to execute following command:\n{' '.join(command)}\nin folder {repository}\n\nstdout:\n{e.stdout}\n\nstderr:{e.stderr}"
             )
 
-    def getScore(self, c1: Commit, c2: Commit, repository: str):
-        command = ["../../scoregen.py", c1.hash, c2.hash]
-        print(" ".join(command))
-        try:
-            result = sp.run(
-                command, cwd=repository, capture_output=True, text=True, check=True
-            )
-        except sp.CalledProcessError as e:
-            print("Encountered exception when calculating score:", e.stdout, e.stderr)
-
-        ret = float(result.stdout)
-        return ret
-
-    def get_next_commit_with_score_threshold(
-        self, repository: str, start_commit: Commit, threshold: float
-    ) -> Commit:
-        """Get the next commit such that the score heuristic exceeds some threshold."""
-        bisect_start_command = [
+    def getScore(
+        self, c1: Commit, c2: Commit, repository: str, mode: str = NUMSTAT_MODE
+    ):
+        with tracing.span("scoregen", c1=c1.hash, c2=c2.hash, mode=mode) as args:
+            args["score"] = calculate_score(c1.hash, c2.hash, repository, mode=mode)
+        return args["score"]
+
+    def get_first_parent_chain(self, repository: str, start_hash: str) -> List[str]:
+        """Hashes of the first-parent chain of HEAD after start_hash, oldest first."""
+        graph = get_commit_graph(repository)
+        head = resolve_head(repository) if graph is not None else None
+        chain = graph.first_parent_chain(head, start_hash) if head is not None else None
+        if chain is not None:
+            return chain
+        rev_list_command = [
             "git",
-            "bisect",
-            "start",
+            "rev-list",
             "--first-parent",
-            "HEAD",
-            start_commit.hash,
-        ]
-
-        bisect_run_command = [
-            "git",
-            "bisect",
-            "run",
-            "../../scoregen.py",
-            start_commit.hash,
-            "HEAD",
-            "--limit",
-            str(threshold),
+            "--reverse",
+            f"{start_hash}..HEAD",
         ]
-        sp.run(
-            bisect_start_command,
-            cwd=repository,
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        sp.run(
-            bisect_run_command,
+        return gitexec.run(
+            rev_list_command,
             cwd=repository,
             capture_output=True,
             text=True,
             check=True,
-        )
-        format_string = "%H%x00%P%x00%an%x00%at%x00%ct%x00%s"
-
-        cmd = ["git", "log", "-n", "1", "HEAD", f"--format={format_string}"]
-
-        output = sp.check_output(cmd, cwd=repository, text=True).strip()
+        ).stdout.split()
 
-        parts = output.split("\x00")
-
-        commit = Commit(
-            hash=parts[0],
-            parent_hashes=parts[1].split(),  # Parent hashes are space-separated
-            author_name=parts[2],
-            author_date_unix=int(parts[3]),
-            committer_date_unix=int(parts[4]),
-            subject=parts[5],
-            repository=repository,
-        )
-        sp.run(
-            ["git", "bisect", "reset"],
-            cwd=repository,
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        return commit
+    def get_next_commit_with_score_threshold(
+        self,
+        repository: str,
+        start_commit: Commit,
+        threshold: float,
+        mode: str = NUMSTAT_MODE,
+    ) -> Commit:
+        """
+        Get the next commit such that the score heuristic exceeds some threshold.
+        Binary searches the first-parent chain after start_commit like
+        `git bisect run scoregen.py --limit`, but scores in-process and without
+        checking out every probed commit. Returns the last commit if the threshold
+        is never exceeded, and start_commit if there are no newer commits.
+        mode: scoregen scoring mode, SIZE_MODE avoids downloading blobs for probes.
+        """
+        with tracing.span(
+            "bisect", start=start_commit.hash, threshold=threshold, mode=mode
+        ) as args:
+            chain = self.get_first_parent_chain(repository, start_commit.hash)
+            if not chain:
+                return start_commit
+
+            # first commit whose score exceeds the threshold, the last one otherwise
+            low, high = 0, len(chain) - 1
+            steps = 0
+            while low < high:
+                mid = (low + high) // 2
+                steps += 1
+                with tracing.span("bisect step", c2=chain[mid]) as step:
+                    step["score"] = calculate_score(
+                        start_commit.hash, chain[mid], repository, mode=mode
+                    )
+                print(
+                    f"Testing {chain[mid][:7]}... Score: {step['score']:.2f} / {threshold}"
+                )
+                if step["score"] > threshold:
+                    high = mid
+                else:
+                    low = mid + 1
+            args["steps"] = steps
+            return self.get_commit(repository, chain[low])
@@ -0,0 +1,265 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import subprocess as sp
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+
+from . import tracing
+from .metrics import metrics
+
+# --- Priority classes, most urgent first ---
+INTERACTIVE = 0  # diffs the agent asks for while a user waits
+MILESTONE = 1  # building the milestone that is summarized next
+BACKGROUND = 2  # boundary search, churn vectors, blob prefetch, clones
+PRIORITY_NAMES = {INTERACTIVE: "interactive", MILESTONE: "milestone", BACKGROUND: "background"}
+
+# git processes allowed at once on the machine and per repository.
+default_max_processes = int(os.getenv("GIT_MAX_PROCESSES", os.cpu_count() or 4))
+default_max_repo_processes = int(os.getenv("GIT_MAX_REPO_PROCESSES", 2))
+
+metrics.describe("git_queue_wait_seconds", "Time git commands waited for a slot, by priority.")
+metrics.describe("git_commands_total", "git commands run through the scheduler, by priority.")
+metrics.describe("git_processes_running", "git processes currently running.")
+metrics.describe("git_processes_waiting", "git commands currently waiting for a slot.")
+metrics.describe("git_processes_killed_total", "Running git processes killed by a cancelled pipeline.")
+
+_priority = contextvars.ContextVar("git_priority", default=MILESTONE)
+_scope = contextvars.ContextVar("git_cancel_scope", default=None)
+
+
+class GitCancelled(Exception):
+    pass
+
+
+class CancelScope:
+    """
+    The git work of one pipeline. Once cancelled, commands waiting for a slot give
+    up, running git processes are killed and new ones never start; all of them
+    raise GitCancelled in the thread that ran them.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._processes: Set[sp.Popen] = set()
+        self._lock = threading.Lock()
+
+    def cancel(self) -> int:
+        """returns: number of git processes killed"""
+        with self._lock:
+            self.cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            process.kill()
+        metrics.inc("git_processes_killed_total", len(processes))
+        scheduler.wake()
+        return len(processes)
+
+    def check(self):
+        if self.cancelled:
+            raise GitCancelled("The analysis was cancelled")
+
+    def run(self, command: List[str], input=None, capture_output=False, check=False, **kwargs):
+        """subprocess.run, with the process killed if the scope is cancelled meanwhile."""
+        if capture_output:
+            kwargs["stdout"] = kwargs["stderr"] = sp.PIPE
+        if input is not None:
+            kwargs["stdin"] = sp.PIPE
+        with sp.Popen(command, **kwargs) as process:
+            with self._lock:
+                if self.cancelled:
+                    process.kill()
+                self._processes.add(process)
+            try:
+                stdout, stderr = process.communicate(input)
+            finally:
+                with self._lock:
+                    self._processes.discard(process)
+        self.check()
+        if check and process.returncode:
+            raise sp.CalledProcessError(process.returncode, command, stdout, stderr)
+        return sp.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+class GitScheduler:
+    """
+    Admits git processes under a machine-wide and a per-repository cap. Waiting
+    commands start in priority order (FIFO within a class); a command whose
+    repository is at its cap does not hold back commands for other repositories.
+    Callers block in their own thread, so call from worker threads (see to_thread).
+    """
+
+    def __init__(
+        self,
+        max_processes: int = default_max_processes,
+        max_repo_processes: int = default_max_repo_processes,
+    ):
+        self.max_processes = max_processes
+        self.max_repo_processes = max_repo_processes
+        self.running = 0
+        self.running_per_repo: Counter = Counter()
+        self.waiting: List[tuple] = []  # (priority, sequence, repo), kept sorted
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _has_room(self, repo: Optional[str]) -> bool:
+        return repo is None or self.running_per_repo[repo] < self.max_repo_processes
+
+    def _is_next(self, entry: tuple) -> bool:
+        if self.running >= self.max_processes:
+            return False
+        for waiting in self.waiting:
+            if self._has_room(waiting[2]):
+                return waiting is entry
+        return False
+
+    def wake(self):
+        """Lets waiting commands re-check their cancel scopes."""
+        with self._cond:
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, repo: Optional[str], priority: int, scope: Optional[CancelScope] = None):
+        """Holds one process slot for repo while the block runs. yields: seconds waited"""
+        repo = os.path.abspath(repo) if repo is not None else None
+        entry = (priority, next(self._sequence), repo)
+        start = time.perf_counter()
+        with self._cond:
+            self.waiting.append(entry)
+            self.waiting.sort()
+            while not self._is_next(entry):
+                if scope is not None and scope.cancelled:
+                    self.waiting.remove(entry)
+                    self._cond.notify_all()
+                    scope.check()
+                self._cond.wait()
+            self.waiting.remove(entry)
+            self.running += 1
+            self.running_per_repo[repo] += 1
+            # the next waiter may fit as well
+            self._cond.notify_all()
+        waited = time.perf_counter() - start
+        name = PRIORITY_NAMES[priority]
+        metrics.observe("git_queue_wait_seconds", waited, priority=name)
+        metrics.inc("git_commands_total", priority=name)
+        try:
+            yield waited
+        finally:
+            with self._cond:
+                self.running -= 1
+                self.running_per_repo[repo] -= 1
+                if not self.running_per_repo[repo]:
+                    del self.running_per_repo[repo]
+                self._cond.notify_all()
+
+
+scheduler = GitScheduler()
+metrics.gauge("git_processes_running", lambda: scheduler.running)
+metrics.gauge("git_processes_waiting", lambda: len(scheduler.waiting))
+
+
+@contextmanager
+def priority(level: int):
+    """git commands run in this block (and in threads started from it) use level."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def cancel_scope(scope: CancelScope):
+    """git commands run in this block (and in threads started from it) belong to scope."""
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def run(command: List[str], **kwargs) -> sp.CompletedProcess:
+    """
+    tracing.run behind a scheduler slot for the command's repository (its cwd),
+    killed if the current cancel scope is cancelled.
+    """
+    level = _priority.get()
+    scope = _scope.get()
+    if scope is not None:
+        scope.check()
+        kwargs["runner"] = scope.run
+    with scheduler.slot(kwargs.get("cwd"), level, scope) as waited:
+        tracer = tracing.get_tracer()
+        if tracer is not None and waited > 0.001:
+            end = tracing.now_us()
+            tracer.add_span(
+                "git queue", "git", end - int(waited * 1e6), end, {"priority": PRIORITY_NAMES[level]}
+            )
+        return tracing.run(command, **kwargs)
+
+
+# One pool per priority class, so background work blocked on slots never keeps
+# interactive work from getting a thread.
+_executors: Dict[int, ThreadPoolExecutor] = {
+    level: ThreadPoolExecutor(max_workers=32, thread_name_prefix=f"git-{name}")
+    for level, name in PRIORITY_NAMES.items()
+}
+
+
+async def to_thread(level: int, func, *args, **kwargs):
+    """
+    Runs func in a worker thread of the priority class, with its git commands
+    scheduled at that priority. Keeps the event loop free while func waits for git.
+    """
+    context = contextvars.copy_context()
+    context.run(_priority.set, level)
+    return await asyncio.get_running_loop().run_in_executor(
+        _executors[level], lambda: context.run(func, *args, **kwargs)
+    )
+
+
+def repository_cache(maxsize: int = 64):
+    """
+    Caches func(repo_path) per repository, for values read from the repository
+    with git. func.forget(repo_path) drops one repository's value (e.g. after
+    fetching it) without making every other repository read its own again.
+    """
+
+    def decorate(func):
+        values: Dict[str, object] = {}
+        lock = threading.Lock()
+
+        def cached(repo_path):
+            if repo_path is None:
+                return func(repo_path)
+            key = os.path.abspath(repo_path)
+            with lock:
+                if key in values:
+                    return values[key]
+            value = func(repo_path)
+            with lock:
+                values[key] = value
+                while len(values) > maxsize:
+                    values.pop(next(iter(values)))
+            return value
+
+        def forget(repo_path):
+            with lock:
+                values.pop(os.path.abspath(repo_path), None)
+
+        def cache_clear():
+            with lock:
+                values.clear()
+
+        cached.forget = forget
+        cached.cache_clear = cache_clear
+        cached.__doc__ = func.__doc__
+        cached.__name__ = func.__name__
+        return cached
+
+    return decorate
@@ -0,0 +1,149 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+from . import gitexec
+
+ZERO_OID = "0" * 40
+GITLINK_MODE = "160000"
+
+# Mirrors the fetch git runs itself when it lazily loads objects from a promisor
+# remote, except that all objects are requested at once.
+fetch_command = [
+    "git",
+    "-c",
+    "fetch.negotiationAlgorithm=noop",
+    "fetch",
+    "--no-tags",
+    "--no-write-fetch-head",
+    "--recurse-submodules=no",
+    "--filter=blob:none",
+    "--stdin",
+    "origin",
+]
+
+
+def is_partial_clone(repo_path: str) -> bool:
+    result = gitexec.run(
+        ["git", "config", "--get", "remote.origin.promisor"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() == "true"
+
+
+@dataclass
+class RawChange:
+    """
+    One path of `git diff --raw --no-renames`. An oid is None on the side where the
+    path does not exist, or is a submodule commit rather than a blob.
+    """
+
+    status: str  # A, D, M or T
+    path: str
+    old_oid: Optional[str]
+    new_oid: Optional[str]
+    is_gitlink: bool = False
+
+
+def _blob_oid(mode: str, oid: str) -> Optional[str]:
+    return None if oid == ZERO_OID or mode == GITLINK_MODE else oid
+
+
+def diff_raw(repo_path: Optional[str], c1: str, c2: str) -> List[RawChange]:
+    """
+    Changed paths between two commits with the blob on either side. Only reads
+    trees, which a blob:none clone always has, so it never fetches anything.
+    raises: subprocess.CalledProcessError
+    """
+    output = gitexec.run(
+        ["git", "diff", "--raw", "--no-abbrev", "--no-renames", c1, c2],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    changes = []
+    for line in output.splitlines():
+        # ":100644 100644 <old oid> <new oid> M\tpath"
+        fields, path = line.split("\t", 1)
+        old_mode, new_mode, old_oid, new_oid, status = fields.lstrip(":").split()
+        changes.append(
+            RawChange(
+                status=status[0],
+                path=path,
+                old_oid=_blob_oid(old_mode, old_oid),
+                new_oid=_blob_oid(new_mode, new_oid),
+                is_gitlink=GITLINK_MODE in (old_mode, new_mode),
+            )
+        )
+    return changes
+
+
+def missing_objects(repo_path: Optional[str], c1: str, c2: str) -> Set[str]:
+    """
+    Objects that differ between the trees of two commits and are not in the local
+    object store, i.e. blobs a partial clone has not downloaded yet. rev-list only
+    walks the two trees and, with --missing=print, never fetches lazily, unlike
+    `cat-file --batch-check` asking for a missing object by name before git 2.44.
+    raises: subprocess.CalledProcessError
+    """
+    missing = set()
+    for new, old in ((c2, c1), (c1, c2)):
+        output = gitexec.run(
+            [
+                "git",
+                "rev-list",
+                "--objects",
+                "--no-object-names",
+                "--missing=print",
+                f"{new}^{{tree}}",
+                "--not",
+                f"{old}^{{tree}}",
+            ],
+            cwd=repo_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        missing.update(line[1:] for line in output.splitlines() if line.startswith("?"))
+    return missing
+
+
+def fetch_blobs(repo_path: Optional[str], oids: List[str]):
+    """
+    Downloads blobs from the promisor remote in one request.
+    raises: subprocess.CalledProcessError
+    """
+    if oids:
+        gitexec.run(
+            fetch_command,
+            cwd=repo_path,
+            input="\n".join(oids) + "\n",
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+
+def blob_sizes(repo_path: Optional[str], oids: List[str]) -> Dict[str, int]:
+    """
+    Sizes of blobs that are in the local object store. Only pass OIDs known to be
+    present (see missing_objects): a missing one would be fetched lazily.
+    raises: subprocess.CalledProcessError
+    """
+    if not oids:
+        return {}
+    output = gitexec.run(
+        ["git", "cat-file", "--batch-check=%(objectname) %(objectsize)"],
+        cwd=repo_path,
+        input="\n".join(oids) + "\n",
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    sizes = {}
+    for line in output.splitlines():
+        oid, size = line.split()
+        sizes[oid] = int(size)
+    return sizes
@@ -0,0 +1,94 @@
+import importlib.util
+import os
+from typing import Optional
+
+import httpx
+
+# Connection pool of the shared client, override with the environment variables.
+default_max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+default_max_keepalive_connections = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 50))
+default_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60.0))
+# Model responses stream for minutes; only connecting is expected to be quick.
+default_timeout = httpx.Timeout(600.0, connect=10.0)
+
+# "aiohttp": an aiohttp connection pool behind the httpx API (HTTP/1.1). Under many
+# concurrent streams it keeps a much lower tail latency than httpx's own pool, see
+# benchmarks/http_pool.py. "httpx": httpx's pool, with HTTP/2 when h2 is installed.
+AIOHTTP_TRANSPORT = "aiohttp"
+HTTPX_TRANSPORT = "httpx"
+default_transport = os.getenv("HTTP_TRANSPORT", AIOHTTP_TRANSPORT)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def http2_available() -> bool:
+    """httpx only speaks HTTP/2 with the optional h2 package installed."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def _aiohttp_transport(max_connections: int, keepalive_expiry: float, verify):
+    import aiohttp
+    from litellm.llms.custom_httpx.aiohttp_transport import LiteLLMAiohttpTransport
+
+    def session() -> aiohttp.ClientSession:
+        # created lazily inside the event loop that uses it
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=max_connections,
+                keepalive_timeout=keepalive_expiry,
+                ssl=None if verify is True else verify,
+            )
+        )
+
+    return LiteLLMAiohttpTransport(client=session, ssl_verify=None if verify is True else verify)
+
+
+def create_http_client(
+    max_connections: int = default_max_connections,
+    max_keepalive_connections: int = default_max_keepalive_connections,
+    keepalive_expiry: float = default_keepalive_expiry,
+    verify=True,
+    transport: str = default_transport,
+) -> httpx.AsyncClient:
+    if transport == AIOHTTP_TRANSPORT and importlib.util.find_spec("aiohttp") is not None:
+        return httpx.AsyncClient(
+            transport=_aiohttp_transport(max_connections, keepalive_expiry, verify),
+            timeout=default_timeout,
+            follow_redirects=True,
+        )
+    return httpx.AsyncClient(
+        http2=http2_available(),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=default_timeout,
+        verify=verify,
+        follow_redirects=True,
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    The process-wide pooled client every model and summarizer backend sends through,
+    so concurrent pipelines reuse warm (TLS) connections instead of opening their own.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+def install_litellm_client(client: Optional[httpx.AsyncClient] = None):
+    """Makes litellm's OpenAI-compatible providers (e.g. cerebras) use the shared client."""
+    import litellm
+
+    litellm.aclient_session = client or get_http_client()
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
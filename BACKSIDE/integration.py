@@ -1,14 +1,64 @@
 import asyncio
-from agents import ItemHelpers
 import json
 import dataclasses
 import re
-from typing import Optional, List, Tuple
+import time
+from typing import TYPE_CHECKING, Optional, List, Tuple
 from .fetcher import DataFetcher
-from .milestones import generate_milestones, generate_milestones_with_heuristic
-from .processor import MilestoneProcessor
+from .scoring import NUMSTAT_MODE
+from .milestones import (
+    RawMilestone,
+    default_work_threshold,
+    ProgressivePlan,
+    generate_balanced_milestones,
+    generate_milestones,
+    generate_milestones_from_boundaries,
+    generate_milestones_for_target,
+    generate_milestones_with_heuristic,
+    plan_progressive,
+)
+from .segmentation import default_merge_bonus
+from .streaming import DeltaCoalescer
+from .batching import MilestoneBatcher
+from .routing import template_summary
+from .timeline_state import (
+    Checkpoint,
+    MilestoneRecord,
+    TimelineState,
+    load_state,
+    save_state,
+)
+from .snapshots import snapshot_store
+from .metrics import metrics
+from . import gitexec, tracing
 import os
-import cohere
+
+# agents, litellm and cohere take seconds to import: they are loaded on first use
+# (or by warm_up in the background), so the server starts answering right away
+if TYPE_CHECKING:
+    from .processor import MilestoneProcessor
+
+TRACE_DIRECTORY = "./traces"
+
+# Commit subjects sent inline with milestone_start; the rest are paged on demand.
+default_message_preview = 5
+
+# Seconds a running analysis waits for its client to reconnect after the last SSE
+# stream closed before it is cancelled, and how often an idle stream checks for a
+# disconnect.
+default_disconnect_grace = float(os.getenv("DISCONNECT_GRACE_SECONDS", 30))
+default_disconnect_poll = 1.0
+
+# Seconds the commit subjects of a finished analysis stay pageable (see
+# get_milestone_messages) before they are dropped from memory.
+default_messages_ttl = float(os.getenv("MILESTONE_MESSAGES_TTL_SECONDS", 600))
+
+metrics.describe("client_disconnects_total", "SSE clients that went away before their analysis ended.")
+metrics.describe("client_reconnects_total", "Clients that reconnected within the grace period.")
+metrics.describe("pipelines_cancelled_total", "Analyses cancelled before they finished, by reason.")
+metrics.describe("pipeline_cancelled_after_seconds", "How long cancelled analyses had been running.")
+metrics.describe("pipeline_cancel_seconds", "Time from cancelling an analysis until it stopped.")
+metrics.describe("milestones_cancelled_total", "Milestones started but not summarized when their analysis was cancelled.")
 
 
 def encode_payload(data: dict) -> str:
@@ -28,33 +78,199 @@ def get_tool_call_message(item) -> str:
         "get_time_stats": "Getting timeline information...",
         "get_message_stats": "Analyzing commit message statistics...",
         "get_messages": "Retrieving commit messages...",
-        "get_longest_n_messages": "Finding longest commit messages...",
+        "get_longest_n_messages": "Finding most informative commit messages...",
         "get_file_change_stats": "Calculating file change statistics...",
         "get_file_changes": "Analyzing file changes...",
         "get_file_changes_by_status": "Filtering file changes by type...",
+        "get_directory_changes": "Looking inside a large directory...",
         "get_top_n_file_changes": "Finding most significant file changes...",
         "get_file_diff": "Examining detailed file differences..."
     }
 
     return tool_messages.get(tool_name, f"Processing {tool_name}...")
 
+def new_processor() -> "MilestoneProcessor":
+    """Per-pipeline processor; imports the agent stack on first use."""
+    from .processor import MilestoneProcessor
+
+    return MilestoneProcessor()
+
+
+def warm_up():
+    """Imports the agent stack and builds the shared agents ahead of the first analysis."""
+    start = time.perf_counter()
+    try:
+        new_processor()
+        import cohere  # noqa: F401
+    except Exception as e:
+        print(f"Warning: Warm-up failed, loading on first analysis instead: {e}")
+        return
+    print(f"Agent stack ready in {time.perf_counter() - start:.2f}s")
+
+
+def make_record(milestone: RawMilestone, summary: dict) -> MilestoneRecord:
+    return MilestoneRecord(
+        start_commit_hash=milestone.start_commit_hash,
+        end_commit_hash=milestone.end_commit_hash,
+        time_start=milestone.time_start,
+        time_end=milestone.time_end,
+        messages=milestone.messages,
+        summary=summary,
+    )
+
+
 class Pipeline:
     def __init__(self):
         self.PIPELINES = {}
         self.PIDToRepo = {}
         self.processors = {}  # Store processor instances per pipeline ID
         self.all_summaries = {}  # Store all summaries by pipeline ID
+        self.tracers = {}  # Tracers for pipelines started with tracing enabled
+        self.milestone_messages = {}  # Commit subjects of every started milestone by pipeline ID
+        self.tasks = {}  # Running pipeline tasks by pipeline ID
+        self.git_scopes = {}  # Cancel scopes of the pipelines' git work
+        self.listeners = {}  # Number of open SSE streams by pipeline ID
+        self.cancel_timers = {}  # Cancellations pending after the last stream closed
+        self.expiry_timers = {}  # Evictions of finished analyses' commit subjects
 
-    def add_process(self, pid):
+    def add_process(self, pid, trace: bool = False):
         self.PIPELINES[pid] = asyncio.Queue()
-        self.processors[pid] = (
-            MilestoneProcessor()
-        )  # Create new processor for each analysis
+        # the processor is created when the pipeline starts, see _run_pipeline
         self.all_summaries[pid] = []  # Initialize summary list for this pipeline
+        self.milestone_messages[pid] = []
+        self.listeners[pid] = 0
+        if trace:
+            self.tracers[pid] = tracing.Tracer(f"analysis {pid}")
+
+    def get_trace_path(self, pid) -> str:
+        return os.path.join(TRACE_DIRECTORY, f"{pid}.json")
+
+    def get_trace(self, pid) -> Optional[dict]:
+        """Trace of a pipeline that is still running, or None if it was not traced."""
+        tracer = self.tracers.get(pid)
+        if tracer is None:
+            return None
+        return tracer.to_json()
 
     def get_process(self, pid):
         return self.PIPELINES.get(pid)
 
+    def get_milestone_messages(
+        self, pid, index: int, offset: int = 0, limit: int = 100
+    ) -> Optional[dict]:
+        """
+        Page of the commit subjects of the index-th milestone, or None if unknown
+        (also default_messages_ttl seconds after the analysis finished).
+        """
+        milestones = self.milestone_messages.get(pid)
+        if milestones is None or not 0 <= index < len(milestones):
+            return None
+        messages = milestones[index]
+        return {
+            "index": index,
+            "total": len(messages),
+            "offset": offset,
+            "messages": messages[offset : offset + limit],
+        }
+
+    async def _start_milestone(
+        self, pid, messages: List[str], cached: bool = False, coarse: bool = False
+    ) -> int:
+        """
+        Sends milestone_start with the number of commits and a short preview.
+        The full list stays on the server, see get_milestone_messages.
+        returns: index of the milestone
+        """
+        index = len(self.milestone_messages[pid])
+        self.milestone_messages[pid].append(messages)
+        payload = {
+            "index": index,
+            "num_messages": len(messages),
+            "preview": messages[:default_message_preview],
+        }
+        if cached:
+            payload["cached"] = True
+        if coarse:
+            payload["coarse"] = True
+        await self.PIPELINES[pid].put(
+            encode_payload({"type": "milestone_start", "payload": payload})
+        )
+        return index
+
+    async def _refine_milestone(
+        self, pid, plan: ProgressivePlan, index: int, messages: List[str]
+    ) -> int:
+        """
+        Progressive mode: starts the index-th fine milestone. The first fine milestone
+        of a coarse one sends milestone_split, which replaces the coarse milestone with
+        placeholders for all of its fine milestones; the ones before it are split
+        already, so fine and displayed indices agree.
+        returns: index of the milestone
+        """
+        segment = plan.segment_of(index)
+        if plan.first_child(segment) == index:
+            into = plan.children(segment)
+            self.milestone_messages[pid][index : index + 1] = [[] for _ in range(into)]
+            await self.PIPELINES[pid].put(
+                encode_payload(
+                    {"type": "milestone_split", "payload": {"index": index, "into": into}}
+                )
+            )
+        self.milestone_messages[pid][index] = messages
+        return index
+
+    async def _coarse_timeline(
+        self, pid, plan: ProgressivePlan, processor: "MilestoneProcessor"
+    ):
+        """
+        Progressive mode: streams the coarse milestones, summarized together in one
+        batched model call (templates if it fails), and an overview made from them.
+        """
+        p = self.PIPELINES[pid]
+        with tracing.span("coarse_timeline", milestones=len(plan.coarse) - 1):
+            coarse = [
+                milestone
+                async for milestone in generate_milestones_from_boundaries(
+                    plan.commits, plan.coarse
+                )
+            ]
+            for milestone in coarse:
+                await self._start_milestone(pid, milestone.messages, coarse=True)
+            try:
+                summaries = await processor.process_batch(coarse)
+            except Exception as e:
+                print(f"Coarse summaries failed, using templates: {e}")
+                summaries = [template_summary(m) for m in coarse]
+            for index, summary in enumerate(summaries):
+                await p.put(
+                    encode_payload(
+                        {
+                            "type": "milestone_analysis",
+                            "payload": {**summary, "coarse": True, "index": index},
+                        }
+                    )
+                )
+
+            self.all_summaries[pid].extend(summaries)
+            final_result = await self.process_summaries_with_service(
+                pid, self.cohere_summary_service
+            )
+            if final_result:
+                await p.put(
+                    encode_payload(
+                        {
+                            "type": "final_summary",
+                            "payload": {
+                                "text": final_result.message.content[0].text,
+                                "coarse": True,
+                            },
+                        }
+                    )
+                )
+        # the fine milestones are summarized from the start of history
+        self.all_summaries[pid].clear()
+        processor.prev_summary = None
+
     def get_all_summaries(self, pid):
         """Get all summaries for a specific pipeline ID"""
         return self.all_summaries.get(pid, [])
@@ -67,7 +283,10 @@ class Pipeline:
 
         # Call the service function with all summaries
         try:
-            result = await service_func(summaries)
+            with tracing.span(
+                "overview", "llm", service=service_func.__name__, summaries=len(summaries)
+            ):
+                result = await service_func(summaries)
             return result
         except Exception as e:
             print(f"Error processing summaries with service: {e}")
@@ -75,9 +294,14 @@ class Pipeline:
 
     async def cohere_summary_service(self, summaries):
         """Example service function - replace with your actual service integration"""
-        co = cohere.ClientV2(api_key=os.getenv("COHERE_API_KEY"))
+        import cohere
+        from .httpclient import get_http_client
+
+        co = cohere.AsyncClientV2(
+            api_key=os.getenv("COHERE_API_KEY"), httpx_client=get_http_client()
+        )
 
-        response = co.chat(
+        response = await co.chat(
             messages=[
                 {
                     "role": "system",
@@ -99,10 +323,160 @@ class Pipeline:
 
         return response
 
-    async def run_pipeline(self, pid: str, repo: str):
+    async def run_pipeline(
+        self,
+        pid: str,
+        repo: str,
+        target_milestones: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        balanced: bool = False,
+        merge_bonus: float = default_merge_bonus,
+        score_mode: str = NUMSTAT_MODE,
+        batch: bool = False,
+        distributed: bool = False,
+        progressive: bool = False,
+    ):
+        """
+        Analyzes repo and streams events to the pipeline queue.
+        target_milestones / time_budget: if given, split history into about that many
+        milestones (or as many as can be summarized in time_budget seconds) instead of
+        using the fixed work threshold.
+        balanced: split into evenly sized milestones (default count if none is given),
+        with merge_bonus favouring milestone edges on merge commits.
+        score_mode: how the fixed-threshold heuristic measures work; "size" estimates
+        it from tree diffs and blob sizes, for huge repositories.
+        batch: summarize runs of small milestones together in one model call.
+        distributed: summarize milestones on the Redis worker group in parallel (see
+        milestone_queue.py) instead of one after another here; ignores batch.
+        progressive: show a coarse timeline with quick summaries first, then split
+        its milestones into balanced ones (milestone_split / milestone_replace events).
+        """
+        tracer = self.tracers.get(pid)
+        trace_token = tracing.activate(tracer)
+        scope = self.git_scopes[pid] = gitexec.CancelScope()
+        started = time.perf_counter()
+        try:
+            with tracing.span("run_pipeline", repo=repo) as args, gitexec.cancel_scope(scope):
+                # own task, so cancel_pipeline can stop it without touching the
+                # request task it was started from
+                task = self.tasks[pid] = asyncio.create_task(
+                    self._run_pipeline(
+                        pid,
+                        repo,
+                        target_milestones,
+                        time_budget,
+                        balanced,
+                        merge_bonus,
+                        score_mode,
+                        batch,
+                        distributed,
+                        progressive,
+                    )
+                )
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling():
+                        task.cancel()
+                        raise
+                    args["cancelled"] = True
+                    metrics.observe(
+                        "pipeline_cancelled_after_seconds", time.perf_counter() - started
+                    )
+                    self._release(pid)
+        finally:
+            tracing.deactivate(trace_token)
+            self.tasks.pop(pid, None)
+            self.git_scopes.pop(pid, None)
+            if pid in self.milestone_messages:
+                self.expiry_timers[pid] = asyncio.get_running_loop().call_later(
+                    default_messages_ttl, self._expire_messages, pid
+                )
+            if tracer is not None:
+                tracer.write(self.get_trace_path(pid))
+                del self.tracers[pid]
+
+    def cancel_pipeline(self, pid: str, reason: str) -> bool:
+        """
+        Stops a running analysis: its in-flight agent attempts, its git processes
+        (running or waiting for a slot) and the pipeline task itself.
+        returns: False if the analysis is not running
+        """
+        task = self.tasks.get(pid)
+        if task is None or task.done():
+            return False
+        print(f"Cancelling analysis {pid}: {reason}")
+        metrics.inc("pipelines_cancelled_total", reason=reason)
+        summarized = len(self.all_summaries.get(pid, []))
+        metrics.inc(
+            "milestones_cancelled_total",
+            max(0, len(self.milestone_messages.get(pid, [])) - summarized),
+        )
+        processor = self.processors.get(pid)
+        if processor is not None:
+            processor.cancel()
+        self.git_scopes[pid].cancel()
+        task.cancel()
+        started = time.perf_counter()
+        task.add_done_callback(
+            lambda _: metrics.observe("pipeline_cancel_seconds", time.perf_counter() - started)
+        )
+        return True
+
+    def _release(self, pid: str):
+        """Forgets a cancelled analysis; its id is unknown from now on."""
+        timer = self.cancel_timers.pop(pid, None)
+        if timer is not None:
+            timer.cancel()
+        for table in (self.PIPELINES, self.PIDToRepo, self.milestone_messages, self.listeners):
+            table.pop(pid, None)
+
+    def _expire_messages(self, pid: str):
+        self.expiry_timers.pop(pid, None)
+        self.milestone_messages.pop(pid, None)
+
+    def _attach(self, pid: str):
+        self.listeners[pid] = self.listeners.get(pid, 0) + 1
+        timer = self.cancel_timers.pop(pid, None)
+        if timer is not None:
+            timer.cancel()
+            metrics.inc("client_reconnects_total")
+
+    def _detach(self, pid: str, finished: bool, grace: float = default_disconnect_grace):
+        """A stream closed; cancels the analysis after grace if nobody is left watching."""
+        if pid not in self.listeners:
+            return
+        self.listeners[pid] -= 1
+        if finished or self.listeners[pid] > 0 or pid not in self.tasks:
+            return
+        metrics.inc("client_disconnects_total")
+        print(f"Client of analysis {pid} went away, cancelling in {grace:g}s unless it reconnects")
+        self.cancel_timers[pid] = asyncio.get_running_loop().call_later(
+            grace, self._disconnect_timeout, pid
+        )
+
+    def _disconnect_timeout(self, pid: str):
+        self.cancel_timers.pop(pid, None)
+        self.cancel_pipeline(pid, "client disconnected")
+
+    async def _run_pipeline(
+        self,
+        pid: str,
+        repo: str,
+        target_milestones: Optional[int],
+        time_budget: Optional[float],
+        balanced: bool,
+        merge_bonus: float,
+        score_mode: str,
+        batch: bool,
+        distributed: bool,
+        progressive: bool,
+    ):
         p = self.PIPELINES[pid]
-        processor = self.processors[pid]  # Get the processor for this pipeline
+        dispatcher = merger = checkpoint = None
         try:
+            # new processor for each analysis; in a thread, the first one imports agents
+            processor = self.processors[pid] = await asyncio.to_thread(new_processor)
             df = DataFetcher()
             # Extract username/repo from URL using regex
             match = re.match(
@@ -111,8 +485,12 @@ class Pipeline:
             if match:
                 repo = match.group(1)
 
-            repopath = self.PIDToRepo[pid] = df.fetch_github_repository(
-                repo, "./workspace", use_https=True
+            repopath = self.PIDToRepo[pid] = await gitexec.to_thread(
+                gitexec.BACKGROUND,
+                df.fetch_or_update_repository,
+                repo,
+                "./workspace",
+                use_https=True,
             )
             # needed for merge picker strategy
             # commits = df.get_merge_commit_log(repopath)
@@ -126,82 +504,274 @@ class Pipeline:
             limit = 3
             a = 0
 
-            async for milestone in generate_milestones_with_heuristic(
-                4000.0, df, repopath
+            head = await gitexec.to_thread(
+                gitexec.MILESTONE, df.get_boundary_commit, repopath, False
+            )
+            use_heuristic = (
+                not balanced
+                and not progressive
+                and target_milestones is None
+                and time_budget is None
+            )
+            threshold = default_work_threshold if use_heuristic else None
+
+            # Timeline of the previous run on this repository, if it is still valid
+            previous = load_state(repo)
+            if previous is not None and not await gitexec.to_thread(
+                gitexec.MILESTONE, df.is_ancestor, repopath, previous.head
             ):
-                # a += 1
-                # if a >= limit:
-                #     break
-                # Send milestone info
+                print("History was rewritten since the last run, starting over")
+                previous = None
+            # Milestones an interrupted run of this analysis finished, unless another
+            # analysis of the repository is running and owns the journal
+            checkpoint = Checkpoint(repo)
+            resumed = checkpoint.load()
+            state = TimelineState(
+                repo=repo, head=head.hash, threshold=threshold, score_mode=score_mode
+            )
+
+            replay = []
+            start_commit = None
+            up_to_date = False
+            if (
+                resumed is not None
+                and resumed.milestones
+                and use_heuristic
+                and resumed.head == head.hash
+                and resumed.threshold == threshold
+                and resumed.score_mode == score_mode
+            ):
+                # continue right after the last checkpointed milestone
+                print(f"Resuming after {len(resumed.milestones)} checkpointed milestones")
+                replay = resumed.milestones
+                up_to_date = replay[-1].end_commit_hash == head.hash
+                start_commit = await gitexec.to_thread(
+                    gitexec.MILESTONE, df.get_commit, repopath, replay[-1].end_commit_hash
+                )
+            elif (
+                previous is not None
+                and previous.milestones
+                and use_heuristic
+                and previous.threshold == threshold
+                and previous.score_mode == score_mode
+            ):
+                if not previous.complete:
+                    # an earlier run stopped at a failed milestone: continue after
+                    # the last one it saved
+                    print(f"Continuing after {len(previous.milestones)} saved milestones")
+                    replay = previous.milestones
+                    up_to_date = replay[-1].end_commit_hash == head.hash
+                    start_commit = await gitexec.to_thread(
+                        gitexec.MILESTONE, df.get_commit, repopath, replay[-1].end_commit_hash
+                    )
+                elif previous.milestones[-1].end_commit_hash == head.hash:
+                    replay = previous.milestones
+                    up_to_date = True
+                else:
+                    # re-segment the tail from the start of the last milestone
+                    replay = previous.stable_milestones()
+                    start_commit = await gitexec.to_thread(
+                        gitexec.MILESTONE,
+                        df.get_commit,
+                        repopath,
+                        previous.milestones[-1].start_commit_hash,
+                    )
+
+            # Stream cached milestones first
+            for record in replay:
+                await self._replay_milestone(pid, record)
+                state.milestones.append(record)
+            # the journal fsyncs every line, which must not stall the event loop
+            await asyncio.to_thread(checkpoint.start, state)
+
+            async def keep(record: MilestoneRecord):
+                state.milestones.append(record)
+                await asyncio.to_thread(checkpoint.append, record)
+
+            def cached_summary(start_hash: str, end_hash: str) -> Optional[dict]:
+                for source in (resumed, previous):
+                    if source is not None:
+                        summary = source.get_summary(start_hash, end_hash)
+                        if summary is not None:
+                            return summary
+                return None
+
+            plan = None
+            refining = False  # fine milestones replace the coarse ones already shown
+            if progressive:
+                plan = await plan_progressive(
+                    df, repopath, target_milestones, time_budget, merge_bonus
+                )
+                edges = [plan.commits[i].hash for i in plan.fine]
+                # not worth a coarse pass if every fine milestone is known already
+                if not all(
+                    cached_summary(start, end) is not None
+                    for start, end in zip(edges, edges[1:])
+                ):
+                    await self._coarse_timeline(pid, plan, processor)
+                    refining = True
+
+            if up_to_date:
+                milestones = generate_milestones([])  # nothing new since last run
+            elif plan is not None:
+                milestones = generate_milestones_from_boundaries(plan.commits, plan.fine)
+            elif balanced:
+                milestones = generate_balanced_milestones(
+                    df, repopath, target_milestones, time_budget, merge_bonus
+                )
+            elif not use_heuristic:
+                milestones = generate_milestones_for_target(
+                    df, repopath, target_milestones, time_budget
+                )
+            else:
+                milestones = generate_milestones_with_heuristic(
+                    threshold, df, repopath, start_commit, score_mode
+                )
+
+            # state is only extended while every milestone succeeds, so a later run
+            # can always continue from its last milestone
+            failed = False
+            fresh = 0
+            analysis_event = "milestone_replace" if refining else "milestone_analysis"
+
+            async def finish(index: int, milestone: RawMilestone, result):
+                nonlocal failed, fresh
+                if isinstance(result, Exception):
+                    failed = True
+                    await p.put(
+                        encode_payload(
+                            {
+                                "type": "milestone_error",
+                                "payload": {"error": str(result), "index": index},
+                            }
+                        )
+                    )
+                    return
+                fresh += 1
+                # Save summary to centralized list
+                self.all_summaries[pid].append(result)
+                if result.get("degraded"):
+                    # shown, but not saved, so the next run summarizes it properly
+                    failed = True
+                if not failed:
+                    await keep(make_record(milestone, result))
+                await p.put(
+                    encode_payload(
+                        {"type": analysis_event, "payload": {**result, "index": index}}
+                    )
+                )
+                print("Processed milestone")
+
+            async def use_cached(index: int, milestone: RawMilestone, cached: dict):
+                processor.prev_summary = cached.get("summary")
+                self.all_summaries[pid].append(cached)
                 await p.put(
                     encode_payload(
                         {
-                            "type": "milestone_start",
-                            "payload": {"messages": milestone.messages},
+                            "type": analysis_event,
+                            "payload": {**cached, "cached": True, "index": index},
                         }
                     )
                 )
+                if not failed:
+                    await keep(make_record(milestone, cached))
+
+            async def flush_batch():
+                for index, milestone, result in await self._summarize_batch(
+                    pid, batcher.take(), processor
+                ):
+                    await finish(index, milestone, result)
+
+            if distributed:
+                from .milestone_queue import MilestoneDispatcher
+
+                dispatcher = MilestoneDispatcher(pid, repo)
+                # summaries arrive in any order, analyses go out in milestone order
+                ordered = asyncio.Queue()
+
+                async def merge():
+                    while (item := await ordered.get()) is not None:
+                        index, milestone, cached = item
+                        if cached is not None:
+                            await use_cached(index, milestone, cached)
+                            continue
+                        try:
+                            result = await dispatcher.result(index)
+                            processor.prev_summary = result.get("summary")
+                        except Exception as e:
+                            result = e
+                        await finish(index, milestone, result)
+
+                merger = asyncio.create_task(merge())
+
+            batcher = MilestoneBatcher() if batch and not distributed else None
+            refined = 0
+            async for milestone in milestones:
+                # a += 1
+                # if a >= limit:
+                #     break
+                # Send milestone info
+                if refining:
+                    index = await self._refine_milestone(pid, plan, refined, milestone.messages)
+                    refined += 1
+                else:
+                    index = await self._start_milestone(pid, milestone.messages)
+
+                cached = cached_summary(milestone.start_commit_hash, milestone.end_commit_hash)
+                if dispatcher is not None:
+                    if cached is None:
+                        await dispatcher.submit(index, milestone, processor.prev_summary)
+                    await ordered.put((index, milestone, cached))
+                    continue
+                if batcher is not None:
+                    if cached is None and batcher.accepts(milestone):
+                        if not batcher.fits(milestone):
+                            await flush_batch()
+                        batcher.add(index, milestone)
+                        continue
+                    # keep the analyses in order
+                    await flush_batch()
+
+                if cached is not None:
+                    await use_cached(index, milestone, cached)
+                    continue
 
                 # Process the milestone with AI
                 try:
-                    # Define callback to stream processing events
-                    async def stream_event(event):
-                        # Stream select processing events to frontend
-                        if event.type == "run_item_stream_event":
-                            if event.item.type == "message_output_item":
-                                # Stream partial agent outputs
-                                await p.put(
-                                    encode_payload(
-                                        {
-                                            "type": "processing_update",
-                                            "payload": {
-                                                "message": ItemHelpers.text_message_output(event.item)
-                                            },
-                                        }
-                                    )
-                                )
-                            
-                            if event.item.type == "tool_call_item":
-                                await p.put(
-                                    encode_payload(
-                                        {
-                                            "type": "processing_update",
-                                            "payload": {
-                                                "message": get_tool_call_message(event.item)
-                                            },
-                                        }
-                                    )
-                                )
-
-                    result = await processor.process_milestone(milestone, stream_event)
-
-                    # Save summary to centralized list
-                    self.all_summaries[pid].append(result)
-
-                    await p.put(
-                        encode_payload(
-                            {"type": "milestone_analysis", "payload": result}
-                        )
+                    result = await self._summarize_milestone(
+                        pid, index, milestone, processor
                     )
                 except Exception as e:
-                    await p.put(
-                        encode_payload(
-                            {"type": "milestone_error", "payload": {"error": str(e)}}
-                        )
-                    )
-                print("Processed milestone")
+                    result = e
+                await finish(index, milestone, result)
+            if batcher is not None:
+                await flush_batch()
+            if merger is not None:
+                await ordered.put(None)
+                await merger
             print("Finished processing milestones")
             print(f"Total summaries collected: {len(self.all_summaries.get(pid, []))}")
 
             # Process all summaries with service after all milestones are complete
             try:
-                final_result = await self.process_summaries_with_service(
-                    pid, self.cohere_summary_service
-                )
-                if final_result:
-                    # Extract text from Cohere response
-                    summary_text = final_result.message.content[0].text
-                    print(f"Generated final summary: {summary_text[:100]}...")
+                if (
+                    fresh == 0
+                    and previous is not None
+                    and previous.complete
+                    and previous.head == head.hash
+                ):
+                    summary_text = previous.overview
+                else:
+                    summary_text = None
+                    final_result = await self.process_summaries_with_service(
+                        pid, self.cohere_summary_service
+                    )
+                    if final_result:
+                        # Extract text from Cohere response
+                        summary_text = final_result.message.content[0].text
+                        print(f"Generated final summary: {summary_text[:100]}...")
+                if summary_text:
+                    state.overview = summary_text
                     await p.put(
                         encode_payload(
                             {"type": "final_summary", "payload": {"text": summary_text}}
@@ -216,6 +786,20 @@ class Pipeline:
                     )
                 )
 
+            if failed:
+                # only the milestones before the first failure were kept: the state
+                # must not claim HEAD, or a later run would replay this partial
+                # timeline as up to date
+                state.complete = False
+                state.overview = None
+                if state.milestones:
+                    state.head = state.milestones[-1].end_commit_hash
+            if state.milestones or not failed:
+                save_state(state)
+            if not failed:
+                await asyncio.to_thread(checkpoint.remove)
+                # complete timeline: serve it from GET /timeline/{owner}/{repo} from now on
+                snapshot_store.save(state, default_message_preview)
             await p.put(encode_payload({"type": "end", "payload": {"status": "done"}}))
         except Exception as e:
             await p.put(encode_payload({"type": "error", "payload": {"msg": str(e)}}))
@@ -225,19 +809,160 @@ class Pipeline:
                 )
             )
         finally:
+            if checkpoint is not None:
+                # kept unless removed above, for the next run to resume from
+                checkpoint.close()
+            if merger is not None:
+                merger.cancel()
+            if dispatcher is not None:
+                try:
+                    await dispatcher.close()
+                except Exception as e:
+                    print(f"Warning: Failed to withdraw distributed milestones: {e}")
             # Clean up processor and summaries after pipeline completes
             if pid in self.processors:
                 del self.processors[pid]
             if pid in self.all_summaries:
                 del self.all_summaries[pid]
 
-    async def get_stream(self, pid: str):
-        while True:
-            event = await self.PIPELINES[pid].get()
-            # Ensure the event is properly encoded as bytes for SSE
-            if isinstance(event, str):
-                yield event.encode('utf-8')
-            else:
-                yield event
-            if decode_payload(event).get("type") == "end":
-                break
+    async def _summarize_milestone(
+        self, pid, index: int, milestone: RawMilestone, processor: "MilestoneProcessor"
+    ) -> dict:
+        """Runs the agent on one milestone, streaming its progress to the client."""
+        p = self.PIPELINES[pid]
+
+        async def send_delta(text: str, reset: bool):
+            await p.put(
+                encode_payload(
+                    {
+                        "type": "processing_delta",
+                        "payload": {"index": index, "text": text, "reset": reset},
+                    }
+                )
+            )
+
+        # token deltas of the agent's answer, batched into frames
+        deltas = DeltaCoalescer(send_delta)
+
+        from agents import ItemHelpers
+
+        # Define callback to stream processing events
+        async def stream_event(event):
+            # Stream select processing events to frontend
+            if event.type == "raw_response_event":
+                data_type = getattr(event.data, "type", None)
+                if data_type == "response.output_text.delta":
+                    await deltas.add(event.data.delta)
+                elif data_type == "response.created":
+                    await deltas.new_turn()
+            if event.type == "run_item_stream_event":
+                if event.item.type == "message_output_item":
+                    # Stream partial agent outputs
+                    await p.put(
+                        encode_payload(
+                            {
+                                "type": "processing_update",
+                                "payload": {
+                                    "message": ItemHelpers.text_message_output(event.item),
+                                    "index": index,
+                                },
+                            }
+                        )
+                    )
+
+                if event.item.type == "tool_call_item":
+                    await p.put(
+                        encode_payload(
+                            {
+                                "type": "processing_update",
+                                "payload": {
+                                    "message": get_tool_call_message(event.item),
+                                    "index": index,
+                                },
+                            }
+                        )
+                    )
+
+        try:
+            return await processor.process_milestone(milestone, stream_event)
+        finally:
+            await deltas.flush()
+
+    async def _summarize_batch(
+        self, pid, batch: List[Tuple[int, RawMilestone]], processor: "MilestoneProcessor"
+    ) -> List[Tuple[int, RawMilestone, object]]:
+        """
+        Summarizes queued milestones with one model call. If the batched call fails,
+        falls back to running the agent on each milestone.
+        returns: (index, milestone, summary or the exception it failed with), in order
+        """
+        if not batch:
+            return []
+        p = self.PIPELINES[pid]
+        await p.put(
+            encode_payload(
+                {
+                    "type": "processing_update",
+                    "payload": {
+                        "message": f"Summarizing {len(batch)} small milestones together..."
+                    },
+                }
+            )
+        )
+        try:
+            summaries = await processor.process_batch([m for _, m in batch])
+            return [(i, m, s) for (i, m), s in zip(batch, summaries)]
+        except Exception as e:
+            print(f"Batched summary failed, summarizing one by one: {e}")
+        results = []
+        for index, milestone in batch:
+            try:
+                summary = await self._summarize_milestone(pid, index, milestone, processor)
+            except Exception as e:
+                summary = e
+            results.append((index, milestone, summary))
+        return results
+
+    async def _replay_milestone(self, pid: str, record: MilestoneRecord):
+        """Streams a milestone from a previous run without any git or LLM work."""
+        p = self.PIPELINES[pid]
+        index = await self._start_milestone(pid, record.messages, cached=True)
+        await p.put(
+            encode_payload(
+                {
+                    "type": "milestone_analysis",
+                    "payload": {**record.summary, "cached": True, "index": index},
+                }
+            )
+        )
+        self.processors[pid].prev_summary = record.summary.get("summary")
+        self.all_summaries[pid].append(record.summary)
+
+    async def get_stream(self, pid: str, is_disconnected=None):
+        """
+        Events of the pipeline as SSE bytes until its end event. A stream that closes
+        before that (or finds is_disconnected() true while idle) counts as the client
+        going away, see _detach.
+        """
+        queue = self.PIPELINES[pid]
+        self._attach(pid)
+        finished = False
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), default_disconnect_poll)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        return
+                    continue
+                # the client may close as soon as it has the end event
+                finished = decode_payload(event).get("type") == "end"
+                # Ensure the event is properly encoded as bytes for SSE
+                if isinstance(event, str):
+                    yield event.encode('utf-8')
+                else:
+                    yield event
+                if finished:
+                    break
+        finally:
+            self._detach(pid, finished)
@@ -0,0 +1,148 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Tokens a page of commit subjects may take up in a tool result.
+default_message_token_budget = 1500
+
+# Longest subject shown; longer ones are cut.
+default_max_subject_length = 200
+
+# Words that say nothing about what a commit did on their own.
+LOW_INFORMATION_WORDS = frozenset(
+    """
+    a an and the to of in on for with from into at by is it this that as
+    fix fixes fixed fixing bug bugs wip update updates updated updating minor
+    typo typos cleanup clean tweak tweaks misc stuff change changes changed
+    small more some test tests testing refactor refactoring commit initial
+    merge merged branch pull request remote tracking main master dev develop
+    version bump release add added adds remove removed
+    """.split()
+)
+
+_HASH = re.compile(r"\b[0-9a-f]{7,40}\b")
+_NUMBER = re.compile(r"\d+")
+_SPACE = re.compile(r"\s+")
+_WORD = re.compile(r"[a-z][a-z0-9_]+")
+_MERGE = re.compile(r"^merge (pull request|branch|remote-tracking branch|tag)\b")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token."""
+    return len(text) // 4 + 1
+
+
+def clean_subject(message: str) -> str:
+    # subjects come from `git log --pretty=format:"%s"`, quotes included
+    subject = message.strip()
+    if len(subject) >= 2 and subject[0] == subject[-1] == '"':
+        subject = subject[1:-1]
+    return subject[:default_max_subject_length]
+
+
+def normalize_subject(subject: str) -> str:
+    """Key under which near-identical subjects are grouped: case, ids and numbers dropped."""
+    key = _HASH.sub("<hash>", subject.lower())
+    key = _NUMBER.sub("#", key)
+    return _SPACE.sub(" ", key).strip(" .!:;,-")
+
+
+def informativeness(subject: str) -> float:
+    """Distinct words beyond the generic ones; merges of other branches count half."""
+    lowered = subject.lower()
+    words = {w for w in _WORD.findall(lowered) if w not in LOW_INFORMATION_WORDS}
+    score = float(len(words))
+    if _MERGE.match(lowered):
+        score /= 2
+    return score
+
+
+@dataclass
+class MessageGroup:
+    """Commit subjects that are the same after normalize_subject."""
+
+    subject: str  # first occurrence
+    count: int
+    first: int  # position of the first occurrence, oldest first
+    score: float
+
+    def render(self) -> str:
+        return self.subject if self.count == 1 else f"{self.subject} (x{self.count})"
+
+
+class MessageIndex:
+    """
+    Commit subjects of a milestone, deduplicated into groups with counts and ranked
+    by informativeness. Built once per milestone (see RawMilestone.get_message_index),
+    so tools page through it instead of sending or re-sorting the full list.
+    """
+
+    def __init__(self, messages: List[str]):
+        self.total = 0
+        self.total_length = 0
+        groups: Dict[str, MessageGroup] = {}
+        for message in messages:
+            subject = clean_subject(message)
+            if not subject:
+                continue
+            self.total += 1
+            self.total_length += len(subject)
+            key = normalize_subject(subject)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = MessageGroup(
+                    subject=subject,
+                    count=1,
+                    first=len(groups),
+                    score=informativeness(subject),
+                )
+            else:
+                group.count += 1
+        self.chronological = list(groups.values())
+        # most informative first; repeated subjects point at a theme of the milestone
+        self.ranked = sorted(
+            self.chronological,
+            key=lambda g: (g.score + math.log2(g.count) / 4, len(g.subject)),
+            reverse=True,
+        )
+
+    @property
+    def distinct(self) -> int:
+        return len(self.chronological)
+
+    def _fit(self, groups: List[MessageGroup], token_budget: int) -> List[str]:
+        """Rendered groups in order until the budget is spent, at least one."""
+        rendered = []
+        tokens = 0
+        for group in groups:
+            line = group.render()
+            tokens += estimate_tokens(line)
+            if rendered and tokens > token_budget:
+                break
+            rendered.append(line)
+        return rendered
+
+    def page(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        token_budget: int = default_message_token_budget,
+    ) -> dict:
+        """Distinct subjects in commit order from offset, as many as fit the budget."""
+        groups = self.chronological[offset:]
+        if limit is not None:
+            groups = groups[:limit]
+        messages = self._fit(groups, token_budget)
+        end = offset + len(messages)
+        return {
+            "total_messages": self.total,
+            "distinct_messages": self.distinct,
+            "offset": offset,
+            "messages": messages,
+            "next_offset": end if end < self.distinct else None,
+        }
+
+    def top(self, n: int, token_budget: int = default_message_token_budget) -> List[str]:
+        """The n most informative distinct subjects, within the budget."""
+        return self._fit(self.ranked[: max(n, 0)], token_budget)
@@ -0,0 +1,107 @@
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Tuple
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> LabelSet:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+class Metrics:
+    """
+    In-process counters and summaries, exported in the Prometheus text format.
+    Counters only go up; summaries keep a running sum and count per label set;
+    gauges are computed from the other metrics when read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelSet, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self.summaries: Dict[str, Dict[LabelSet, list]] = defaultdict(
+            lambda: defaultdict(lambda: [0.0, 0])
+        )
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.help: Dict[str, str] = {}
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def gauge(self, name: str, compute: Callable[[], float]):
+        self.gauges[name] = compute
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            self.counters[name][_labels(labels)] += value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            entry = self.summaries[name][_labels(labels)]
+            entry[0] += value
+            entry[1] += 1
+
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.counters.get(name, {}).get(_labels(labels), 0.0)
+
+    def mean(self, name: str, **labels) -> float:
+        """Mean of a summary, 0.0 if nothing was observed."""
+        with self._lock:
+            total, count = self.summaries.get(name, {}).get(_labels(labels), (0.0, 0))
+        return total / count if count else 0.0
+
+    def snapshot(self) -> dict:
+        gauges = {name: compute() for name, compute in self.gauges.items()}
+        with self._lock:
+            return {
+                "gauges": gauges,
+                "counters": {
+                    name: {_format_labels(k) or "_": v for k, v in series.items()}
+                    for name, series in self.counters.items()
+                },
+                "summaries": {
+                    name: {
+                        _format_labels(k) or "_": {"sum": s, "count": c}
+                        for k, (s, c) in series.items()
+                    }
+                    for name, series in self.summaries.items()
+                },
+            }
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for name, compute in sorted(self.gauges.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {compute():g}")
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            for name, series in sorted(self.summaries.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} summary")
+                for labels, (total, count) in sorted(series.items()):
+                    lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry served by GET /metrics
+metrics = Metrics()
@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from .fetcher import DataFetcher
+from .metrics import metrics
+from .milestones import RawMilestone, get_milestone_data
+from . import gitexec
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+TASK_STREAM = "milestones:tasks"
+WORKER_GROUP = "milestone-workers"
+RESULT_STREAM = lambda pid: f"pipeline:{pid}:milestone-results"
+
+# Seconds a pending entry may go without progress before another worker takes it
+# over, and deliveries after which a milestone is given up on.
+default_claim_idle = float(os.getenv("MILESTONE_CLAIM_IDLE_SECONDS", 120))
+default_max_deliveries = 3
+# Seconds the pipeline waits for one summary, and result streams are kept.
+default_result_timeout = 900.0
+default_result_ttl = 3600
+
+metrics.describe("milestone_tasks_submitted_total", "Milestones pushed to the worker group.")
+metrics.describe("milestone_tasks_reclaimed_total", "Stalled milestones taken over from another worker.")
+metrics.describe("milestone_tasks_failed_total", "Milestones a worker could not summarize, by reason.")
+metrics.describe("milestone_task_seconds", "Time a worker spent on one milestone.")
+
+
+class MilestoneWorkerError(Exception):
+    pass
+
+
+def connect(url: str = REDIS_URL) -> Redis:
+    return Redis.from_url(url, decode_responses=True)
+
+
+async def ensure_group(redis: Redis):
+    try:
+        await redis.xgroup_create(TASK_STREAM, WORKER_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+class MilestoneDispatcher:
+    """
+    Hands the milestones of one analysis to the worker group as descriptors
+    (repository and commit range) and collects their summaries from the analysis'
+    result stream. submit returns right away; result waits for one milestone's
+    summary, so the pipeline can emit them in order.
+    """
+
+    def __init__(self, pid: str, repo: str, redis: Optional[Redis] = None):
+        self.pid = pid
+        self.repo = repo
+        self.redis = redis or connect()
+        self.futures: Dict[int, asyncio.Future] = {}
+        self.entries: Dict[int, str] = {}  # task stream ids by milestone index
+        self._reader: Optional[asyncio.Task] = None
+
+    async def submit(self, index: int, milestone: RawMilestone, prev_summary: Optional[str] = None):
+        if self._reader is None:
+            await ensure_group(self.redis)
+            self._reader = asyncio.create_task(self._read_results())
+        self.futures[index] = asyncio.get_running_loop().create_future()
+        self.entries[index] = await self.redis.xadd(
+            TASK_STREAM,
+            {
+                "pid": self.pid,
+                "index": index,
+                "repo": self.repo,
+                "start": milestone.start_commit_hash,
+                "end": milestone.end_commit_hash,
+                "prev_summary": prev_summary or "",
+            },
+            maxlen=100_000,
+            approximate=True,
+        )
+        metrics.inc("milestone_tasks_submitted_total")
+
+    async def result(self, index: int, timeout: float = default_result_timeout) -> dict:
+        """Summary of a submitted milestone. raises: MilestoneWorkerError, TimeoutError"""
+        return await asyncio.wait_for(asyncio.shield(self.futures[index]), timeout)
+
+    async def _read_results(self):
+        key = RESULT_STREAM(self.pid)
+        last = "0-0"
+        try:
+            while True:
+                response = await self.redis.xread({key: last}, count=100, block=1000)
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        last = entry_id
+                        future = self.futures.get(int(fields["index"]))
+                        # a reclaimed milestone can be answered twice
+                        if future is None or future.done():
+                            continue
+                        if "error" in fields:
+                            future.set_exception(MilestoneWorkerError(fields["error"]))
+                        else:
+                            future.set_result(json.loads(fields["summary"]))
+        except Exception as e:
+            for future in self.futures.values():
+                if not future.done():
+                    future.set_exception(MilestoneWorkerError(f"Lost the result stream: {e}"))
+
+    async def close(self):
+        """Withdraws milestones nobody needs any more (e.g. the analysis was cancelled)."""
+        if self._reader is not None:
+            self._reader.cancel()
+        unfinished = [self.entries[i] for i, f in self.futures.items() if not f.done()]
+        try:
+            if unfinished:
+                await self.redis.xdel(TASK_STREAM, *unfinished)
+            await self.redis.delete(RESULT_STREAM(self.pid))
+        finally:
+            await self.redis.aclose()
+
+
+class MilestoneWorker:
+    """
+    Consumes milestone descriptors from the worker group, summarizes them against
+    a local clone of the repository and posts the summaries back. Entries of a
+    worker that died are taken over by the others once they have been idle for
+    claim_idle seconds; entries still being worked on are kept fresh by
+    re-claiming them. Run one or more per machine:
+
+        python -m BACKSIDE.milestone_queue --concurrency 4
+    """
+
+    def __init__(
+        self,
+        name: str,
+        redis: Optional[Redis] = None,
+        workspace: str = "./workspace",
+        claim_idle: float = default_claim_idle,
+    ):
+        self.name = name
+        self.redis = redis or connect()
+        self.workspace = workspace
+        self.claim_idle = claim_idle
+        self.df = DataFetcher()
+        self._repo_locks = defaultdict(threading.Lock)
+
+    async def run(self, concurrency: int = 1):
+        await ensure_group(self.redis)
+        print(f"Milestone worker {self.name} started with {concurrency} consumers")
+        await asyncio.gather(*(self._consume(f"{self.name}-{i}") for i in range(concurrency)))
+
+    async def _consume(self, consumer: str):
+        from .integration import new_processor
+
+        processor = await asyncio.to_thread(new_processor)
+        while True:
+            entries = await self._claim_stalled(consumer) or await self._read_new(consumer)
+            for entry_id, fields in entries:
+                await self._handle(consumer, processor, entry_id, fields)
+
+    async def _claim_stalled(self, consumer: str) -> List[tuple]:
+        _, entries, *_ = await self.redis.xautoclaim(
+            TASK_STREAM,
+            WORKER_GROUP,
+            consumer,
+            min_idle_time=int(self.claim_idle * 1000),
+            start_id="0-0",
+            count=1,
+        )
+        for entry_id, fields in entries:
+            if fields is None:
+                # withdrawn by its dispatcher while pending
+                await self.redis.xack(TASK_STREAM, WORKER_GROUP, entry_id)
+                continue
+            print(f"Taking over stalled milestone {entry_id}")
+            metrics.inc("milestone_tasks_reclaimed_total")
+        return [(entry_id, fields) for entry_id, fields in entries if fields is not None]
+
+    async def _read_new(self, consumer: str) -> List[tuple]:
+        response = await self.redis.xreadgroup(
+            WORKER_GROUP, consumer, {TASK_STREAM: ">"}, count=1, block=5000
+        )
+        return [entry for _, entries in response or [] for entry in entries]
+
+    async def _deliveries(self, entry_id: str) -> int:
+        pending = await self.redis.xpending_range(
+            TASK_STREAM, WORKER_GROUP, min=entry_id, max=entry_id, count=1
+        )
+        return pending[0]["times_delivered"] if pending else 1
+
+    async def _heartbeat(self, consumer: str, entry_id: str):
+        """Resets the entry's idle time while it is worked on, so nobody takes it over."""
+        while True:
+            await asyncio.sleep(self.claim_idle / 3)
+            await self.redis.xclaim(
+                TASK_STREAM, WORKER_GROUP, consumer, 0, [entry_id], justid=True
+            )
+
+    async def _handle(self, consumer: str, processor, entry_id: str, fields: dict):
+        started = time.perf_counter()
+        result = {"index": fields["index"]}
+        deliveries = await self._deliveries(entry_id)
+        if deliveries > default_max_deliveries:
+            metrics.inc("milestone_tasks_failed_total", reason="deliveries")
+            result["error"] = f"Gave up on the milestone after {deliveries - 1} deliveries"
+        else:
+            heartbeat = asyncio.create_task(self._heartbeat(consumer, entry_id))
+            try:
+                summary = await self._summarize(processor, fields)
+                result["summary"] = json.dumps(summary)
+            except Exception as e:
+                print(f"Failed to summarize milestone {entry_id}: {e}")
+                metrics.inc("milestone_tasks_failed_total", reason=type(e).__name__)
+                result["error"] = str(e)
+            finally:
+                heartbeat.cancel()
+        key = RESULT_STREAM(fields["pid"])
+        await self.redis.xadd(key, result)
+        await self.redis.expire(key, default_result_ttl)
+        await self.redis.xack(TASK_STREAM, WORKER_GROUP, entry_id)
+        metrics.observe("milestone_task_seconds", time.perf_counter() - started)
+
+    async def _summarize(self, processor, fields: dict) -> dict:
+        repo_path = await gitexec.to_thread(
+            gitexec.BACKGROUND, self._repository, fields["repo"], fields["end"]
+        )
+
+        def load() -> RawMilestone:
+            start = self.df.get_commit(repo_path, fields["start"])
+            end = self.df.get_commit(repo_path, fields["end"])
+            return get_milestone_data(start, end)
+
+        milestone = await gitexec.to_thread(gitexec.MILESTONE, load)
+        processor.prev_summary = fields.get("prev_summary") or None
+        return await processor.process_milestone(milestone)
+
+    def _repository(self, repo: str, commit: str) -> str:
+        """Local clone of repo that contains commit, fetching only if it does not."""
+        path = os.path.join(self.workspace, repo.replace("/", "__"))
+        with self._repo_locks[repo]:
+            if os.path.exists(os.path.join(path, ".git")):
+                found = gitexec.run(
+                    ["git", "cat-file", "-e", f"{commit}^{{commit}}"],
+                    cwd=path,
+                    capture_output=True,
+                )
+                if found.returncode == 0:
+                    return path
+            return self.df.fetch_or_update_repository(
+                repo, self.workspace, use_https=True
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Milestone summarization worker")
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--concurrency", type=int, default=1, help="Milestones summarized at once.")
+    parser.add_argument("--workspace", default="./workspace")
+    args = parser.parse_args()
+    asyncio.run(MilestoneWorker(args.name, workspace=args.workspace).run(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,34 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import subprocess as sp
 import re
-import asyncio
-from typing import AsyncGenerator, Generator, List, Optional
+from typing import AsyncGenerator, Dict, Generator, List, Optional, Union
 
 from BACKSIDE.fetcher import DataFetcher
+from .scoring import NUMSTAT_MODE
 from .gitmodels import Commit, FileChange
+from .prefetch import BlobPrefetcher
+from .classifier import PathClassifier, get_repo_classifier
+from .message_index import MessageIndex
+from .rollups import DirectoryRollup, rollup_changes
+from .segmentation import (
+    balanced_boundaries,
+    compute_commit_churn,
+    default_coarse_milestones,
+    default_merge_bonus,
+    default_target_milestones,
+    find_threshold_for_target,
+    merge_mask_for,
+    nest_boundaries,
+    target_from_time_budget,
+)
+from . import gitexec, tracing
 
 
 shortened_rename_regex = re.compile(r"\{.+\s=>\s(.+)\}(.*)$")
 
+# Work score at which the bisect heuristic closes a milestone.
+default_work_threshold = 4000.0
+
 
 class DiffFileNotFound(Exception):
     pass
@@ -31,6 +50,37 @@ class RawMilestone:
     messages: List[str]
     changes: List[FileChange]
     _repo_path: str  # Store repo path for internal use
+    _rollups: Dict[str, list] = field(default_factory=dict, repr=False)  # by status
+    _message_index: Optional[MessageIndex] = field(default=None, repr=False)
+    _classifier: Optional[PathClassifier] = field(default=None, repr=False)
+
+    def get_classifier(self) -> PathClassifier:
+        """
+        The repository's classifier, resolved in the worker thread that built the
+        milestone, so routing and tools never run git on the event loop.
+        """
+        if self._classifier is None:
+            self._classifier = get_repo_classifier(self._repo_path)
+        return self._classifier
+
+    def get_rollup(self, status: str = "") -> List[Union[FileChange, DirectoryRollup]]:
+        """
+        Changes whose status starts with status (all by default), with large
+        vendored/generated subtrees collapsed into directories. Cached per status.
+        """
+        rollup = self._rollups.get(status)
+        if rollup is None:
+            changes = [c for c in self.changes if c.status.startswith(status)]
+            rollup = self._rollups[status] = rollup_changes(
+                changes, classifier=self.get_classifier()
+            )
+        return rollup
+
+    def get_message_index(self) -> MessageIndex:
+        """Deduplicated, ranked commit subjects, built on first use."""
+        if self._message_index is None:
+            self._message_index = MessageIndex(self.messages)
+        return self._message_index
 
     def get_diff_for_file(self, filechange: str) -> Optional[str]:
         """Fetches the detailed, line-by-line diff for a specific file."""
@@ -43,7 +93,7 @@ class RawMilestone:
             "--",
             filechange,
         ]
-        result = sp.run(
+        result = gitexec.run(
             diff_command,
             cwd=self._repo_path,
             capture_output=True,
@@ -60,37 +110,197 @@ class RawMilestone:
 async def generate_milestones(commits: List[Commit]) -> AsyncGenerator[RawMilestone]:
     n = len(commits)
     for i in range(1, n):
-        yield get_milestone_data(commits[i - 1], commits[i])
-        await asyncio.sleep(0)
+        yield await gitexec.to_thread(
+            gitexec.MILESTONE, get_milestone_data, commits[i - 1], commits[i]
+        )
 
 
 async def generate_milestones_with_heuristic(
-    threshold: float, df: DataFetcher, repo_path: str
+    threshold: float,
+    df: DataFetcher,
+    repo_path: str,
+    start_commit: Optional[Commit] = None,
+    score_mode: str = NUMSTAT_MODE,
 ):
-    c_commit = df.get_boundary_commit(repo_path)
-    last_commit = df.get_boundary_commit(repo_path, False)
+    """
+    Yields milestones whose work just exceeds threshold, starting from start_commit
+    (default: the first commit). score_mode selects how scoregen measures work.
+    """
+    c_commit = start_commit or await gitexec.to_thread(
+        gitexec.MILESTONE, df.get_boundary_commit, repo_path
+    )
+    last_commit = await gitexec.to_thread(
+        gitexec.MILESTONE, df.get_boundary_commit, repo_path, False
+    )
     print(threshold)
     while True:
         try:
-            d_commit = df.get_next_commit_with_score_threshold(
-                repo_path, c_commit, threshold
+            # boundary search is background work, building the milestone is not
+            d_commit = await gitexec.to_thread(
+                gitexec.BACKGROUND,
+                df.get_next_commit_with_score_threshold,
+                repo_path,
+                c_commit,
+                threshold,
+                score_mode,
             )
             if c_commit.hash == d_commit.hash:
-                yield get_milestone_data(c_commit, last_commit)
+                if last_commit.hash != c_commit.hash:
+                    yield await gitexec.to_thread(
+                        gitexec.MILESTONE, get_milestone_data, c_commit, last_commit
+                    )
                 break
-            yield get_milestone_data(c_commit, d_commit)
-            await asyncio.sleep(0)
+            yield await gitexec.to_thread(
+                gitexec.MILESTONE, get_milestone_data, c_commit, d_commit
+            )
             c_commit = d_commit
         except sp.CalledProcessError:
             print("Terminating bisect.")
-            sp.run(["git", "bisect", "reset"], cwd=repo_path)
             if last_commit.hash != c_commit.hash:
-                yield get_milestone_data(c_commit, last_commit)
+                yield await gitexec.to_thread(
+                    gitexec.MILESTONE, get_milestone_data, c_commit, last_commit
+                )
             break
 
 
+async def generate_milestones_from_boundaries(
+    commits: List[Commit], boundaries: List[int]
+):
+    """
+    Yields the milestones between consecutive boundary indices into commits.
+    The blobs of the next milestone are prefetched while the current one is consumed.
+    """
+    if len(boundaries) < 2:
+        return
+    ranges = [
+        (commits[boundaries[i - 1]], commits[boundaries[i]])
+        for i in range(1, len(boundaries))
+    ]
+    prefetcher = await BlobPrefetcher.create(commits[0].repository)
+    for i, (start, end) in enumerate(ranges):
+        await prefetcher.wait(start.hash, end.hash)
+        if i + 1 < len(ranges):
+            prefetcher.schedule(ranges[i + 1][0].hash, ranges[i + 1][1].hash)
+        yield await gitexec.to_thread(gitexec.MILESTONE, get_milestone_data, start, end)
+
+
+async def generate_milestones_for_target(
+    df: DataFetcher,
+    repo_path: str,
+    target: Optional[int] = None,
+    time_budget: Optional[float] = None,
+):
+    """
+    Splits history into about `target` milestones (or as many as fit in time_budget
+    seconds) by picking the work threshold up front from the commit churn vectors.
+    """
+    if target is None:
+        target = target_from_time_budget(time_budget)
+    churn = await gitexec.to_thread(gitexec.BACKGROUND, compute_commit_churn, df, repo_path)
+    threshold, boundaries = find_threshold_for_target(churn, target)
+    print(
+        f"Target {target} milestones: threshold {threshold:.2f} gives {len(boundaries) - 1}"
+    )
+    async for milestone in generate_milestones_from_boundaries(
+        churn.commits, boundaries
+    ):
+        yield milestone
+
+
+async def generate_balanced_milestones(
+    df: DataFetcher,
+    repo_path: str,
+    target: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    merge_bonus: float = default_merge_bonus,
+):
+    """
+    Splits history into `target` milestones of near-equal work, preferring to end
+    milestones on merge commits.
+    """
+    if target is None:
+        target = (
+            target_from_time_budget(time_budget)
+            if time_budget is not None
+            else default_target_milestones
+        )
+    churn = await gitexec.to_thread(gitexec.BACKGROUND, compute_commit_churn, df, repo_path)
+    with tracing.span("balanced_boundaries", target=target, merge_bonus=merge_bonus):
+        boundaries = balanced_boundaries(
+            churn.prefix, target, merge_mask_for(churn), merge_bonus
+        )
+    print(f"Balanced segmentation: {len(boundaries) - 1} milestones")
+    async for milestone in generate_milestones_from_boundaries(
+        churn.commits, boundaries
+    ):
+        yield milestone
+
+
+@dataclass
+class ProgressivePlan:
+    """
+    Segmentations of progressive mode: a few coarse milestones shown first, then
+    the fine ones they split into. Every coarse boundary is also a fine boundary.
+    """
+
+    commits: List[Commit]
+    coarse: List[int]
+    fine: List[int]
+
+    def segment_of(self, fine_index: int) -> int:
+        """Coarse milestone that contains the fine_index-th fine milestone."""
+        start = self.fine[fine_index]
+        return max(i for i, boundary in enumerate(self.coarse[:-1]) if boundary <= start)
+
+    def children(self, segment: int) -> int:
+        """Number of fine milestones the segment-th coarse milestone splits into."""
+        return self.fine.index(self.coarse[segment + 1]) - self.fine.index(self.coarse[segment])
+
+    def first_child(self, segment: int) -> int:
+        """Fine index of the first milestone of the segment-th coarse milestone."""
+        return self.fine.index(self.coarse[segment])
+
+
+async def plan_progressive(
+    df: DataFetcher,
+    repo_path: str,
+    target: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    merge_bonus: float = default_merge_bonus,
+    coarse_target: int = default_coarse_milestones,
+) -> ProgressivePlan:
+    """
+    Balanced segmentation into `target` milestones (see generate_balanced_milestones)
+    and into coarse_target milestones nested in it, from one churn computation.
+    """
+    if target is None:
+        target = (
+            target_from_time_budget(time_budget)
+            if time_budget is not None
+            else default_target_milestones
+        )
+    churn = await gitexec.to_thread(gitexec.BACKGROUND, compute_commit_churn, df, repo_path)
+    merge_mask = merge_mask_for(churn)
+    with tracing.span("progressive_boundaries", target=target, coarse=coarse_target):
+        fine = balanced_boundaries(churn.prefix, target, merge_mask, merge_bonus)
+        coarse = balanced_boundaries(
+            churn.prefix, min(coarse_target, target), merge_mask, merge_bonus
+        )
+    coarse = nest_boundaries(fine, coarse)
+    print(f"Progressive segmentation: {len(coarse) - 1} coarse, {len(fine) - 1} fine milestones")
+    return ProgressivePlan(commits=churn.commits, coarse=coarse, fine=fine)
+
+
 def get_milestone_data(c1: Commit, c2: Commit) -> RawMilestone:
     """Runs git diff and parses the output to create a Milestone object."""
+    with tracing.span("get_milestone_data", start=c1.hash, end=c2.hash) as args:
+        milestone = _get_milestone_data(c1, c2)
+        args["num_changes"] = len(milestone.changes)
+        args["num_messages"] = len(milestone.messages)
+        return milestone
+
+
+def _get_milestone_data(c1: Commit, c2: Commit) -> RawMilestone:
     start_hash = c1.hash
     end_hash = c2.hash
     repo_path = c1.repository
@@ -104,7 +314,7 @@ def get_milestone_data(c1: Commit, c2: Commit) -> RawMilestone:
     ]
     # print(" ".join(numstat_command))
 
-    result = sp.run(
+    result = gitexec.run(
         numstat_command, cwd=repo_path, capture_output=True, text=True, check=True
     )
     file_to_stats = {}  # dict to tuple of (insertions, deletions)
@@ -129,7 +339,9 @@ def get_milestone_data(c1: Commit, c2: Commit) -> RawMilestone:
     ]
     # print(" ".join(command))
     # TODO: handle failure
-    result = sp.run(command, cwd=repo_path, capture_output=True, text=True, check=True)
+    result = gitexec.run(
+        command, cwd=repo_path, capture_output=True, text=True, check=True
+    )
 
     lines = result.stdout.strip().split("\n")
     # TODO: handle empty diffs
@@ -165,7 +377,7 @@ def get_milestone_data(c1: Commit, c2: Commit) -> RawMilestone:
         f"{start_hash}..{end_hash}",
     ]
 
-    result = sp.run(
+    result = gitexec.run(
         commit_message_command,
         cwd=repo_path,
         capture_output=True,
@@ -181,4 +393,5 @@ def get_milestone_data(c1: Commit, c2: Commit) -> RawMilestone:
         messages=result.stdout.split("\n")[::-1],
         changes=changes,
         _repo_path=repo_path,
+        _classifier=get_repo_classifier(repo_path),
     )
@@ -0,0 +1,67 @@
+import asyncio
+import subprocess as sp
+import threading
+from typing import Dict, Tuple
+
+from . import gitexec, gitobjects, tracing
+
+
+class BlobPrefetcher:
+    """
+    Fetches the blobs a milestone needs in one batched request to the promisor
+    remote, instead of git fetching them one round trip at a time during diffs.
+    schedule() runs the fetch in a worker thread so it overlaps with whatever the
+    event loop is doing meanwhile, e.g. the agent summarizing the previous milestone.
+    Does nothing for repositories that are not partial clones.
+    """
+
+    def __init__(self, repo_path: str, enabled: bool):
+        self.repo_path = repo_path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    @classmethod
+    async def create(cls, repo_path: str) -> "BlobPrefetcher":
+        """Prefetcher of a repository; checks for a partial clone in a worker thread."""
+        enabled = await gitexec.to_thread(
+            gitexec.BACKGROUND, gitobjects.is_partial_clone, repo_path
+        )
+        return cls(repo_path, enabled)
+
+    def prefetch(self, start_hash: str, end_hash: str) -> int:
+        """Fetches the missing blobs of a range. returns: number of blobs requested"""
+        if not self.enabled:
+            return 0
+        with self._lock, tracing.span(
+            "prefetch blobs", start=start_hash, end=end_hash
+        ) as args:
+            try:
+                # the blobs on both sides of every changed path: the ones `git diff
+                # --numstat` reads (including rename detection) and any later per-file
+                # diff of the range reads
+                missing = sorted(
+                    gitobjects.missing_objects(self.repo_path, start_hash, end_hash)
+                )
+                args["missing"] = len(missing)
+                gitobjects.fetch_blobs(self.repo_path, missing)
+                return len(missing)
+            except sp.CalledProcessError as e:
+                # git falls back to fetching lazily, so this only costs latency
+                print(f"Warning: Blob prefetch failed, continuing lazily: {e.stderr}")
+                return 0
+
+    def schedule(self, start_hash: str, end_hash: str):
+        """Starts prefetching a range in the background (needs a running event loop)."""
+        key = (start_hash, end_hash)
+        if self.enabled and key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(
+                gitexec.to_thread(gitexec.BACKGROUND, self.prefetch, start_hash, end_hash)
+            )
+
+    async def wait(self, start_hash: str, end_hash: str):
+        """Waits for a scheduled prefetch of the range, scheduling it if needed."""
+        self.schedule(start_hash, end_hash)
+        task = self._tasks.pop((start_hash, end_hash), None)
+        if task is not None:
+            await task
@@ -5,19 +5,82 @@ from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from json import dumps, loads
 import asyncio
+import contextvars
 import os
 from pydantic import BaseModel
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
 from statistics import median
-from typing import Iterable, List
+from typing import Iterable, List, Optional
 
 load_dotenv()
 
 from .milestones import RawMilestone
 from .gitmodels import FileChange
+from .classifier import LOW_SIGNAL_CATEGORIES
+from . import rollups
+from . import gitexec, tracing
+from .httpclient import install_litellm_client
+from .metrics import metrics
+from .batching import batch_input
+from .routing import (
+    BATCH_ROUTE,
+    SMALL_ROUTE,
+    TEMPLATE_ROUTE,
+    default_small_model,
+    route_milestone,
+    template_summary,
+)
 
 # import litellm
 # litellm._turn_on_debug()
 
+# Model of the full agent and an OpenAI-compatible endpoint to reach the models
+# through instead of the provider (e.g. benchmarks/stub_model_server.py).
+default_model = os.getenv("MODEL", "cerebras/qwen-3-235b-a22b-instruct-2507")
+default_model_base_url = os.getenv("MODEL_BASE_URL")
+
+# Seconds one agent turn (model response plus the tools it calls) may take, and
+# seconds a whole milestone may take across turns and attempts.
+default_turn_timeout = 60.0
+default_milestone_timeout = 180.0
+
+# A second attempt is started if the first has not produced a token after the p95
+# first-token latency; default_hedge_delay is used until enough samples exist.
+default_hedge_delay = 10.0
+hedge_percentile = 95
+hedge_min_samples = 20
+
+# Let the model ask for several tools per turn (e.g. a handful of diffs); the SDK
+# runs them concurrently. At most default_tool_git_concurrency of one turn's tool
+# calls run git at once, so a long list of diffs does not take every git slot.
+default_parallel_tool_calls = os.getenv("PARALLEL_TOOL_CALLS", "1") != "0"
+default_tool_git_concurrency = int(os.getenv("TOOL_GIT_CONCURRENCY", 4))
+
+# git slots of the agent run the current tool call belongs to, see _run_attempt
+_tool_git_slots = contextvars.ContextVar("tool_git_slots", default=None)
+
+metrics.describe("agent_first_token_seconds", "Time until an agent attempt produced its first token.")
+metrics.describe("agent_hedges_total", "Second attempts started because the first was slow.")
+metrics.describe("agent_hedge_wins_total", "Milestones where the second attempt finished first.")
+metrics.describe("agent_timeouts_total", "Agent attempts cut off by a deadline, by kind.")
+metrics.describe("milestones_degraded_total", "Milestones that fell back to a template summary.")
+metrics.describe("agent_runs_cancelled_total", "In-flight agent attempts cancelled with their pipeline.")
+metrics.describe("agent_tool_calls_per_turn", "Tool calls the model made in one agent turn.")
+
+
+async def tool_git(func, *args):
+    """
+    Runs the git work of a tool call in a worker thread at interactive priority
+    (a user is waiting on it), limited to default_tool_git_concurrency per run.
+    """
+    slots = _tool_git_slots.get()
+    if slots is None:
+        return await gitexec.to_thread(gitexec.INTERACTIVE, func, *args)
+    async with slots:
+        return await gitexec.to_thread(gitexec.INTERACTIVE, func, *args)
+
 
 @function_tool
 def get_time_stats(wrapper: RunContextWrapper[RawMilestone]):
@@ -34,25 +97,26 @@ def get_time_stats(wrapper: RunContextWrapper[RawMilestone]):
 
 @function_tool
 def get_message_stats(wrapper: RunContextWrapper[RawMilestone]):
-    """Returns statistics about commit messages including count, total length, and median length."""
+    """Returns statistics about commit messages including count, number of distinct subjects, total length, and median length."""
+    index = wrapper.context.get_message_index()
     message_lengths = [len(message) for message in wrapper.context.messages]
-    total_length = sum(message_lengths) if message_lengths else 0
     median_length = median(message_lengths) if message_lengths else 0
     return {
-        "num_messages": len(wrapper.context.messages),
-        "total_message_length": total_length,
+        "num_messages": index.total,
+        "num_distinct_messages": index.distinct,
+        "total_message_length": index.total_length,
         "median_message_length": median_length
     }
 
 @function_tool
-def get_messages(wrapper: RunContextWrapper[RawMilestone]):
-    """Returns a list of all commit messages in the milestone."""
-    return wrapper.context.messages
+def get_messages(wrapper: RunContextWrapper[RawMilestone], offset: int = 0):
+    """Returns the milestone's distinct commit messages in commit order, repeated ones once with their count (e.g. "fix typo (x12)"). Large milestones are paged: call again with next_offset for more."""
+    return wrapper.context.get_message_index().page(offset)
 
 @function_tool
 def get_longest_n_messages(wrapper: RunContextWrapper[RawMilestone], n: int):
-    """Returns the n longest commit messages sorted by length in descending order."""
-    return sorted(wrapper.context.messages, key=len, reverse=True)[:n]
+    """Returns the n most informative distinct commit messages, most informative first; generic ones like "fix" or "wip" and merges rank last."""
+    return wrapper.context.get_message_index().top(n)
 
 @function_tool
 def get_file_change_stats(wrapper: RunContextWrapper[RawMilestone]):
@@ -75,24 +139,35 @@ def get_file_change_stats(wrapper: RunContextWrapper[RawMilestone]):
 
 @function_tool
 def get_file_changes(wrapper: RunContextWrapper[RawMilestone]):
-    """Returns all file changes in the milestone with their status, paths, and line statistics."""
-    return wrapper.context.changes
+    """Returns all file changes in the milestone with their status, paths, and line statistics. Large vendored/generated directories are collapsed into DirectoryRollup entries; use get_directory_changes to drill down."""
+    return wrapper.context.get_rollup()
 
 @function_tool
 def get_file_changes_by_status(wrapper: RunContextWrapper[RawMilestone], status: str):
-    """Returns file changes filtered by status type (A: add, M: modify, D: delete, R: rename)."""
-    return [change for change in wrapper.context.changes if change.status.startswith(status)]
+    """Returns file changes filtered by status type (A: add, M: modify, D: delete, R: rename). Large vendored/generated directories are collapsed into DirectoryRollup entries."""
+    return wrapper.context.get_rollup(status)
+
+@function_tool
+def get_directory_changes(wrapper: RunContextWrapper[RawMilestone], directory: str, offset: int = 0, limit: int = 50):
+    """Returns a page of the individual file changes below a directory (e.g. a DirectoryRollup path), largest first."""
+    return rollups.get_directory_changes(wrapper.context.changes, directory, offset, limit)
 
 @function_tool
 def get_top_n_file_changes(wrapper: RunContextWrapper[RawMilestone], n: int):
-    """Returns the n top file changes sorted by weighted changes (insertions*2 + deletions) in descending order."""
-    return sorted(wrapper.context.changes, key=lambda x: x.insertions*2 + x.deletions, reverse=True)[:n]
+    """Returns the n top file changes sorted by weighted changes (insertions*2 + deletions) in descending order. Lockfiles, binary/data files and vendored or generated code are left out."""
+    classifier = wrapper.context.get_classifier()
+    changes = [c for c in wrapper.context.changes if not classifier.is_low_signal(c.path)]
+    return sorted(changes, key=lambda x: x.insertions*2 + x.deletions, reverse=True)[:n]
 
 @function_tool
-def get_file_diff(wrapper: RunContextWrapper[RawMilestone], file_path: str):
-    """Returns the detailed line-by-line diff for a specific file (expensive operation)."""
+async def get_file_diff(wrapper: RunContextWrapper[RawMilestone], file_path: str):
+    """Returns the detailed line-by-line diff for a specific file (expensive operation). Not available for lockfiles, binary/data files and vendored or generated code."""
+    classification = wrapper.context.get_classifier().classify(file_path)
+    if classification.category in LOW_SIGNAL_CATEGORIES:
+        return f"Diff not fetched: {file_path} is a {classification.category} file, its diff carries no useful signal. Describe it from its file change stats instead."
     try:
-        return wrapper.context.get_diff_for_file(file_path)
+        # diffs the model asks for in the same turn are fetched concurrently
+        return await tool_git(wrapper.context.get_diff_for_file, file_path)
     except Exception as exc:
         return f"ERROR getting diff: {exc}"
 
@@ -101,41 +176,162 @@ class MilestoneSummary(BaseModel):
     summary: str
     most_important_changes: List[str]
 
+class MilestoneBatch(BaseModel):
+    summaries: List[MilestoneSummary]
+
+
+class MilestoneBatchSizeMismatch(Exception):
+    pass
+
+
+class MilestoneTimeout(Exception):
+    pass
+
+
+class LatencyTracker:
+    """Sliding window of latencies for percentile estimates."""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float, default: float) -> float:
+        if len(self.samples) < hedge_min_samples:
+            return default
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+# Shared by all processors, so the hedge delay follows the provider's latency.
+first_token_latency = LatencyTracker()
+
+
+def is_token_event(event) -> bool:
+    """Any model output (text or tool call arguments) counts as the first token."""
+    return event.type == "raw_response_event" and getattr(
+        event.data, "type", ""
+    ).endswith(".delta")
+
+
+def _read_prompt(name: str) -> str:
+    with open(os.path.join(os.path.dirname(__file__), name), "r") as f:
+        return f.read()
+
+
+@dataclass
+class MilestoneAgents:
+    overview: Agent
+    small: Agent
+    batch: Agent
+
+
+@lru_cache(maxsize=8)
+def get_agents(model: str, small_model: str, base_url: Optional[str]) -> MilestoneAgents:
+    """
+    Agents and models shared by every pipeline of the process. They hold no run
+    state (that lives on MilestoneProcessor), so concurrent runs can share them.
+    """
+    # set_default_openai_key(os.environ["OPENAI_API_KEY"])
+    # cohere_api_key = os.environ["COHERE_API_KEY"]
+    # cerebras_api_key = os.environ["CEREBRAS_API_KEY"]
+    # all models send through the process-wide connection pool
+    install_litellm_client()
+    overview = Agent[RawMilestone](
+        name="Milestone Summary Agent",
+        instructions=_read_prompt("prompt.txt"),
+        tools=[
+            get_time_stats,
+            get_message_stats,
+            get_messages,
+            get_longest_n_messages,
+            get_file_diff,
+            get_file_change_stats,
+            get_file_changes,
+            get_directory_changes,
+            get_top_n_file_changes,
+            get_file_changes_by_status
+        ],
+        model_settings=ModelSettings(parallel_tool_calls=default_parallel_tool_calls),
+        # output_type=MilestoneSummary,
+        # model=LitellmModel(model="anthropic/claude-3-7-sonnet-20250219", api_key=os.environ["ANTHROPIC_API_KEY"])
+        model=LitellmModel(
+            model=model,
+            base_url=base_url,
+            api_key=os.environ["CEREBRAS_API_KEY"]
+        )
+    )
+    # same agent on a cheaper model, for milestones with little to explain
+    small = LitellmModel(
+        model=small_model,
+        base_url=base_url,
+        api_key=os.environ["CEREBRAS_API_KEY"]
+    )
+    # summarizes several small milestones from their digests in one call, no tools
+    batch = Agent(
+        name="Milestone Batch Agent",
+        instructions=_read_prompt("batch_prompt.txt"),
+        model=small,
+    )
+    return MilestoneAgents(overview, overview.clone(model=small), batch)
+
+
 class MilestoneProcessor():
-    def __init__(self):
-        # set_default_openai_key(os.environ["OPENAI_API_KEY"])
-        # cohere_api_key = os.environ["COHERE_API_KEY"]
-        # cerebras_api_key = os.environ["CEREBRAS_API_KEY"]
+    """
+    Per-pipeline handle on the shared agents. Cheap to create: it only carries the
+    pipeline's state, the summary of the previous milestone, and its deadlines.
+    """
 
+    def __init__(
+        self,
+        small_model: Optional[str] = None,
+        model: Optional[str] = None,
+        base_url: Optional[str] = None,
+        turn_timeout: float = default_turn_timeout,
+        milestone_timeout: float = default_milestone_timeout,
+        hedge: bool = True,
+    ):
         self.prev_summary = None
         # self.prev_prev_summary = None
-        self.current_task = None  # Store current asyncio task for cancellation
-
-        with open(os.path.join(os.path.dirname(__file__), "prompt.txt"), "r") as f:
-            prompt = f.read()
-        self.overview_agent = Agent[RawMilestone](
-            name="Milestone Summary Agent",
-            instructions=prompt,
-            tools=[
-                get_time_stats,
-                get_message_stats,
-                get_messages,
-                get_longest_n_messages,
-                get_file_diff,
-                get_file_change_stats,
-                get_file_changes,
-                get_top_n_file_changes,
-                get_file_changes_by_status
-            ],
-            # output_type=MilestoneSummary,
-            # model=LitellmModel(model="anthropic/claude-3-7-sonnet-20250219", api_key=os.environ["ANTHROPIC_API_KEY"])
-            model=LitellmModel(
-                model="cerebras/qwen-3-235b-a22b-instruct-2507",
-                api_key=os.environ["CEREBRAS_API_KEY"]
-            )
+        self.attempts = set()  # in-flight agent attempts, see cancel
+        self.turn_timeout = turn_timeout
+        self.milestone_timeout = milestone_timeout
+        self.hedge = hedge
+
+        agents = get_agents(
+            model or default_model,
+            small_model or default_small_model,
+            base_url or default_model_base_url,
         )
+        self.overview_agent = agents.overview
+        self.small_agent = agents.small
+        self.batch_agent = agents.batch
 
     async def process_milestone(self, milestone: RawMilestone, event_callback=None):
+        """
+        Summarizes a milestone. Trivial milestones get a template summary without a
+        model call, small ones the agent on the cheaper model (see routing.py).
+        """
+        decision = route_milestone(milestone)
+        print(f"Routing milestone (complexity {decision.complexity:.1f}) to {decision.route}")
+        metrics.inc("milestones_routed_total", route=decision.route)
+        started = asyncio.get_running_loop().time()
+
+        if decision.route == TEMPLATE_ROUTE:
+            metrics.inc("llm_calls_avoided_total")
+            with tracing.span("template_summary", "agent", complexity=decision.complexity):
+                result_dict = template_summary(milestone)
+            metrics.observe(
+                "milestone_seconds",
+                asyncio.get_running_loop().time() - started,
+                route=decision.route,
+            )
+            metrics.observe("milestone_tokens", 0, route=decision.route)
+            self.prev_summary = result_dict["summary"]
+            return result_dict
+
+        agent = self.small_agent if decision.route == SMALL_ROUTE else self.overview_agent
 
         prompt = "analyze the current milestone" # you're hallucinating a tool call
         if self.prev_summary is not None:
@@ -143,22 +339,33 @@ class MilestoneProcessor():
         # if self.prev_prev_summary is not None:
         #     prompt += f", this is the previous previous summary: {self.prev_prev_summary}"
 
-        result = Runner.run_streamed(
-            self.overview_agent,
-            prompt,
-            context=milestone,
-            max_turns=30
-        )
-
-        async for event in result.stream_events():
-            self.print_event(event)
-            # Pass events to callback if provided
-            if event_callback:
-                await event_callback(event)
+        with tracing.span(
+            "process_milestone",
+            "agent",
+            start=milestone.start_commit_hash,
+            end=milestone.end_commit_hash,
+            route=decision.route,
+            complexity=decision.complexity,
+        ) as args:
+            try:
+                result_dict, tokens = await self._run_hedged(
+                    agent, prompt, milestone, event_callback
+                )
+            except Exception as e:
+                # never stall the timeline on one milestone: describe it from metadata
+                print(f"Agent failed on milestone ({type(e).__name__}: {e}), using a degraded summary")
+                metrics.inc("milestones_degraded_total", reason=type(e).__name__)
+                args["degraded"] = type(e).__name__
+                result_dict, tokens = {**template_summary(milestone), "degraded": True}, 0
 
         # print("Here's final result: ", result)
+        metrics.observe(
+            "milestone_seconds",
+            asyncio.get_running_loop().time() - started,
+            route=decision.route,
+        )
+        metrics.observe("milestone_tokens", tokens, route=decision.route)
 
-        result_dict = loads(result.final_output)
         # if self.prev_summary is not None:
         #     self.prev_prev_summary = self.prev_summary
         self.prev_summary = result_dict["summary"]
@@ -166,6 +373,185 @@ class MilestoneProcessor():
         print(result_dict)
         return result_dict
 
+    async def _run_hedged(
+        self, agent, prompt: str, milestone: Optional[RawMilestone], event_callback
+    ):
+        """
+        Runs the agent under the milestone deadline. If no token arrived after the
+        p95 first-token latency, a second attempt is started and whichever finishes
+        first wins. Only the attempt that produced the first token streams to the
+        callback (the first attempt until then).
+        returns: (summary, tokens used by the winner)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.milestone_timeout
+        token_seen = asyncio.Event()
+        leader = None
+
+        async def forward(attempt: int, event):
+            nonlocal leader
+            if leader is None and is_token_event(event):
+                leader = attempt
+                token_seen.set()
+            if event_callback and attempt == (leader if leader is not None else 0):
+                await event_callback(event)
+
+        attempts = [asyncio.create_task(self._run_attempt(agent, prompt, milestone, forward, 0, deadline))]
+        self.attempts.update(attempts)
+        try:
+            if self.hedge:
+                hedge_delay = first_token_latency.percentile(hedge_percentile, default_hedge_delay)
+                waiter = asyncio.create_task(token_seen.wait())
+                done, _ = await asyncio.wait(
+                    {attempts[0], waiter}, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                waiter.cancel()
+                if not done:
+                    print(f"No token after {hedge_delay:.1f}s, hedging with a second attempt")
+                    metrics.inc("agent_hedges_total")
+                    attempts.append(
+                        asyncio.create_task(
+                            self._run_attempt(agent, prompt, milestone, forward, 1, deadline)
+                        )
+                    )
+                    self.attempts.add(attempts[-1])
+
+            pending = set(attempts)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not attempts[0]:
+                            metrics.inc("agent_hedge_wins_total")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+            self.attempts.difference_update(attempts)
+
+    def cancel(self) -> int:
+        """
+        Stops the agent attempts in flight, closing their model streams.
+        returns: number of attempts cancelled
+        """
+        running = [task for task in self.attempts if not task.done()]
+        for task in running:
+            task.cancel()
+        metrics.inc("agent_runs_cancelled_total", len(running))
+        return len(running)
+
+    async def _run_attempt(
+        self,
+        agent,
+        prompt: str,
+        milestone: Optional[RawMilestone],
+        forward,
+        attempt: int,
+        deadline: float,
+    ):
+        """One streamed agent run, cut off by the turn and milestone deadlines."""
+        loop = asyncio.get_running_loop()
+        recorder = tracing.AgentTraceRecorder(tracing.get_tracer())
+        tokens = 0
+        started = turn_started = loop.time()
+        first_token = False
+        tool_calls = 0
+        # the run's tool calls are tasks started from here and inherit the slots
+        _tool_git_slots.set(asyncio.Semaphore(default_tool_git_concurrency))
+        result = Runner.run_streamed(
+            agent,
+            prompt,
+            context=milestone,
+            max_turns=30
+        )
+        events = result.stream_events()
+        try:
+            while True:
+                turn_deadline = turn_started + self.turn_timeout
+                kind = "turn" if turn_deadline < deadline else "milestone"
+                try:
+                    event = await asyncio.wait_for(
+                        anext(events), min(turn_deadline, deadline) - loop.time()
+                    )
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    metrics.inc("agent_timeouts_total", kind=kind)
+                    raise MilestoneTimeout(f"attempt {attempt} exceeded the {kind} deadline")
+
+                if event.type == "raw_response_event":
+                    data_type = getattr(event.data, "type", None)
+                    if data_type == "response.created":
+                        turn_started = loop.time()
+                        # the tool calls of the previous turn have all been made
+                        if tool_calls:
+                            metrics.observe("agent_tool_calls_per_turn", tool_calls)
+                        tool_calls = 0
+                    elif data_type == "response.completed":
+                        usage = getattr(event.data.response, "usage", None)
+                        if usage is not None:
+                            tokens += usage.input_tokens + usage.output_tokens
+                elif event.type == "run_item_stream_event" and event.item.type == "tool_call_item":
+                    tool_calls += 1
+                if not first_token and is_token_event(event):
+                    first_token = True
+                    first_token_latency.add(loop.time() - started)
+                    metrics.observe("agent_first_token_seconds", loop.time() - started)
+                self.print_event(event)
+                recorder.record(event)
+                await forward(attempt, event)
+        finally:
+            result.cancel()
+            await events.aclose()
+
+        return loads(result.final_output), tokens
+
+    async def process_batch(self, milestones: List[RawMilestone]) -> List[dict]:
+        """
+        Summarizes consecutive milestones with a single model call, returning one
+        summary per milestone in order. Trivial milestones still get templates.
+        raises: MilestoneTimeout, MilestoneBatchSizeMismatch
+        """
+        decisions = [route_milestone(m) for m in milestones]
+        to_model = [
+            m for m, d in zip(milestones, decisions) if d.route != TEMPLATE_ROUTE
+        ]
+        started = asyncio.get_running_loop().time()
+        summaries = []
+        if to_model:
+            with tracing.span("process_batch", "agent", milestones=len(to_model)) as args:
+                # same deadlines, hedging and cancellation as a single milestone;
+                # callers fall back to one agent run per milestone if it fails
+                output, args["tokens"] = await self._run_hedged(
+                    self.batch_agent, batch_input(to_model, self.prev_summary), None, None
+                )
+            batch = MilestoneBatch.model_validate(output)
+            if len(batch.summaries) != len(to_model):
+                raise MilestoneBatchSizeMismatch(
+                    f"Expected {len(to_model)} summaries, got {len(batch.summaries)}"
+                )
+            summaries = [s.model_dump() for s in batch.summaries]
+            elapsed = asyncio.get_running_loop().time() - started
+            for _ in to_model:
+                metrics.inc("milestones_routed_total", route=BATCH_ROUTE)
+                metrics.observe("milestone_seconds", elapsed / len(to_model), route=BATCH_ROUTE)
+                metrics.observe("milestone_tokens", args["tokens"] / len(to_model), route=BATCH_ROUTE)
+
+        results = []
+        for milestone, decision in zip(milestones, decisions):
+            if decision.route == TEMPLATE_ROUTE:
+                metrics.inc("milestones_routed_total", route=TEMPLATE_ROUTE)
+                metrics.inc("llm_calls_avoided_total")
+                metrics.observe("milestone_seconds", 0.0, route=TEMPLATE_ROUTE)
+                metrics.observe("milestone_tokens", 0, route=TEMPLATE_ROUTE)
+                results.append(template_summary(milestone))
+            else:
+                results.append(summaries.pop(0))
+        self.prev_summary = results[-1]["summary"]
+        return results
 
     def print_event(self, event):
         # Ignore raw responses event
@@ -0,0 +1,116 @@
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Union
+
+from .classifier import PathClassifier, default_classifier
+from .gitmodels import FileChange
+
+# A low-signal directory is collapsed once it holds at least this many changed files.
+default_rollup_min_files = 20
+
+# Upper bound on entries in a compacted view. Bigger views are collapsed further,
+# one directory depth at a time, until they fit.
+default_rollup_max_entries = 300
+
+@dataclass
+class DirectoryRollup:
+    """Aggregate of all changed files below a directory."""
+
+    path: str
+    file_count: int
+    insertions: int
+    deletions: int
+    dominant_status: str
+    status_counts: Dict[str, int] = field(default_factory=dict)
+
+
+def _directories(path: str) -> List[str]:
+    """'a/b/c.py' -> ['a/', 'a/b/']"""
+    parts = path.split("/")[:-1]
+    return ["/".join(parts[: i + 1]) + "/" for i in range(len(parts))]
+
+
+def _rollup(directory: str, changes: List[FileChange]) -> DirectoryRollup:
+    statuses = Counter(c.status[0] for c in changes)
+    return DirectoryRollup(
+        path=directory,
+        file_count=len(changes),
+        insertions=sum(max(c.insertions, 0) for c in changes),
+        deletions=sum(max(c.deletions, 0) for c in changes),
+        dominant_status=statuses.most_common(1)[0][0],
+        status_counts=dict(statuses),
+    )
+
+
+def _group(
+    changes: List[FileChange], owner_of
+) -> List[Union[FileChange, DirectoryRollup]]:
+    """Collapses files sharing an owner directory (owner_of returns None to keep a file)."""
+    groups = defaultdict(list)
+    for change in changes:
+        groups[owner_of(change)].append(change)
+    entries = list(groups.pop(None, []))
+    for directory, members in groups.items():
+        if len(members) == 1:
+            entries.extend(members)
+        else:
+            entries.append(_rollup(directory, members))
+    return entries
+
+
+def rollup_changes(
+    changes: List[FileChange],
+    min_files: int = default_rollup_min_files,
+    max_entries: int = default_rollup_max_entries,
+    classifier: PathClassifier = default_classifier,
+) -> List[Union[FileChange, DirectoryRollup]]:
+    """
+    Compacted view of a milestone's file changes.
+    1. Low-signal directories (vendored or generated according to classifier) with
+       at least min_files changed files become a single DirectoryRollup.
+    2. If more than max_entries remain, the remaining files are grouped by their
+       ancestor directory at the deepest depth that fits into max_entries.
+    """
+    directory_counts = Counter(d for c in changes for d in _directories(c.path))
+
+    def low_signal_owner(change: FileChange):
+        for directory in _directories(change.path):
+            if classifier.is_low_signal_directory(directory):
+                return directory if directory_counts[directory] >= min_files else None
+        return None
+
+    entries = _group(changes, low_signal_owner)
+    if len(entries) <= max_entries:
+        return entries
+
+    rolled = [e for e in entries if isinstance(e, DirectoryRollup)]
+    files = [e for e in entries if isinstance(e, FileChange)]
+    max_depth = max((len(_directories(c.path)) for c in files), default=0)
+    for depth in range(max_depth, 0, -1):
+
+        def depth_owner(change: FileChange):
+            directories = _directories(change.path)
+            return directories[depth - 1] if len(directories) >= depth else None
+
+        compacted = rolled + _group(files, depth_owner)
+        if len(compacted) <= max_entries or depth == 1:
+            return compacted
+    return entries
+
+
+def get_directory_changes(
+    changes: List[FileChange], directory: str, offset: int = 0, limit: int = 50
+) -> dict:
+    """Page of the individual file changes below directory, largest first."""
+    prefix = directory.rstrip("/") + "/"
+    below = sorted(
+        (c for c in changes if c.path.startswith(prefix)),
+        key=lambda c: c.insertions + c.deletions,
+        reverse=True,
+    )
+    return {
+        "directory": prefix,
+        "total_files": len(below),
+        "offset": offset,
+        "files": below[offset : offset + limit],
+    }
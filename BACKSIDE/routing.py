@@ -0,0 +1,197 @@
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import List
+
+from .classifier import (
+    DATA,
+    DOCUMENTATION,
+    GENERATED,
+    LOCKFILE,
+    OTHER,
+    PathClassifier,
+    SETUP,
+    SOURCE,
+    VENDORED,
+)
+from .gitmodels import FileChange
+from .metrics import metrics
+from .milestones import RawMilestone
+
+# --- Routes ---
+TEMPLATE_ROUTE = "template"  # deterministic summary, no model call
+SMALL_ROUTE = "small"  # agent on the cheaper model
+FULL_ROUTE = "full"  # agent on the full model
+BATCH_ROUTE = "batched"  # summarized together with neighbouring milestones
+ROUTES = (TEMPLATE_ROUTE, SMALL_ROUTE, FULL_ROUTE, BATCH_ROUTE)
+
+# Milestones below these complexity scores take the template / small route. Only
+# milestones made of renames or TEMPLATE_CATEGORIES files can take the template route.
+default_template_complexity = 3.0
+default_small_complexity = 40.0
+
+# Files whose changes a template can describe: nobody reads these diffs for intent.
+TEMPLATE_CATEGORIES = {LOCKFILE, GENERATED, DOCUMENTATION}
+
+# Cheaper model for small milestones, override with SMALL_MODEL.
+default_small_model = os.getenv("SMALL_MODEL", "cerebras/llama3.1-8b")
+
+# Complexity contributed by every changed source file, every 50 changed source lines
+# and every commit.
+FILE_COMPLEXITY = 2.0
+LINES_PER_COMPLEXITY = 50.0
+MESSAGE_COMPLEXITY = 0.5
+
+CATEGORY_NOUNS = {
+    SOURCE: "source file",
+    DOCUMENTATION: "documentation file",
+    OTHER: "other file",
+    LOCKFILE: "lockfile",
+    SETUP: "configuration file",
+    DATA: "asset",
+    VENDORED: "vendored file",
+    GENERATED: "generated file",
+}
+
+metrics.describe("milestones_routed_total", "Milestones summarized, by route.")
+metrics.describe("llm_calls_avoided_total", "Milestones summarized from a template.")
+metrics.describe("milestone_seconds", "Wall time of summarizing a milestone, by route.")
+metrics.describe("milestone_tokens", "Model tokens used to summarize a milestone, by route.")
+metrics.describe(
+    "estimated_seconds_saved",
+    "Summarization time saved by routing, against the mean full-agent time.",
+)
+metrics.describe(
+    "estimated_tokens_saved",
+    "Model tokens saved by routing, against the mean full-agent token count.",
+)
+
+
+def _saved(summary: str) -> float:
+    full = metrics.mean(summary, route=FULL_ROUTE)
+    return sum(
+        metrics.get("milestones_routed_total", route=route)
+        * max(full - metrics.mean(summary, route=route), 0.0)
+        for route in ROUTES
+        if route != FULL_ROUTE
+    )
+
+
+metrics.gauge("estimated_seconds_saved", lambda: _saved("milestone_seconds"))
+metrics.gauge("estimated_tokens_saved", lambda: _saved("milestone_tokens"))
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    complexity: float
+    source_files: int
+    source_lines: int
+
+
+def _churn(change: FileChange) -> int:
+    return max(change.insertions, 0) + max(change.deletions, 0)
+
+
+def _is_pure_rename(change: FileChange) -> bool:
+    return change.status.startswith("R") and _churn(change) == 0
+
+
+def milestone_complexity(
+    milestone: RawMilestone, classifier: PathClassifier
+) -> RouteDecision:
+    """
+    Scores how much there is to explain in a milestone. Only files the classifier
+    considers worth reading count; pure renames count as a quarter of a file.
+    """
+    files = 0.0
+    lines = 0
+    for change in milestone.changes:
+        if classifier.is_low_signal(change.path):
+            continue
+        files += 0.25 if _is_pure_rename(change) else 1.0
+        lines += _churn(change)
+    complexity = (
+        files * FILE_COMPLEXITY
+        + lines / LINES_PER_COMPLEXITY
+        + len(milestone.messages) * MESSAGE_COMPLEXITY
+    )
+    return RouteDecision(
+        route=FULL_ROUTE,
+        complexity=complexity,
+        source_files=int(files + 0.5),
+        source_lines=lines,
+    )
+
+
+def is_template_eligible(milestone: RawMilestone, classifier: PathClassifier) -> bool:
+    """True for milestones of only pure renames and lockfile, generated or docs files."""
+    return all(
+        _is_pure_rename(change)
+        or classifier.classify(change.path).category in TEMPLATE_CATEGORIES
+        for change in milestone.changes
+    )
+
+
+def route_milestone(
+    milestone: RawMilestone,
+    template_complexity: float = default_template_complexity,
+    small_complexity: float = default_small_complexity,
+) -> RouteDecision:
+    classifier = milestone.get_classifier()
+    decision = milestone_complexity(milestone, classifier)
+    if decision.complexity < template_complexity and is_template_eligible(
+        milestone, classifier
+    ):
+        decision.route = TEMPLATE_ROUTE
+    elif decision.complexity < small_complexity:
+        decision.route = SMALL_ROUTE
+    return decision
+
+
+def _plural(count: int, noun: str) -> str:
+    return f"{count} {noun}" + ("" if count == 1 else "s")
+
+
+def _describe_changes(changes: List[FileChange], classifier: PathClassifier) -> str:
+    # counted by noun, so categories sharing one are never listed twice
+    nouns = Counter(
+        CATEGORY_NOUNS.get(classifier.classify(c.path).category, "file") for c in changes
+    )
+    renames = sum(1 for c in changes if c.status.startswith("R"))
+    parts = [_plural(count, noun) for noun, count in nouns.most_common()]
+    text = ", ".join(parts) if parts else "no files"
+    if renames:
+        text += f" ({_plural(renames, 'rename')})"
+    return text
+
+
+def template_summary(milestone: RawMilestone) -> dict:
+    """Summary of a trivial milestone built from its metadata alone."""
+    classifier = milestone.get_classifier()
+    changes = milestone.changes
+    categories = {classifier.classify(c.path).category for c in changes}
+    if changes and all(_is_pure_rename(c) for c in changes):
+        title = "File renames"
+    elif categories and categories <= {LOCKFILE, SETUP}:
+        title = "Dependency and configuration updates"
+    elif categories and categories <= {DATA}:
+        title = "Asset updates"
+    elif categories and categories <= {VENDORED, GENERATED}:
+        title = "Vendored and generated code updates"
+    elif categories and categories <= {DOCUMENTATION}:
+        title = "Documentation updates"
+    else:
+        title = "Minor changes"
+
+    summary = f"A small milestone touching {_describe_changes(changes, classifier)}."
+    if milestone.messages:
+        shown = "; ".join(milestone.messages[:3])
+        more = len(milestone.messages) - 3
+        summary += f" Commits: {shown}" + (f" and {more} more." if more > 0 else ".")
+    largest = sorted(changes, key=_churn, reverse=True)
+    return {
+        "title": title,
+        "summary": summary,
+        "most_important_changes": [c.path for c in largest[:3]],
+    }
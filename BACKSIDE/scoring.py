@@ -0,0 +1,250 @@
+import os
+import subprocess
+from collections import Counter
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .classifier import PathClassifier, get_repo_classifier
+from . import gitexec, gitobjects
+
+# --- Scoring Modes ---
+NUMSTAT_MODE = "numstat"  # exact line churn, needs the blob contents
+SIZE_MODE = "size"  # estimated from tree diffs and local blob sizes, see estimate_score
+SCORE_MODES = (NUMSTAT_MODE, SIZE_MODE)
+
+# --- Size Estimate Configuration ---
+BYTES_PER_LINE = 40.0  # average line length used to turn byte sizes into lines
+MODIFY_FLOOR_LINES = 4.0  # a modification changes at least this many lines
+DEFAULT_LINES_PER_CHANGE = 30.0  # churn of one file change when calibration finds none
+# Commits sampled per repository to calibrate the churn of changes whose blobs were
+# never downloaded; sampled commits touching more files than the cap are skipped.
+default_calibration_commits = int(os.getenv("SCORE_CALIBRATION_COMMITS", 32))
+default_calibration_max_files = int(os.getenv("SCORE_CALIBRATION_MAX_FILES", 50))
+
+
+def calculate_score(
+    c1: str,
+    c2: str,
+    repo_path: Optional[str] = None,
+    classifier: Optional[PathClassifier] = None,
+    mode: str = NUMSTAT_MODE,
+) -> float:
+    """
+    Calculates a churn-based score where churn is weighted by file type.
+    repo_path: repository to run git in (default: the current directory).
+    classifier: path weighting (default: the repository's, honouring .gitattributes).
+    mode: NUMSTAT_MODE counts changed lines, SIZE_MODE estimates them (see estimate_score).
+    """
+    total_weighted_churn = 0.0
+    if classifier is None:
+        classifier = get_repo_classifier(repo_path or ".")
+    if mode == SIZE_MODE:
+        return estimate_score(c1, c2, repo_path, classifier)
+
+    try:
+        # Get per-file stats (insertions, deletions, path) for the range
+        cmd_numstat = ["git", "diff", "--numstat", c1, c2]
+        numstat_output = gitexec.run(
+            cmd_numstat, cwd=repo_path, capture_output=True, text=True, check=True
+        ).stdout
+
+        for line in numstat_output.strip().split("\n"):
+            if not line:
+                continue
+
+            parts = line.split("\t")
+            insertions = int(parts[0]) if parts[0] != "-" else 0
+            deletions = int(parts[1]) if parts[1] != "-" else 0
+            file_path = parts[2]
+
+            raw_churn = insertions + deletions
+            # taper = 500
+            # raw_churn = taper * math.tanh(raw_churn / taper)
+
+            # --- Calculate the weight for this file's churn ---
+            # Adjust weight based on file category
+            weight = classifier.weight(file_path)
+
+            # A historical change frequency modifier, math.tanh(count / 1.7) over
+            # `git rev-list --count c1..c2 -- path`, was tried here. It cost one git
+            # process per file and was never applied, so it is no longer computed.
+
+            # --- Apply final weight to this file's churn ---
+            total_weighted_churn += raw_churn * weight
+
+    except subprocess.CalledProcessError:
+
+        return 0.0  # Return 0 if any git command fails
+
+    return total_weighted_churn
+
+
+@gitexec.repository_cache()
+def get_lines_per_change(repo_path: str) -> float:
+    """
+    Typical changed lines of one file in one commit of the repository, the unit of
+    the size estimate when blobs are missing. Measured with `git diff --numstat` on
+    commits sampled evenly along the first-parent chain; in a partial clone their
+    blobs are fetched first in one request, once per repository. Twice the median,
+    since the per-file churn is heavy-tailed and the median alone sits far below
+    the mean.
+    """
+    try:
+        chain = gitexec.run(
+            ["git", "rev-list", "--first-parent", "--no-merges", "HEAD"],
+            cwd=repo_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        # the oldest commit is the root or a shallow boundary, without a parent to diff
+        chain = chain[:-1]
+        count = min(default_calibration_commits, len(chain))
+        sample = [chain[i] for i in np.linspace(0, len(chain) - 1, count).astype(int)]
+        sample = [
+            commit
+            for commit in dict.fromkeys(sample)
+            if len(gitobjects.diff_raw(repo_path, f"{commit}^", commit))
+            <= default_calibration_max_files
+        ]
+        if sample and gitobjects.is_partial_clone(repo_path):
+            missing = set()
+            for commit in sample:
+                missing |= gitobjects.missing_objects(repo_path, f"{commit}^", commit)
+            gitobjects.fetch_blobs(repo_path, sorted(missing))
+        churns = []
+        for commit in sample:
+            numstat_output = gitexec.run(
+                ["git", "diff", "--numstat", "--no-renames", f"{commit}^", commit],
+                cwd=repo_path,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            for line in numstat_output.splitlines():
+                insertions, deletions, _ = line.split("\t", 2)
+                if insertions != "-":
+                    churns.append(int(insertions) + int(deletions))
+    except subprocess.CalledProcessError as e:
+        print(f"Warning: Could not calibrate size scores of {repo_path}: {e.stderr}")
+        return DEFAULT_LINES_PER_CHANGE
+    if not churns:
+        return DEFAULT_LINES_PER_CHANGE
+    return max(2 * float(np.median(churns)), 1.0)
+
+
+def get_touch_counts(repo_path: Optional[str], c1: str, c2: str) -> Counter:
+    """How many commits in c1..c2 changed each path. Only reads trees."""
+    output = gitexec.run(
+        ["git", "log", "--format=", "--name-only", "--no-renames", f"{c1}..{c2}"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return Counter(line for line in output.splitlines() if line)
+
+
+def estimate_churn(
+    status: str,
+    old_size: Optional[int],
+    new_size: Optional[int],
+    lines_per_change: float = DEFAULT_LINES_PER_CHANGE,
+    touches: int = 1,
+) -> float:
+    """
+    Estimated changed lines of one file. status is A, D or M; a size is None when the
+    blob is not in the local store. A missing added or deleted file counts as two
+    typical changes, a modification with a missing side as one per commit touching it.
+    """
+    if status == "A":
+        if new_size is None:
+            return 2 * lines_per_change
+        return new_size / BYTES_PER_LINE
+    if status == "D":
+        if old_size is None:
+            return 2 * lines_per_change
+        return old_size / BYTES_PER_LINE
+    if old_size is None or new_size is None:
+        return lines_per_change * max(touches, 1)
+    return abs(new_size - old_size) / BYTES_PER_LINE + MODIFY_FLOOR_LINES
+
+
+def estimate_score(
+    c1: str,
+    c2: str,
+    repo_path: Optional[str] = None,
+    classifier: Optional[PathClassifier] = None,
+) -> float:
+    """
+    Blob-free variant of calculate_score. Changed paths and their blob OIDs come from
+    `git diff --raw` and which of them are local from rev-list, both of which only
+    read trees. Trees carry no blob sizes (and `ls-tree -l` fetches the blobs to
+    report them), so sizes are read for local blobs only; the rest are estimated with
+    get_lines_per_change. Files moved without changes (same OID deleted and added)
+    cost nothing.
+    """
+    if classifier is None:
+        classifier = get_repo_classifier(repo_path or ".")
+    try:
+        changes = [
+            change
+            for change in gitobjects.diff_raw(repo_path, c1, c2)
+            if not change.is_gitlink
+        ]
+        missing = gitobjects.missing_objects(repo_path, c1, c2)
+        local = {
+            oid
+            for change in changes
+            for oid in (change.old_oid, change.new_oid)
+            if oid is not None and oid not in missing
+        }
+        sizes = gitobjects.blob_sizes(repo_path, sorted(local))
+        lines_per_change = get_lines_per_change(repo_path or ".") if missing else 0.0
+        touches = Counter()
+        # modifications with a missing side are scaled by how often they were touched
+        if any(
+            change.old_oid is not None
+            and change.new_oid is not None
+            and not missing.isdisjoint((change.old_oid, change.new_oid))
+            for change in changes
+        ):
+            touches = get_touch_counts(repo_path, c1, c2)
+    except subprocess.CalledProcessError:
+        return 0.0
+
+    deleted = {change.old_oid for change in changes if change.new_oid is None}
+    added = {change.new_oid for change in changes if change.old_oid is None}
+    moved = deleted & added
+
+    total_weighted_churn = 0.0
+    for change in changes:
+        if change.old_oid in moved or change.new_oid in moved:
+            continue
+        if change.old_oid is None:
+            status = "A"
+        elif change.new_oid is None:
+            status = "D"
+        else:
+            status = "M"
+        churn = estimate_churn(
+            status,
+            sizes.get(change.old_oid),
+            sizes.get(change.new_oid),
+            lines_per_change,
+            touches[change.path],
+        )
+        total_weighted_churn += churn * classifier.weight(change.path)
+    return total_weighted_churn
+
+
+def calculate_scores(
+    pairs: Iterable[Tuple[str, str]],
+    repo_path: Optional[str] = None,
+    mode: str = NUMSTAT_MODE,
+) -> Iterator[float]:
+    """Scores many (c1, c2) ranges of one repository, yielding as they are computed."""
+    classifier = get_repo_classifier(repo_path or ".")
+    for c1, c2 in pairs:
+        yield calculate_score(c1, c2, repo_path, classifier, mode)
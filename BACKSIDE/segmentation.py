@@ -0,0 +1,273 @@
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .classifier import get_repo_classifier
+from .fetcher import DataFetcher
+from .gitmodels import Commit
+from . import tracing
+
+# Rough wall-clock cost of summarizing one milestone, used to turn a time
+# budget into a milestone count.
+default_seconds_per_milestone = 12.0
+
+# Milestone count used by balanced segmentation when the caller gives none.
+default_target_milestones = 10
+
+# Milestones of the quick first timeline in progressive mode.
+default_coarse_milestones = 4
+
+# Bonus for milestone edges on merge commits, in squared mean-milestone units.
+default_merge_bonus = 0.25
+
+# Candidate thresholds evaluated per refinement round, and number of rounds.
+threshold_grid_size = 64
+threshold_search_rounds = 4
+
+
+@dataclass
+class CommitChurn:
+    """
+    Weighted churn of every commit on the first-parent chain of HEAD.
+    Fields:
+    - commits: the chain, oldest first
+    - weights: weights[i] is the scoregen-weighted churn introduced by commits[i]
+    - prefix: prefix[i] is the work between commits[0] and commits[i]
+    """
+
+    commits: List[Commit]
+    weights: np.ndarray
+    prefix: np.ndarray
+
+    @property
+    def total(self) -> float:
+        return float(self.prefix[-1])
+
+
+def compute_commit_churn(df: DataFetcher, repo_path: str) -> CommitChurn:
+    """
+    Builds the churn vectors from a single `git log --numstat` call.
+    Summing per-commit churn over-counts lines that are rewritten inside a range
+    compared to scoregen's range diff, but it preserves the ordering of ranges,
+    which is all that the threshold search needs.
+    """
+    with tracing.span("compute_commit_churn") as args:
+        history = df.get_first_parent_numstat(repo_path)
+        commits = [commit for commit, _ in history]
+        classifier = get_repo_classifier(repo_path)
+        weights = np.zeros(len(history), dtype=np.float64)
+        for i, (_, stats) in enumerate(history):
+            weights[i] = sum(
+                (insertions + deletions) * classifier.weight(path)
+                for insertions, deletions, path in stats
+            )
+        # the root commit is the start of the first milestone, its own churn is never counted
+        prefix = np.concatenate(([0.0], np.cumsum(weights[1:])))
+        args["num_commits"] = len(commits)
+        return CommitChurn(commits=commits, weights=weights, prefix=prefix)
+
+
+def count_segments(prefix: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """
+    Number of milestones the bisect heuristic would produce for every threshold at once.
+    A milestone starting at commit i ends at the first commit j with
+    prefix[j] - prefix[i] > threshold, or at the last commit.
+    """
+    last = len(prefix) - 1
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    starts = np.zeros(len(thresholds), dtype=np.int64)
+    counts = np.zeros(len(thresholds), dtype=np.int64)
+    active = starts < last
+    while active.any():
+        current = starts[active]
+        ends = np.searchsorted(prefix, prefix[current] + thresholds[active], side="right")
+        starts[active] = np.minimum(ends, last)
+        counts[active] += 1
+        active = starts < last
+    return counts
+
+
+def segment_boundaries(prefix: np.ndarray, threshold: float) -> List[int]:
+    """Commit indices of the milestone edges for one threshold, including both ends."""
+    last = len(prefix) - 1
+    boundaries = [0]
+    while boundaries[-1] < last:
+        end = int(
+            np.searchsorted(prefix, prefix[boundaries[-1]] + threshold, side="right")
+        )
+        boundaries.append(min(end, last))
+    return boundaries
+
+
+def find_threshold_for_target(
+    churn: CommitChurn, target: int
+) -> Tuple[float, List[int]]:
+    """
+    Searches for the work threshold that splits history into `target` milestones.
+    Each round evaluates a geometric grid of thresholds with count_segments and
+    narrows to the bracket where the milestone count crosses the target.
+    returns: (threshold, boundary commit indices)
+    """
+    prefix = churn.prefix
+    max_segments = len(prefix) - 1
+    if max_segments < 1:
+        return 0.0, [0]
+    target = max(1, min(target, max_segments))
+    total = churn.total
+    if total <= 0:
+        # no measurable work, fall back to evenly spaced commits
+        boundaries = np.linspace(0, max_segments, target + 1).round().astype(int)
+        return 0.0, sorted(set(boundaries.tolist()))
+    # commits without work never get a milestone of their own, so the most milestones
+    # there can be come out of threshold 0, which the geometric grid never reaches
+    if target >= count_segments(prefix, [0.0])[0]:
+        return 0.0, segment_boundaries(prefix, 0.0)
+
+    # more than total / low + 1 milestones can never come out of the lowest candidate
+    low, high = total / (16 * target), total
+    best_threshold, best_error = high, None
+    for _ in range(threshold_search_rounds):
+        candidates = np.geomspace(low, high, threshold_grid_size)
+        counts = count_segments(prefix, candidates)
+        errors = np.abs(counts - target)
+        i = int(np.argmin(errors))
+        if best_error is None or errors[i] < best_error:
+            best_threshold, best_error = float(candidates[i]), int(errors[i])
+        if best_error == 0:
+            break
+        # counts decrease as the threshold grows: narrow to the crossing bracket
+        above = np.nonzero(counts > target)[0]
+        below = np.nonzero(counts < target)[0]
+        if len(above) == 0 or len(below) == 0:
+            break
+        low, high = float(candidates[above[-1]]), float(candidates[below[0]])
+
+    return best_threshold, segment_boundaries(prefix, best_threshold)
+
+
+def target_from_time_budget(
+    time_budget: float, seconds_per_milestone: Optional[float] = None
+) -> int:
+    """How many milestones can be summarized within time_budget seconds."""
+    per_milestone = seconds_per_milestone or default_seconds_per_milestone
+    return max(1, int(time_budget // per_milestone))
+
+
+def _best_predecessors(
+    prev: np.ndarray, q: np.ndarray, ends: np.ndarray, lows: np.ndarray, highs: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For every end index ends[t], finds the start i in [lows[t], highs[t]] minimizing
+    prev[i] + (q[end] - q[i])^2, all rows evaluated in one vectorized pass.
+    returns: (best costs, best starts)
+    """
+    lengths = highs - lows + 1
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    owner = np.repeat(np.arange(len(ends)), lengths)
+    starts = lows[owner] + (np.arange(int(lengths.sum())) - offsets[owner])
+    values = prev[starts] + (q[ends[owner]] - q[starts]) ** 2
+    best = np.minimum.reduceat(values, offsets)
+    # first position per row that reaches the row minimum
+    hits = np.flatnonzero(values == best[owner])
+    _, first = np.unique(owner[hits], return_index=True)
+    return best, starts[hits[first]]
+
+
+def _solve_layer(prev: np.ndarray, q: np.ndarray, lo: int, hi: int, opt_lo: int):
+    """
+    One layer of the partition DP for ends lo..hi using divide and conquer
+    optimization: the cost is Monge, so the best start never decreases as the
+    end grows. The recursion tree is walked level by level so each level is a
+    single NumPy pass over O(n) candidates.
+    """
+    n = len(q)
+    dp = np.full(n, np.inf)
+    opt = np.zeros(n, dtype=np.int64)
+    # pending intervals: (end range lo..hi, start range opt_lo..opt_hi)
+    los = np.array([lo])
+    his = np.array([hi])
+    opt_los = np.array([opt_lo])
+    opt_his = np.array([hi - 1])
+    while len(los):
+        mids = (los + his) // 2
+        best, arg = _best_predecessors(
+            prev, q, mids, opt_los, np.minimum(opt_his, mids - 1)
+        )
+        dp[mids] = best
+        opt[mids] = arg
+        left = mids > los
+        right = mids < his
+        los, his, opt_los, opt_his = (
+            np.concatenate((los[left], mids[right] + 1)),
+            np.concatenate((mids[left] - 1, his[right])),
+            np.concatenate((opt_los[left], arg[right])),
+            np.concatenate((arg[left], opt_his[right])),
+        )
+    return dp, opt
+
+
+def balanced_boundaries(
+    prefix: np.ndarray,
+    target: int,
+    merge_mask: Optional[np.ndarray] = None,
+    merge_bonus: float = 0.0,
+) -> List[int]:
+    """
+    Partitions the chain into `target` milestones of work as even as possible.
+    Minimizes the sum of squared segment work (equivalently its variance around
+    total / target), minus merge_bonus for every boundary that lands on a commit
+    with merge_mask set. Work is measured in units of the mean segment, so a bonus
+    of 0.25 trades a quarter of a squared mean milestone of imbalance for a merge edge.
+    Runs in O(target * n log n) vectorized work and O(target * n) memory.
+    returns: boundary commit indices including both ends
+    """
+    last = len(prefix) - 1
+    if last < 1:
+        return [0]
+    target = max(1, min(target, last))
+    total = float(prefix[-1])
+    if total <= 0:
+        boundaries = np.linspace(0, last, target + 1).round().astype(int)
+        return sorted(set(boundaries.tolist()))
+
+    q = np.asarray(prefix, dtype=np.float64) / (total / target)
+    bonus = np.zeros(len(q))
+    if merge_mask is not None and merge_bonus:
+        bonus[np.asarray(merge_mask, dtype=bool)] = merge_bonus
+    bonus[last] = 0.0
+
+    dp = np.full(len(q), np.inf)
+    dp[0] = 0.0
+    opts = []
+    for k in range(1, target):
+        # the k-th boundary leaves room for the remaining target - k milestones
+        dp, opt = _solve_layer(dp, q, k, last - (target - k), k - 1)
+        dp = dp - bonus
+        opts.append(opt)
+    _, final = _best_predecessors(
+        dp, q, np.array([last]), np.array([target - 1]), np.array([last - 1])
+    )
+
+    boundaries = [last, int(final[0])]
+    for opt in reversed(opts):
+        boundaries.append(int(opt[boundaries[-1]]))
+    return boundaries[::-1]
+
+
+def nest_boundaries(fine: List[int], coarse: List[int]) -> List[int]:
+    """
+    Moves every coarse boundary onto the nearest fine boundary, so that each coarse
+    milestone splits into whole fine milestones. Coarse boundaries that land on the
+    same fine one are merged.
+    """
+    candidates = np.asarray(fine)
+    nested = {fine[0], fine[-1]}
+    for boundary in coarse[1:-1]:
+        nested.add(int(candidates[np.abs(candidates - boundary).argmin()]))
+    return sorted(nested)
+
+
+def merge_mask_for(churn: CommitChurn) -> np.ndarray:
+    """True for commits on the chain that merged another branch in."""
+    return np.array([len(c.parent_hashes) > 1 for c in churn.commits], dtype=bool)
@@ -0,0 +1,119 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .timeline_state import STATE_DIRECTORY, TimelineState
+
+SNAPSHOT_DIRECTORY = os.path.join(STATE_DIRECTORY, "snapshots")
+
+# Snapshot bodies kept in memory, so repeat views of popular timelines skip the disk.
+default_snapshot_cache_size = 32
+
+
+@dataclass
+class Snapshot:
+    """A finished timeline, serialized and gzipped once when the pipeline ends."""
+
+    repo: str
+    head: str
+    etag: str
+    body: bytes  # gzipped JSON
+
+
+def snapshot_json(state: TimelineState, preview: int) -> dict:
+    return {
+        "repo": state.repo,
+        "head": state.head,
+        "overview": state.overview,
+        "milestones": [
+            {
+                "index": index,
+                "start_commit_hash": record.start_commit_hash,
+                "end_commit_hash": record.end_commit_hash,
+                "time_start": record.time_start,
+                "time_end": record.time_end,
+                "num_messages": len(record.messages),
+                "preview": record.messages[:preview],
+                **record.summary,
+            }
+            for index, record in enumerate(state.milestones)
+        ],
+    }
+
+
+def _repo_directory(repo: str) -> str:
+    return os.path.join(SNAPSHOT_DIRECTORY, repo.replace("/", "__"))
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class SnapshotStore:
+    """
+    Completed timelines on disk, one gzipped JSON file per (repo, HEAD):
+        state/snapshots/<owner>__<repo>/<head>.json.gz
+        state/snapshots/<owner>__<repo>/LATEST     "<head> <etag>"
+    The ETag is a hash of the uncompressed body, so a revalidation only reads LATEST.
+    """
+
+    def __init__(self, cache_size: int = default_snapshot_cache_size):
+        self.cache_size = cache_size
+        self._cache: Dict[Tuple[str, str], Snapshot] = {}
+        self._lock = threading.Lock()
+
+    def save(self, state: TimelineState, preview: int) -> Snapshot:
+        raw = json.dumps(snapshot_json(state, preview), separators=(",", ":")).encode()
+        etag = '"' + hashlib.sha256(raw).hexdigest()[:32] + '"'
+        snapshot = Snapshot(state.repo, state.head, etag, gzip.compress(raw, 9, mtime=0))
+        directory = _repo_directory(state.repo)
+        os.makedirs(directory, exist_ok=True)
+        _write_atomic(os.path.join(directory, f"{state.head}.json.gz"), snapshot.body)
+        _write_atomic(os.path.join(directory, "LATEST"), f"{state.head} {etag}".encode())
+        self._remember(snapshot)
+        return snapshot
+
+    def latest(self, repo: str) -> Optional[Tuple[str, str]]:
+        """(head, etag) of the newest snapshot of repo, None if there is none."""
+        try:
+            with open(os.path.join(_repo_directory(repo), "LATEST")) as f:
+                head, etag = f.read().split(" ", 1)
+            return head, etag
+        except (OSError, ValueError):
+            return None
+
+    def load(self, repo: str, head: str) -> Optional[Snapshot]:
+        if not re.fullmatch(r"[0-9a-f]{40,64}", head):
+            return None
+        with self._lock:
+            snapshot = self._cache.get((repo, head))
+        if snapshot is not None:
+            self._remember(snapshot)
+            return snapshot
+        try:
+            with open(os.path.join(_repo_directory(repo), f"{head}.json.gz"), "rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+        etag = '"' + hashlib.sha256(gzip.decompress(body)).hexdigest()[:32] + '"'
+        snapshot = Snapshot(repo, head, etag, body)
+        self._remember(snapshot)
+        return snapshot
+
+    def _remember(self, snapshot: Snapshot):
+        with self._lock:
+            self._cache.pop((snapshot.repo, snapshot.head), None)
+            self._cache[(snapshot.repo, snapshot.head)] = snapshot
+            while len(self._cache) > self.cache_size:
+                del self._cache[next(iter(self._cache))]
+
+
+snapshot_store = SnapshotStore()
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+# A delta frame is sent at most this long after its first buffered token...
+default_delta_interval_ms = 100
+# ...or as soon as this many bytes are buffered.
+default_delta_max_bytes = 1024
+
+
+class DeltaCoalescer:
+    """
+    Batches token deltas of a streamed model response into frames, so the client
+    gets a frame every interval_ms (or max_bytes) instead of one per token.
+    send(text, reset) is awaited for every frame; reset marks the first frame of a
+    new model turn, whose text replaces what the previous turn streamed.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, bool], Awaitable[None]],
+        interval_ms: float = default_delta_interval_ms,
+        max_bytes: int = default_delta_max_bytes,
+    ):
+        self.send = send
+        self.interval = interval_ms / 1000
+        self.max_bytes = max_bytes
+        self.frames = 0
+        self._parts = []
+        self._size = 0
+        self._reset = False
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def add(self, text: str):
+        if not text:
+            return
+        self._parts.append(text)
+        self._size += len(text.encode("utf-8"))
+        if self._size >= self.max_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def new_turn(self):
+        """Starts a new model turn: flushes the old text, the next frame resets."""
+        await self.flush()
+        self._reset = True
+
+    async def flush(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+        async with self._lock:
+            if not self._parts:
+                return
+            text = "".join(self._parts)
+            reset = self._reset
+            self._parts, self._size, self._reset = [], 0, False
+            self.frames += 1
+            await self.send(text, reset)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        await self.flush()
@@ -0,0 +1,204 @@
+import dataclasses
+import fcntl
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+STATE_DIRECTORY = "./state"
+
+
+@dataclass
+class MilestoneRecord:
+    """A finished milestone: its range, commit subjects and the agent's summary."""
+
+    start_commit_hash: str
+    end_commit_hash: str
+    time_start: int
+    time_end: int
+    messages: List[str]
+    summary: dict
+
+
+@dataclass
+class TimelineState:
+    """
+    Everything needed to continue the timeline of a repository later on.
+    Fields:
+    - repo: username/project
+    - head: last analyzed HEAD commit, or the end of the last milestone if incomplete
+    - threshold: work threshold used to segment, None for other segmentation modes
+    - score_mode: scoregen mode the threshold applies to
+    - milestones: finished milestones, oldest first
+    - overview: project overview generated from all summaries
+    - complete: False if a milestone failed, so the milestones stop short of the
+      HEAD that was analyzed and the next run continues after the last one
+    """
+
+    repo: str
+    head: str
+    threshold: Optional[float]
+    score_mode: str = "numstat"
+    milestones: List[MilestoneRecord] = field(default_factory=list)
+    overview: Optional[str] = None
+    complete: bool = True
+
+    def get_summary(self, start_commit_hash: str, end_commit_hash: str) -> Optional[dict]:
+        """Summary of a previously analyzed milestone with exactly this range."""
+        for record in self.milestones:
+            if (
+                record.start_commit_hash == start_commit_hash
+                and record.end_commit_hash == end_commit_hash
+            ):
+                return record.summary
+        return None
+
+    def stable_milestones(self) -> List[MilestoneRecord]:
+        """
+        Milestones that new commits cannot change. The last milestone always ends
+        at the old HEAD, so its end boundary moves when history grows.
+        """
+        return self.milestones[:-1]
+
+
+def get_state_path(repo: str) -> str:
+    return os.path.join(STATE_DIRECTORY, repo.replace("/", "__") + ".json")
+
+
+def load_state(repo: str) -> Optional[TimelineState]:
+    path = get_state_path(repo)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        data["milestones"] = [MilestoneRecord(**m) for m in data["milestones"]]
+        return TimelineState(**data)
+    except (ValueError, TypeError, KeyError) as e:
+        print(f"Warning: Ignoring unreadable timeline state {path}: {e}")
+        return None
+
+
+def save_state(state: TimelineState):
+    """
+    Writes the state atomically so a crash never leaves a half-written file. Every
+    write has its own temporary file: concurrent analyses of a repository replace
+    the state one after another instead of interleaving their writes.
+    """
+    path = get_state_path(state.repo)
+    os.makedirs(STATE_DIRECTORY, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=STATE_DIRECTORY, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(dataclasses.asdict(state), f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def get_checkpoint_path(repo: str) -> str:
+    return os.path.join(STATE_DIRECTORY, repo.replace("/", "__") + ".checkpoint.jsonl")
+
+
+class Checkpoint:
+    """
+    Journal of the milestones an analysis has finished so far, so a run that is
+    interrupted (crash, restart, cancellation) can continue where it stopped.
+    One JSON line per milestone after a header line with the segmentation
+    parameters; every line is fsynced before the milestone is streamed on.
+
+    A run owns the repository's journal from creation until close, through an
+    flock the OS drops if the process dies. While one run owns it, other runs of
+    the repository neither resume from it nor write it (active is False).
+    start, append and remove block on the disk; async code runs them in a thread.
+    """
+
+    def __init__(self, repo: str):
+        self.repo = repo
+        self.path = get_checkpoint_path(repo)
+        self.file = None
+        os.makedirs(STATE_DIRECTORY, exist_ok=True)
+        self.lock = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(self.lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"Another analysis of {repo} is running, not checkpointing this one")
+            self.lock.close()
+            self.lock = None
+
+    @property
+    def active(self) -> bool:
+        return self.lock is not None
+
+    def load(self) -> Optional[TimelineState]:
+        """Milestones the interrupted previous run finished, see load_checkpoint."""
+        if not self.active:
+            return None
+        return load_checkpoint(self.repo)
+
+    def start(self, state: TimelineState):
+        """Starts the journal of state with the milestones it already holds."""
+        if not self.active:
+            return
+        header = {
+            "repo": state.repo,
+            "head": state.head,
+            "threshold": state.threshold,
+            "score_mode": state.score_mode,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for line in [header] + [dataclasses.asdict(m) for m in state.milestones]:
+                f.write(json.dumps(line) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "a")
+
+    def append(self, record: MilestoneRecord):
+        if self.file is None:
+            return
+        self.file.write(json.dumps(dataclasses.asdict(record)) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        """Closes the journal and gives up ownership; the file stays for a later run."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
+
+    def remove(self):
+        """The analysis completed: its state file supersedes the journal."""
+        if self.active and os.path.exists(self.path):
+            os.remove(self.path)
+        self.close()
+
+
+def load_checkpoint(repo: str) -> Optional[TimelineState]:
+    """
+    Milestones an interrupted analysis of repo finished, as a partial state.
+    Does not check whether that analysis is still running; see Checkpoint.load.
+    """
+    path = get_checkpoint_path(repo)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+        state = TimelineState(**json.loads(lines[0]))
+        for line in lines[1:]:
+            try:
+                state.milestones.append(MilestoneRecord(**json.loads(line)))
+            except ValueError:
+                # torn last line of a crash mid-write
+                break
+        return state
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        print(f"Warning: Ignoring unreadable checkpoint {path}: {e}")
+        return None
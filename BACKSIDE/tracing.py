@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import json
+import os
+import subprocess as sp
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Set, Tuple
+
+_current_tracer = contextvars.ContextVar("current_tracer", default=None)
+
+
+def now_us() -> int:
+    """Wall clock in microseconds, the timestamp unit of Chrome trace events."""
+    return time.time_ns() // 1000
+
+
+def _track() -> Tuple[int, str]:
+    """
+    Trace thread id and name for the caller: its asyncio task when it runs on an
+    event loop, else its thread. Coroutines interleave on the loop thread, so a
+    per-thread id would draw their spans nested inside each other.
+    """
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return id(task), f"task {task.get_name()}"
+    thread = threading.current_thread()
+    return thread.ident, thread.name
+
+
+class Tracer:
+    """
+    Records nested spans of a single pipeline run as Chrome trace events.
+    The output can be opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pid = os.getpid()
+        self.events: List[dict] = []
+        self._tracks: Set[int] = set()
+        self._lock = threading.Lock()
+        self.events.append(
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": self.pid,
+                "tid": 0,
+                "args": {"name": name},
+            }
+        )
+
+    def add_span(self, name: str, cat: str, start_us: int, end_us: int, args: dict):
+        tid, track_name = _track()
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": start_us,
+            "dur": max(end_us - start_us, 0),
+            "pid": self.pid,
+            "tid": tid,
+            "args": args,
+        }
+        with self._lock:
+            if tid not in self._tracks:
+                self._tracks.add(tid)
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": self.pid,
+                        "tid": tid,
+                        "args": {"name": track_name},
+                    }
+                )
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "pipeline", **args):
+        """Times the enclosed block. The yielded dict can be filled with extra args."""
+        start = now_us()
+        try:
+            yield args
+        finally:
+            self.add_span(name, cat, start, now_us(), args)
+
+    def to_json(self) -> dict:
+        with self._lock:
+            events = list(self.events)
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+        }
+
+    def write(self, path: str) -> str:
+        """Writes the trace to disk and returns the path."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f)
+        return path
+
+
+def activate(tracer: Optional[Tracer]) -> contextvars.Token:
+    """Makes tracer the current tracer for this context (and tasks spawned from it)."""
+    return _current_tracer.set(tracer)
+
+
+def deactivate(token: contextvars.Token):
+    _current_tracer.reset(token)
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _current_tracer.get()
+
+
+@contextmanager
+def span(name: str, cat: str = "pipeline", **args):
+    """Records a span on the current tracer, or does nothing if tracing is off."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, cat, **args) as span_args:
+        yield span_args
+
+
+def git_span_name(command: List[str]) -> str:
+    """'git --no-pager diff --numstat ...' -> 'git diff'"""
+    subcommand = next(
+        (part for part in command[1:] if not part.startswith("-")), ""
+    )
+    return f"{os.path.basename(command[0])} {subcommand}".strip()
+
+
+def _byte_count(output) -> int:
+    if output is None:
+        return 0
+    if isinstance(output, str):
+        return len(output.encode("utf-8"))
+    return len(output)
+
+
+def run(command: List[str], runner=sp.run, **kwargs) -> sp.CompletedProcess:
+    """
+    subprocess.run wrapper that records argv, output size and duration.
+    runner: replacement for subprocess.run with the same signature
+    """
+    with span(git_span_name(command), "git", argv=command) as args:
+        result = runner(command, **kwargs)
+        args["returncode"] = result.returncode
+        args["stdout_bytes"] = _byte_count(result.stdout)
+        args["stderr_bytes"] = _byte_count(result.stderr)
+        return result
+
+
+class AgentTraceRecorder:
+    """
+    Converts the event stream of one agent run into spans:
+    one per model turn and one per tool call.
+    """
+
+    def __init__(self, tracer: Optional[Tracer]):
+        self.tracer = tracer
+        self._turn_start = None
+        self._tool_starts = {}  # call_id -> (tool name, start, argument bytes)
+
+    def record(self, event):
+        if self.tracer is None:
+            return
+        if event.type == "raw_response_event":
+            data_type = getattr(event.data, "type", None)
+            if data_type == "response.created":
+                self._turn_start = now_us()
+            elif data_type == "response.completed" and self._turn_start is not None:
+                args = {}
+                usage = getattr(event.data.response, "usage", None)
+                if usage is not None:
+                    args["input_tokens"] = usage.input_tokens
+                    args["output_tokens"] = usage.output_tokens
+                self.tracer.add_span(
+                    "agent turn", "agent", self._turn_start, now_us(), args
+                )
+                self._turn_start = None
+        elif event.type == "run_item_stream_event":
+            if event.item.type == "tool_call_item":
+                raw = event.item.raw_item
+                arguments = getattr(raw, "arguments", "") or ""
+                self._tool_starts[getattr(raw, "call_id", None)] = (
+                    getattr(raw, "name", "tool"),
+                    now_us(),
+                    arguments,
+                )
+            elif event.item.type == "tool_call_output_item":
+                raw = event.item.raw_item
+                call_id = (
+                    raw.get("call_id")
+                    if isinstance(raw, dict)
+                    else getattr(raw, "call_id", None)
+                )
+                started = self._tool_starts.pop(call_id, None)
+                if started is None:
+                    return
+                name, start, arguments = started
+                self.tracer.add_span(
+                    f"tool {name}",
+                    "tool",
+                    start,
+                    now_us(),
+                    {
+                        "arguments": arguments,
+                        "output_bytes": _byte_count(str(event.item.output)),
+                    },
+                )
@@ -7,6 +7,20 @@ import { AnalysisService, SSEEvent } from '../../services/api';
 import Timeline, { Milestone } from '../../components/Timeline';
 import styles from './page.module.css';
 
+// The agent answers with a JSON object; pull the (possibly unfinished) "summary" string out of it.
+function extractStreamingSummary(streamed: string): string {
+  if (!streamed.trimStart().startsWith('{')) return streamed;
+  const match = streamed.match(/"summary"\s*:\s*"((?:[^"\\]|\\.)*)/);
+  if (!match) return '';
+  // drop a trailing half escape sequence before decoding
+  const body = match[1].replace(/\\(u[0-9a-fA-F]{0,3})?$/, '');
+  try {
+    return JSON.parse(`"${body}"`);
+  } catch {
+    return body;
+  }
+}
+
 export default function Analysis() {
   const router = useRouter();
   const searchParams = useSearchParams();
@@ -18,6 +32,8 @@ export default function Analysis() {
   const [repoName, setRepoName] = useState<string>('');
   const [finalSummary, setFinalSummary] = useState<string>('');
   const eventSourceRef = useRef<EventSource | null>(null);
+  // streamed answer text of each milestone that is still processing, by index
+  const deltaTextRef = useRef<Record<number, string>>({});
 
   useEffect(() => {
     const pipelineId = searchParams.get('id');
@@ -46,8 +62,9 @@ export default function Analysis() {
         if (event.type === 'milestone_start' && event.payload) {
           const placeholder: Milestone = {
             title: 'Processing milestone...',
-            summary: `Analyzing ${event.payload.messages?.length || 0} commits...`,
-            files: []
+            summary: `Analyzing ${event.payload.num_messages ?? event.payload.messages?.length ?? 0} commits...`,
+            files: [],
+            coarse: event.payload.coarse
           };
           setMilestones(prev => [...prev, placeholder]);
         }
@@ -56,6 +73,11 @@ export default function Analysis() {
           let message = event.payload.message; // message to display in milestone while it loads
           setMilestones(prev => {
             const updated = [...prev];
+            const index = event.payload.index;
+            if (typeof index === 'number' && updated[index]?.title === 'Processing milestone...') {
+              updated[index] = { ...updated[index], summary: message };
+              return updated;
+            }
             for (let i = updated.length - 1; i >= 0; i--) {
               if (updated[i].title === 'Processing milestone...') {
                 updated[i] = { ...updated[i], summary: message };
@@ -67,18 +89,42 @@ export default function Analysis() {
 
         }
 
+        // Coalesced token deltas of the agent's answer: show the summary as it is written
+        if (event.type === 'processing_delta' && event.payload) {
+          const { index, text, reset } = event.payload;
+          const streamed = (reset ? '' : deltaTextRef.current[index] || '') + text;
+          deltaTextRef.current[index] = streamed;
+          const preview = extractStreamingSummary(streamed);
+          if (preview) {
+            setMilestones(prev => {
+              if (prev[index]?.title !== 'Processing milestone...') return prev;
+              const updated = [...prev];
+              updated[index] = { ...updated[index], summary: preview };
+              return updated;
+            });
+          }
+        }
+
         // Check for milestone_analysis event (update with final processed data)
         if (event.type === 'milestone_analysis' && event.payload) {
           setMilestones(prev => {
             const updated = [...prev];
+            const analyzed = {
+              title: event.payload.title || 'Milestone',
+              summary: event.payload.summary || '',
+              files: event.payload.most_important_changes || [],
+              coarse: event.payload.coarse
+            };
+            // Batched analyses arrive after several placeholders, so prefer the index
+            const index = event.payload.index;
+            if (typeof index === 'number' && updated[index]?.title === 'Processing milestone...') {
+              updated[index] = analyzed;
+              return updated;
+            }
             // Find the last placeholder and update it
             for (let i = updated.length - 1; i >= 0; i--) {
               if (updated[i].title === 'Processing milestone...') {
-                updated[i] = {
-                  title: event.payload.title || 'Milestone',
-                  summary: event.payload.summary || '',
-                  files: event.payload.most_important_changes || []
-                };
+                updated[i] = analyzed;
                 break;
               }
             }
@@ -86,6 +132,30 @@ export default function Analysis() {
           });
         }
 
+        // Progressive mode: a coarse milestone is being refined into finer ones
+        if (event.type === 'milestone_split' && event.payload) {
+          const { index, into } = event.payload;
+          const placeholders: Milestone[] = Array.from({ length: into }, () => ({
+            title: 'Processing milestone...',
+            summary: 'Refining this part of the history...',
+            files: []
+          }));
+          setMilestones(prev => [...prev.slice(0, index), ...placeholders, ...prev.slice(index + 1)]);
+        }
+
+        // Progressive mode: final analysis of one of the finer milestones
+        if (event.type === 'milestone_replace' && event.payload) {
+          setMilestones(prev => {
+            const updated = [...prev];
+            updated[event.payload.index] = {
+              title: event.payload.title || 'Milestone',
+              summary: event.payload.summary || '',
+              files: event.payload.most_important_changes || []
+            };
+            return updated;
+          });
+        }
+
         // Check for final_summary event
         if (event.type === 'final_summary' && event.payload) {
           console.log('Final summary received:', event.payload);
@@ -9,6 +9,8 @@ import styles from './page.module.css';
 export default function Home() {
   const [repoUrl, setRepoUrl] = useState('');
   const [isSubmitting, setIsSubmitting] = useState(false);
+  // opt-in: a coarse timeline first, refined afterwards; skips reusing earlier runs
+  const [progressive, setProgressive] = useState(false);
   const router = useRouter();
   const { theme, toggleTheme } = useTheme();
 
@@ -24,7 +26,7 @@ export default function Home() {
     setIsSubmitting(true);
     try {
       console.log('Starting analysis for:', repoUrl);
-      const response = await AnalysisService.beginAnalysis(repoUrl);
+      const response = await AnalysisService.beginAnalysis(repoUrl, { progressive });
       console.log('Analysis started with ID:', response.id);
       console.log('Navigating to analysis page...');
 
@@ -90,6 +92,14 @@ export default function Home() {
               </svg>
             </button>
           </div>
+          <label className={styles.option}>
+            <input
+              type="checkbox"
+              checked={progressive}
+              onChange={(e) => setProgressive(e.target.checked)}
+            />
+            Quick overview first, then refine
+          </label>
         </form>
       </div>
     </div>
@@ -8,6 +8,8 @@ export interface Milestone {
   summary: string;
   files: string[];
   timestamp?: string;
+  // quick summary of a large part of history, until it is split into finer milestones
+  coarse?: boolean;
 }
 
 interface TimelineProps {
@@ -67,7 +69,11 @@ export default function Timeline({ milestones, theme = 'light' }: TimelineProps)
         >
           <div className={styles.timelineDot} />
 
-          <div className={`${styles.timelineCard} ${isLoading(milestone) ? styles.loadingCard : ''}`}>
+          <div
+            className={`${styles.timelineCard} ${isLoading(milestone) ? styles.loadingCard : ''} ${
+              milestone.coarse ? styles.coarseCard : ''
+            }`}
+          >
             <h3 className={styles.cardTitle}>{milestone.title}</h3>
             <div className={styles.cardSummary}>
               {renderSummaryWithCodeBlocks(milestone.summary)}
@@ -9,10 +9,44 @@ export interface SSEEvent {
   payload: any;
 }
 
+export interface MilestoneMessagesPage {
+  index: number;
+  total: number;
+  offset: number;
+  messages: string[];
+}
+
+export interface TimelineMilestone {
+  index: number;
+  start_commit_hash: string;
+  end_commit_hash: string;
+  time_start: number;
+  time_end: number;
+  num_messages: number;
+  preview: string[];
+  title: string;
+  summary: string;
+  most_important_changes: string[];
+}
+
+export interface Timeline {
+  repo: string;
+  head: string;
+  overview: string | null;
+  milestones: TimelineMilestone[];
+}
+
 export class AnalysisService {
-  static async beginAnalysis(repoUrl: string): Promise<AnalysisResponse> {
+  static async beginAnalysis(
+    repoUrl: string,
+    options: { progressive?: boolean } = {}
+  ): Promise<AnalysisResponse> {
     const formData = new URLSearchParams();
     formData.append('repo', repoUrl);
+    if (options.progressive) {
+      // coarse timeline first, refined with milestone_split / milestone_replace events
+      formData.append('progressive', 'true');
+    }
 
     const response = await fetch(`${API_BASE_URL}/begin-analysis`, {
       method: 'POST',
@@ -29,6 +63,39 @@ export class AnalysisService {
     return response.json();
   }
 
+  static async getMilestoneMessages(
+    pipelineId: string,
+    index: number,
+    offset = 0,
+    limit = 100
+  ): Promise<MilestoneMessagesPage> {
+    const params = new URLSearchParams({ offset: String(offset), limit: String(limit) });
+    const response = await fetch(
+      `${API_BASE_URL}/analysis/${pipelineId}/milestones/${index}/messages?${params}`
+    );
+
+    if (!response.ok) {
+      throw new Error(`Failed to load commit messages: ${response.statusText}`);
+    }
+
+    return response.json();
+  }
+
+  // Completed timeline of owner/repo, or null if it was never fully analyzed.
+  // The browser revalidates it with If-None-Match, so repeat views are cheap.
+  static async getTimeline(owner: string, repo: string): Promise<Timeline | null> {
+    const response = await fetch(`${API_BASE_URL}/timeline/${owner}/${repo}`);
+
+    if (response.status === 404) {
+      return null;
+    }
+    if (!response.ok) {
+      throw new Error(`Failed to load timeline: ${response.statusText}`);
+    }
+
+    return response.json();
+  }
+
   static subscribeToAnalysis(
     pipelineId: string,
     onEvent: (event: SSEEvent) => void,
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Throughput of batched milestone summarization against one agent run per milestone.
+
+    python benchmarks/batching.py path/to/repo --milestones 24 --commits 3
+    python benchmarks/batching.py path/to/repo --simulate
+
+Milestones are consecutive ranges of --commits first-parent commits from the start
+of history. Without --simulate both modes call the configured models (needs
+CEREBRAS_API_KEY). With --simulate a stand-in model answers every call after
+--overhead seconds plus output tokens at --tokens-per-second, and the per-milestone
+mode sends each milestone as a batch of one, isolating the cost of the extra calls.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess as sp
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("CEREBRAS_API_KEY", "unused")
+
+from BACKSIDE.batching import MilestoneBatcher  # noqa: E402
+from BACKSIDE.fetcher import DataFetcher  # noqa: E402
+from BACKSIDE.milestones import get_milestone_data  # noqa: E402
+from BACKSIDE.processor import MilestoneProcessor  # noqa: E402
+
+
+def load_milestones(repo_path: str, count: int, commits_per_milestone: int):
+    chain = sp.check_output(
+        ["git", "rev-list", "--first-parent", "--reverse", "HEAD"],
+        cwd=repo_path,
+        text=True,
+    ).split()
+    df = DataFetcher()
+    edges = chain[: count * commits_per_milestone + 1 : commits_per_milestone]
+    commits = [df.get_commit(repo_path, h) for h in edges]
+    return [get_milestone_data(a, b) for a, b in zip(commits, commits[1:])]
+
+
+def simulated_model(overhead: float, tokens_per_second: float):
+    from agents.items import ModelResponse
+    from agents.models.interface import Model
+    from agents.usage import Usage
+    from openai.types.responses import ResponseOutputMessage, ResponseOutputText
+
+    class SimulatedModel(Model):
+        async def get_response(self, system_instructions, input, *args, **kwargs):
+            text = input if isinstance(input, str) else json.dumps(input)
+            count = len(re.findall(r"### Milestone \d+", text))
+            output_tokens = 120 * count
+            await asyncio.sleep(overhead + output_tokens / tokens_per_second)
+            answer = json.dumps(
+                {
+                    "summaries": [
+                        {"title": "t", "summary": "s", "most_important_changes": []}
+                    ]
+                    * count
+                }
+            )
+            message = ResponseOutputMessage(
+                id="simulated",
+                type="message",
+                role="assistant",
+                status="completed",
+                content=[ResponseOutputText(type="output_text", text=answer, annotations=[])],
+            )
+            usage = Usage(
+                requests=1,
+                input_tokens=len(text) // 4,
+                output_tokens=output_tokens,
+                total_tokens=len(text) // 4 + output_tokens,
+            )
+            return ModelResponse(output=[message], usage=usage, response_id=None)
+
+        def stream_response(self, *args, **kwargs):
+            raise NotImplementedError
+
+    return SimulatedModel()
+
+
+async def per_milestone(processor: MilestoneProcessor, milestones, simulate: bool):
+    for milestone in milestones:
+        if simulate:
+            await processor.process_batch([milestone])
+        else:
+            await processor.process_milestone(milestone)
+
+
+async def batched(processor: MilestoneProcessor, milestones, token_budget: int, max_size: int):
+    batcher = MilestoneBatcher(token_budget, max_size)
+    calls = 0
+    for index, milestone in enumerate(milestones):
+        if not batcher.fits(milestone):
+            await processor.process_batch([m for _, m in batcher.take()])
+            calls += 1
+        batcher.add(index, milestone)
+    if batcher.pending:
+        await processor.process_batch([m for _, m in batcher.take()])
+        calls += 1
+    return calls
+
+
+async def run(args):
+    milestones = load_milestones(args.repo, args.milestones, args.commits)
+    processor = MilestoneProcessor()
+    if args.simulate:
+        processor.batch_agent = processor.batch_agent.clone(
+            model=simulated_model(args.overhead, args.tokens_per_second)
+        )
+
+    start = time.perf_counter()
+    await per_milestone(processor, milestones, args.simulate)
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calls = await batched(processor, milestones, args.token_budget, args.max_batch)
+    batch_seconds = time.perf_counter() - start
+
+    n = len(milestones)
+    print(f"{n} milestones of {args.commits} commits from {args.repo}")
+    print(f"  per milestone: {single_seconds:7.2f}s  {n / single_seconds:6.2f} milestones/s  ({n} runs)")
+    print(f"  batched:       {batch_seconds:7.2f}s  {n / batch_seconds:6.2f} milestones/s  ({calls} calls)")
+    print(f"  throughput gain: {single_seconds / batch_seconds:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("repo", help="Local repository path.")
+    parser.add_argument("--milestones", type=int, default=24)
+    parser.add_argument("--commits", type=int, default=3, help="Commits per milestone.")
+    parser.add_argument("--token-budget", type=int, default=6000)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--simulate", action="store_true", help="Use a stand-in model.")
+    parser.add_argument("--overhead", type=float, default=0.6, help="Simulated seconds per call.")
+    parser.add_argument("--tokens-per-second", type=float, default=1500.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Cold start of the API server: how long a fresh process takes to import main.py,
+to answer its first request, and to have the agent stack ready; plus the cost of
+creating a per-pipeline MilestoneProcessor with shared and with rebuilt agents.
+
+    python benchmarks/cold_start.py --runs 5
+
+Every measurement runs in a new interpreter, so nothing is cached between runs
+apart from the OS page cache.
+"""
+
+import argparse
+import json
+import os
+import subprocess as sp
+import sys
+from statistics import median
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Each probe prints one JSON object of timings in seconds.
+FIRST_REQUEST = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.get("/metrics")
+    first_request = time.perf_counter() - start
+print(json.dumps({"import main": imported, "first request": first_request}))
+"""
+
+AGENT_STACK = """
+import json, time
+start = time.perf_counter()
+from BACKSIDE import integration
+integration.warm_up()
+ready = time.perf_counter() - start
+from BACKSIDE import processor
+timings = []
+for _ in range(5):
+    start = time.perf_counter()
+    processor.MilestoneProcessor()
+    timings.append(time.perf_counter() - start)
+rebuilt = []
+for _ in range(5):
+    processor.get_agents.cache_clear()
+    start = time.perf_counter()
+    processor.MilestoneProcessor()
+    rebuilt.append(time.perf_counter() - start)
+print(json.dumps({
+    "agent stack ready": ready,
+    "processor (shared agents)": sorted(timings)[2],
+    "processor (rebuilt agents)": sorted(rebuilt)[2],
+}))
+"""
+
+
+def probe(code: str) -> dict:
+    env = {**os.environ, "CEREBRAS_API_KEY": os.environ.get("CEREBRAS_API_KEY", "unused")}
+    output = sp.check_output([sys.executable, "-c", code], cwd=ROOT, env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for _ in range(args.runs):
+        for code in (FIRST_REQUEST, AGENT_STACK):
+            for name, seconds in probe(code).items():
+                results.setdefault(name, []).append(seconds)
+
+    print(f"median of {args.runs} fresh processes")
+    for name, values in results.items():
+        print(f"  {name:28s} {median(values) * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
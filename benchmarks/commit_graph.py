@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Ancestry queries answered from the memory-mapped commit-graph against git
+subprocesses, on a synthetic repository with merges.
+
+    python benchmarks/commit_graph.py --commits 20000 --repeat 20
+
+Times the calls the pipeline makes per analysis and per milestone: the root of the
+first-parent chain (get_boundary_commit), the first-parent chain after a commit
+(every boundary bisect) and is_ancestor (the validity check of a previous timeline).
+"""
+
+import argparse
+import os
+import subprocess as sp
+import sys
+import tempfile
+import time
+from statistics import median
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from BACKSIDE import commitgraph  # noqa: E402
+from BACKSIDE.fetcher import DataFetcher  # noqa: E402
+
+ENV = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.com",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.com",
+}
+
+
+def build_repository(path: str, commits: int, merge_every: int):
+    """Linear main line with a two-commit side branch merged every merge_every commits."""
+    sp.run(["git", "init", "-q", path], check=True, env=ENV)
+    lines = []
+    mark = 0
+    previous = None
+    for i in range(commits):
+        mark += 1
+        lines += [
+            "commit refs/heads/master",
+            f"mark :{mark}",
+            f"committer bench <bench@example.com> {1_600_000_000 + i * 60} +0000",
+            f"data {len(f'commit {i}')}",
+            f"commit {i}",
+        ]
+        if previous is not None:
+            lines.append(f"from :{previous}")
+        if i and i % merge_every == 0:
+            lines.append(f"merge :{mark - 2}")
+        lines.append(f"M 644 inline file{i % 100}.txt")
+        lines += [f"data {len(str(i))}", str(i), ""]
+        previous = mark
+    sp.run(
+        ["git", "fast-import", "--quiet"],
+        cwd=path,
+        input="\n".join(lines) + "\n",
+        text=True,
+        check=True,
+        env=ENV,
+    )
+    sp.run(["git", "checkout", "-q", "master"], cwd=path, check=True, env=ENV)
+
+
+def timed(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commits", type=int, default=20000)
+    parser.add_argument("--merge-every", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    df = DataFetcher()
+    with tempfile.TemporaryDirectory() as path:
+        build_repository(path, args.commits, args.merge_every)
+        commitgraph.write_commit_graph(path)
+        head = df.get_boundary_commit(path, False)
+        middle = df.get_commit(path, f"HEAD~{args.commits // 20}")
+        old = df.get_commit(path, f"HEAD~{args.commits // 2}")
+        queries = {
+            "root commit": lambda: df.get_boundary_commit(path),
+            "first-parent chain": lambda: df.get_first_parent_chain(path, middle.hash),
+            "is_ancestor": lambda: df.is_ancestor(path, old.hash),
+        }
+
+        print(f"{args.commits} commits, merge every {args.merge_every}, HEAD {head.hash[:7]}")
+        # the graph walks a head's first-parent chain once, then answers from it
+        print(f"  {'query':20s} {'git':>10s} {'graph, first':>13s} {'graph, then':>12s}")
+        for name, query in queries.items():
+            commitgraph.default_use_commit_graph = False
+            with_git = timed(query, args.repeat)
+            commitgraph.default_use_commit_graph = True
+            commitgraph._graphs.clear()
+            first = timed(query, 1)
+            then = timed(query, args.repeat)
+            print(
+                f"  {name:20s} {with_git * 1000:8.2f}ms {first * 1000:11.2f}ms "
+                f"{then * 1000:10.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
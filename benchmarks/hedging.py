@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Milestone latency with and without hedged agent attempts, against the stub model
+server (benchmarks/stub_model_server.py) with a share of slow and stuck requests.
+
+    python benchmarks/hedging.py path/to/repo --milestones 40 --slow-fraction 0.1
+
+Milestones are consecutive ranges of --commits first-parent commits, keeping only
+the ones routed to an agent. Both modes get the same sequence of injected delays.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess as sp
+import sys
+import threading
+import time
+from statistics import median
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("CEREBRAS_API_KEY", "unused")
+
+import uvicorn  # noqa: E402
+
+from BACKSIDE import processor as processor_module  # noqa: E402
+from BACKSIDE.fetcher import DataFetcher  # noqa: E402
+from BACKSIDE.milestones import get_milestone_data  # noqa: E402
+from BACKSIDE.processor import MilestoneProcessor  # noqa: E402
+from BACKSIDE.routing import TEMPLATE_ROUTE, route_milestone  # noqa: E402
+from stub_model_server import LatencyProfile, create_app  # noqa: E402
+
+
+def load_milestones(repo_path: str, count: int, commits_per_milestone: int):
+    chain = sp.check_output(
+        ["git", "rev-list", "--first-parent", "--reverse", "HEAD"],
+        cwd=repo_path,
+        text=True,
+    ).split()
+    df = DataFetcher()
+    edges = chain[::commits_per_milestone]
+    commits = [df.get_commit(repo_path, h) for h in edges]
+    milestones = [get_milestone_data(a, b) for a, b in zip(commits, commits[1:])]
+    milestones = [m for m in milestones if route_milestone(m).route != TEMPLATE_ROUTE]
+    return milestones[:count]
+
+
+def start_server(profile: LatencyProfile, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(
+        uvicorn.Config(create_app(profile), host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+async def run_mode(args, milestones, hedge: bool, port: int):
+    profile = LatencyProfile(
+        args.first_token,
+        args.slow_fraction,
+        args.slow_delay,
+        args.hang_fraction,
+        args.tokens_per_second,
+        args.seed,
+    )
+    server = start_server(profile, port)
+    processor_module.first_token_latency = processor_module.LatencyTracker()
+    processor_module.default_hedge_delay = args.hedge_delay
+    processor = MilestoneProcessor(
+        model="openai/stub",
+        small_model="openai/stub",
+        base_url=f"http://127.0.0.1:{port}/v1",
+        turn_timeout=args.turn_timeout,
+        milestone_timeout=args.milestone_timeout,
+        hedge=hedge,
+    )
+    latencies = []
+    degraded = 0
+    try:
+        for milestone in milestones:
+            start = time.perf_counter()
+            result = await processor.process_milestone(milestone)
+            latencies.append(time.perf_counter() - start)
+            degraded += bool(result.get("degraded"))
+    finally:
+        server.should_exit = True
+    return latencies, degraded, server.config.app.state.requests
+
+
+async def run(args):
+    milestones = load_milestones(args.repo, args.milestones, args.commits)
+    rows = []
+    for port, hedge in ((args.port, False), (args.port + 1, True)):
+        latencies, degraded, requests = await run_mode(args, milestones, hedge, port)
+        rows.append((hedge, latencies, degraded, requests))
+
+    print(
+        f"{len(milestones)} milestones, first token {args.first_token}s, "
+        f"{args.slow_fraction:.0%} slow ({args.slow_delay}s), {args.hang_fraction:.0%} stuck"
+    )
+    for hedge, latencies, degraded, requests in rows:
+        print(
+            f"  {'hedged' if hedge else 'single':7s} p50 {median(latencies):6.2f}s  "
+            f"p95 {percentile(latencies, 95):6.2f}s  max {max(latencies):6.2f}s  "
+            f"total {sum(latencies):7.2f}s  degraded {degraded}  model requests {requests}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("repo", help="Local repository path.")
+    parser.add_argument("--milestones", type=int, default=40)
+    parser.add_argument("--commits", type=int, default=5, help="Commits per milestone.")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--first-token", type=float, default=0.3)
+    parser.add_argument("--slow-fraction", type=float, default=0.1)
+    parser.add_argument("--slow-delay", type=float, default=15.0)
+    parser.add_argument("--hang-fraction", type=float, default=0.02)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--hedge-delay", type=float, default=2.0, help="Until 20 first tokens were seen."
+    )
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--milestone-timeout", type=float, default=60.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Model call latency and connections opened with one shared pooled HTTP client,
+against a client per pipeline and a client per call, under many concurrent
+pipelines. Runs the stub model server (benchmarks/stub_model_server.py) in a
+separate process.
+
+    python benchmarks/http_pool.py --pipelines 50 --calls 4 --waves 3 --tls
+
+Every pipeline makes --calls sequential streamed completions through litellm, the
+way the agent does (or through the OpenAI SDK underneath it, with --sdk). --waves
+batches of --pipelines concurrent pipelines run one after another, like analyses
+arriving over time. "per call" builds a new httpx client for every request (as
+cohere_summary_service did), "per pipeline" one per pipeline, "shared" sends
+everything through BACKSIDE.httpclient's pool (--transport picks its transport).
+--tls serves the stub over HTTPS with a throwaway self-signed certificate, so every
+new connection also pays for a TLS handshake.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess as sp
+import sys
+import tempfile
+import time
+import urllib.request
+from statistics import median
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+import litellm  # noqa: E402
+from openai import AsyncOpenAI  # noqa: E402
+
+from BACKSIDE.httpclient import (  # noqa: E402
+    AIOHTTP_TRANSPORT,
+    HTTPX_TRANSPORT,
+    create_http_client,
+    default_timeout,
+    install_litellm_client,
+)
+
+MESSAGES = [{"role": "user", "content": "analyze the current milestone"}]
+PER_CALL, PER_PIPELINE, SHARED = "per call", "per pipeline", "shared"
+
+
+def self_signed_certificate(directory: str):
+    key, cert = os.path.join(directory, "key.pem"), os.path.join(directory, "cert.pem")
+    sp.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key,
+         "-out", cert, "-days", "1", "-subj", "/CN=127.0.0.1"],
+        check=True,
+        capture_output=True,
+    )
+    return key, cert
+
+
+def start_server(args, key=None, cert=None) -> sp.Popen:
+    command = [
+        sys.executable,
+        os.path.join(os.path.dirname(__file__), "stub_model_server.py"),
+        "--port", str(args.port),
+        "--first-token", str(args.first_token),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--chunk-chars", "32",
+    ]
+    if key is not None:
+        command += ["--ssl-keyfile", key, "--ssl-certfile", cert]
+    server = sp.Popen(command)
+    for _ in range(100):
+        try:
+            stats(args, key is not None)
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("stub model server did not start")
+
+
+def stats(args, tls: bool) -> dict:
+    import ssl
+
+    context = ssl._create_unverified_context() if tls else None
+    scheme = "https" if tls else "http"
+    with urllib.request.urlopen(f"{scheme}://127.0.0.1:{args.port}/stats", context=context) as f:
+        return json.load(f)
+
+
+async def completion(base_url: str, client=None) -> float:
+    start = time.perf_counter()
+    response = await litellm.acompletion(
+        model="openai/stub",
+        messages=MESSAGES,
+        base_url=base_url,
+        api_key="unused",
+        stream=True,
+        client=client,
+    )
+    async for _ in response:
+        pass
+    return time.perf_counter() - start
+
+
+async def sdk_completion(base_url: str, client) -> float:
+    """The OpenAI SDK call litellm makes underneath, without litellm's per-chunk work."""
+    start = time.perf_counter()
+    response = await client.chat.completions.create(
+        model="stub", messages=MESSAGES, stream=True
+    )
+    async for _ in response:
+        pass
+    return time.perf_counter() - start
+
+
+async def pipeline(base_url: str, calls: int, mode: str, verify: bool, sdk: bool = False):
+    if mode == SHARED and not sdk:
+        return [await completion(base_url) for _ in range(calls)]
+    call = sdk_completion if sdk else completion
+    latencies = []
+    http_client = None
+    for _ in range(calls):
+        if mode == SHARED:
+            client = AsyncOpenAI(
+                base_url=base_url, api_key="unused", http_client=litellm.aclient_session
+            )
+        elif http_client is None or mode == PER_CALL:
+            if http_client is not None:
+                await http_client.aclose()
+            http_client = httpx.AsyncClient(verify=verify, timeout=default_timeout)
+            client = AsyncOpenAI(base_url=base_url, api_key="unused", http_client=http_client)
+        latencies.append(await call(base_url, client))
+    if http_client is not None:
+        await http_client.aclose()
+    return latencies
+
+
+async def run_mode(args, base_url: str, mode: str):
+    before = stats(args, args.tls)["connections"]
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.waves):
+        results = await asyncio.gather(
+            *(
+                pipeline(base_url, args.calls, mode, not args.tls, args.sdk)
+                for _ in range(args.pipelines)
+            )
+        )
+        latencies += [x for calls in results for x in calls]
+    wall = time.perf_counter() - start
+    connections = stats(args, args.tls)["connections"] - before
+    return wall, sorted(latencies), connections
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        key, cert = self_signed_certificate(directory) if args.tls else (None, None)
+        server = start_server(args, key, cert)
+        base_url = f"{'https' if args.tls else 'http'}://127.0.0.1:{args.port}/v1"
+        try:
+            # the pool lives as long as the process, like the server's
+            install_litellm_client(
+                create_http_client(verify=not args.tls, transport=args.transport)
+            )
+            # warm litellm's lazy imports before measuring
+            await pipeline(base_url, 1, PER_PIPELINE, not args.tls)
+            rows = [
+                (mode, *await run_mode(args, base_url, mode))
+                for mode in (PER_CALL, PER_PIPELINE, SHARED)
+            ]
+        finally:
+            await litellm.aclient_session.aclose()
+            server.terminate()
+            server.wait()
+
+    calls = args.waves * args.pipelines * args.calls
+    print(
+        f"{args.waves} waves of {args.pipelines} concurrent pipelines x {args.calls} calls "
+        f"({calls} calls), {'HTTPS' if args.tls else 'HTTP'}, first token {args.first_token}s"
+        + (", OpenAI SDK" if args.sdk else ", litellm")
+        + f", shared transport {args.transport}"
+    )
+    for mode, wall, latencies, connections in rows:
+        print(
+            f"  {mode:12s} wall {wall:6.2f}s  p50 {median(latencies) * 1000:7.1f}ms  "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.1f}ms  "
+            f"connections opened {connections}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pipelines", type=int, default=50)
+    parser.add_argument("--calls", type=int, default=4, help="Sequential calls per pipeline.")
+    parser.add_argument("--waves", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8021)
+    parser.add_argument("--first-token", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--tls", action="store_true", help="Serve the stub over HTTPS.")
+    parser.add_argument(
+        "--transport", choices=(AIOHTTP_TRANSPORT, HTTPX_TRANSPORT), default=AIOHTTP_TRANSPORT
+    )
+    parser.add_argument(
+        "--sdk",
+        action="store_true",
+        help="Call the OpenAI SDK directly, so litellm's CPU cost does not hide the transport's.",
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
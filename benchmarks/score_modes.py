@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Accuracy vs speed of the blob-free size estimate against the numstat scorer.
+
+    python benchmarks/score_modes.py path/to/repo owner/project --pairs 200
+
+Local paths are used as they are, owner/project is cloned blob-less from GitHub
+(like the pipeline does) into a temporary directory. The size mode runs first so it
+only sees the blobs the clone started with; the numstat mode then downloads what it needs.
+"""
+
+import argparse
+import os
+import random
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from BACKSIDE.scoring import NUMSTAT_MODE, SIZE_MODE, calculate_score  # noqa: E402
+
+
+def prepare(repo: str, workspace: str) -> str:
+    if os.path.isdir(repo):
+        return repo
+    path = os.path.join(workspace, repo.replace("/", "__"))
+    sp.run(
+        [
+            "git",
+            "clone",
+            "-q",
+            "--filter=blob:none",
+            "--no-checkout",
+            f"https://github.com/{repo}.git",
+            path,
+        ],
+        check=True,
+    )
+    return path
+
+
+def sample_pairs(repo_path: str, count: int, seed: int):
+    chain = sp.check_output(
+        ["git", "rev-list", "--first-parent", "--reverse", "HEAD"],
+        cwd=repo_path,
+        text=True,
+    ).split()
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        i = rng.randrange(len(chain) - 1)
+        # log-uniform range lengths, like the probes of a bisect
+        length = int(2 ** rng.uniform(0, np.log2(len(chain) - i)))
+        pairs.append((chain[i], chain[min(i + max(length, 1), len(chain) - 1)]))
+    return pairs
+
+
+def ranks(values: np.ndarray) -> np.ndarray:
+    order = np.argsort(values, kind="stable")
+    result = np.empty(len(values))
+    result[order] = np.arange(len(values))
+    return result
+
+
+def score_all(repo_path: str, pairs, mode: str):
+    start = time.perf_counter()
+    scores = np.array([calculate_score(c1, c2, repo_path, mode=mode) for c1, c2 in pairs])
+    return scores, time.perf_counter() - start
+
+
+def report(repo: str, repo_path: str, pairs):
+    estimated, size_seconds = score_all(repo_path, pairs, SIZE_MODE)
+    exact, numstat_seconds = score_all(repo_path, pairs, NUMSTAT_MODE)
+    spearman = float(np.corrcoef(ranks(estimated), ranks(exact))[0, 1])
+    nonzero = exact > 0
+    ratio = estimated[nonzero] / exact[nonzero]
+    # how often a bisect probe would take the same branch, at the median exact score
+    threshold = float(np.median(exact))
+    agreement = float(np.mean((estimated > threshold) == (exact > threshold)))
+    print(f"{repo}: {len(pairs)} ranges")
+    print(f"  numstat: {numstat_seconds:8.2f}s  ({1000 * numstat_seconds / len(pairs):.1f} ms/range)")
+    print(f"  size:    {size_seconds:8.2f}s  ({1000 * size_seconds / len(pairs):.1f} ms/range)")
+    print(f"  speedup: {numstat_seconds / max(size_seconds, 1e-9):.1f}x")
+    print(f"  spearman rank correlation: {spearman:.3f}")
+    if len(ratio):
+        print(
+            f"  estimate / exact: median {np.median(ratio):.2f}, "
+            f"p10 {np.percentile(ratio, 10):.2f}, p90 {np.percentile(ratio, 90):.2f}"
+        )
+    print(f"  probe agreement at median threshold: {agreement:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("repos", nargs="+", help="Local paths or GitHub owner/project.")
+    parser.add_argument("--pairs", type=int, default=100, help="Ranges per repository.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workspace:
+        for repo in args.repos:
+            repo_path = prepare(repo, workspace)
+            report(repo, repo_path, sample_pairs(repo_path, args.pairs, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+OpenAI-compatible chat completions server with injectable latency, for measuring
+how the pipeline copes with a slow or stuck model provider.
+
+    python benchmarks/stub_model_server.py --port 8011 --slow-fraction 0.1
+    MODEL=openai/stub MODEL_BASE_URL=http://127.0.0.1:8011/v1 uvicorn main:app
+
+Every request streams a MilestoneSummary as JSON. Its first token comes after
+--first-token seconds, or --slow-delay seconds for --slow-fraction of requests;
+--hang-fraction of requests never send a token. The rest of the answer streams at
+--tokens-per-second. GET /stats reports the requests and client connections seen.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+ANSWER = {
+    "title": "Stub milestone",
+    "summary": "A milestone summarized by the stub model server. " * 4,
+    "most_important_changes": ["README.md"],
+}
+
+
+class LatencyProfile:
+    def __init__(
+        self,
+        first_token: float = 0.5,
+        slow_fraction: float = 0.0,
+        slow_delay: float = 20.0,
+        hang_fraction: float = 0.0,
+        tokens_per_second: float = 400.0,
+        seed: int = 0,
+        chunk_chars: int = 4,
+    ):
+        self.first_token = first_token
+        self.slow_fraction = slow_fraction
+        self.slow_delay = slow_delay
+        self.hang_fraction = hang_fraction
+        self.tokens_per_second = tokens_per_second
+        self.chunk_chars = chunk_chars
+        self.random = random.Random(seed)
+
+    def first_token_delay(self) -> float:
+        roll = self.random.random()
+        if roll < self.hang_fraction:
+            return float("inf")
+        if roll < self.hang_fraction + self.slow_fraction:
+            return self.slow_delay
+        return self.first_token
+
+
+def create_app(profile: LatencyProfile) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = 0
+    # client (host, port) pairs seen, i.e. TCP connections the clients opened
+    app.state.connections = set()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        app.state.connections.add((request.client.host, request.client.port))
+        delay = profile.first_token_delay()
+        created = int(time.time())
+        completion_id = f"chatcmpl-stub-{app.state.requests}"
+        text = json.dumps(ANSWER)
+        size = profile.chunk_chars
+        pieces = [text[i : i + size] for i in range(0, len(text), size)]
+
+        def chunk(delta: dict, finish_reason=None, usage=None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if usage is not None:
+                data["usage"] = usage
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def stream():
+            if delay == float("inf"):
+                await asyncio.Event().wait()
+            await asyncio.sleep(delay)
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in pieces:
+                yield chunk({"content": piece})
+                await asyncio.sleep(1 / profile.tokens_per_second)
+            yield chunk(
+                {},
+                finish_reason="stop",
+                usage={
+                    "prompt_tokens": 1000,
+                    "completion_tokens": len(pieces),
+                    "total_tokens": 1000 + len(pieces),
+                },
+            )
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests, "connections": len(app.state.connections)}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub model server with injected latency")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--first-token", type=float, default=0.5)
+    parser.add_argument("--slow-fraction", type=float, default=0.0)
+    parser.add_argument("--slow-delay", type=float, default=20.0)
+    parser.add_argument("--hang-fraction", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-chars", type=int, default=4, help="Characters per streamed chunk.")
+    parser.add_argument("--ssl-keyfile", help="Serve HTTPS with this key...")
+    parser.add_argument("--ssl-certfile", help="...and certificate.")
+    args = parser.parse_args()
+    profile = LatencyProfile(
+        args.first_token,
+        args.slow_fraction,
+        args.slow_delay,
+        args.hang_fraction,
+        args.tokens_per_second,
+        args.seed,
+        args.chunk_chars,
+    )
+    uvicorn.run(
+        create_app(profile),
+        host="127.0.0.1",
+        port=args.port,
+        log_level="warning",
+        ssl_keyfile=args.ssl_keyfile,
+        ssl_certfile=args.ssl_certfile,
+        timeout_keep_alive=60,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,42 @@
 # app.py
 import asyncio
 import json
+import os
 import uuid
-from typing import Dict, List, Optional, Tuple
-from fastapi import FastAPI, Form, HTTPException, Request, BackgroundTasks
-from fastapi.responses import StreamingResponse
+import gzip
+import zlib
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Form, HTTPException, Query, Request, BackgroundTasks
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from BACKSIDE.integration import Pipeline
+from BACKSIDE.integration import Pipeline, warm_up
+from BACKSIDE.metrics import metrics
+from BACKSIDE.segmentation import default_merge_bonus
+from BACKSIDE.snapshots import snapshot_store
+from BACKSIDE.scoring import NUMSTAT_MODE, SCORE_MODES
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the agent stack loads in a worker thread while requests are already served
+    warm = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    warm.cancel()
+    from BACKSIDE.httpclient import close_http_client
+
+    await close_http_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -34,13 +59,65 @@ def sse_frame(data: dict, event_id: Optional[str] = None) -> bytes:
     return "".join(parts).encode("utf-8")
 
 
+def accepts_gzip(request: Request) -> bool:
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        if coding != "gzip":
+            continue
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Gzips a stream without holding events back: every chunk is followed by a sync
+    flush, so each SSE frame can be decoded as soon as it arrives.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    async for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
 @app.post("/begin-analysis")
-async def begin_analysis(background: BackgroundTasks, repo: str = Form(...)):
+async def begin_analysis(
+    background: BackgroundTasks,
+    repo: str = Form(...),
+    trace: bool = Form(False),
+    target_milestones: Optional[int] = Form(None),
+    time_budget: Optional[float] = Form(None),
+    balanced: bool = Form(False),
+    merge_bonus: float = Form(default_merge_bonus),
+    score_mode: str = Form(NUMSTAT_MODE),
+    batch: bool = Form(False),
+    distributed: bool = Form(False),
+    progressive: bool = Form(False),
+):
+    if score_mode not in SCORE_MODES:
+        raise HTTPException(400, f"score_mode must be one of {', '.join(SCORE_MODES)}")
     pid = str(uuid.uuid4())
     # pid = "bongnog"  # Commented out for unique IDs
-    pipeline.add_process(pid)
+    pipeline.add_process(pid, trace=trace)
     # fire-and-forget
-    background.add_task(pipeline.run_pipeline, pid, repo)
+    background.add_task(
+        pipeline.run_pipeline,
+        pid,
+        repo,
+        target_milestones=target_milestones,
+        time_budget=time_budget,
+        balanced=balanced,
+        merge_bonus=merge_bonus,
+        score_mode=score_mode,
+        batch=batch,
+        distributed=distributed,
+        progressive=progressive,
+    )
     return {"id": pid}
 
 
@@ -50,7 +127,88 @@ async def analysis_sse(pid: str, request: Request):
     if not p:
         raise HTTPException(404, "Unknown analysis id")
 
+    # closing the stream early lets the analysis be cancelled, see Pipeline._detach
+    stream = pipeline.get_stream(pid, request.is_disconnected)
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if accepts_gzip(request):
+        stream = gzip_stream(stream)
+        headers["Content-Encoding"] = "gzip"
     return StreamingResponse(
-        pipeline.get_stream(pid),
+        stream,
         media_type="text/event-stream",
+        headers=headers,
     )
+
+
+@app.get("/analysis/{pid}/milestones/{index}/messages")
+async def milestone_messages(
+    pid: str,
+    index: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Commit subjects of a milestone, paged. milestone_start only carries a preview."""
+    page = pipeline.get_milestone_messages(pid, index, offset, limit)
+    if page is None:
+        raise HTTPException(404, "Unknown or expired analysis id, or unknown milestone index")
+    return page
+
+
+@app.get("/analysis/{pid}/trace")
+async def analysis_trace(pid: str):
+    """Chrome trace-event JSON of a traced analysis (open in ui.perfetto.dev)."""
+    trace = pipeline.get_trace(pid)
+    if trace is not None:
+        # still running: serve what has been recorded so far
+        return JSONResponse(trace)
+    path = pipeline.get_trace_path(pid)
+    if not os.path.exists(path):
+        raise HTTPException(404, "No trace recorded for this analysis id")
+    return FileResponse(path, media_type="application/json")
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    return header.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in header.split(",")]
+
+
+@app.get("/timeline/{owner}/{repo}")
+async def timeline(owner: str, repo: str, request: Request, head: Optional[str] = None):
+    """
+    Latest completed timeline of a repository (or the one at ?head=), as stored when
+    its analysis finished. Supports If-None-Match; the body is served pre-gzipped.
+    """
+    name = f"{owner}/{repo}"
+    if head is None:
+        latest = snapshot_store.latest(name)
+        if latest is None:
+            raise HTTPException(404, "No completed timeline for this repository")
+        head, etag = latest
+        # HEAD can move, so clients revalidate every time
+        cache_control = "no-cache"
+    else:
+        etag = None
+        # a timeline at a fixed HEAD never changes
+        cache_control = "public, max-age=31536000, immutable"
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+    if etag is not None and etag_matches(request, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    snapshot = snapshot_store.load(name, head)
+    if snapshot is None:
+        raise HTTPException(404, "No completed timeline for this repository and HEAD")
+    headers["ETag"] = snapshot.etag
+    if etag_matches(request, snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    if accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        return Response(snapshot.body, media_type="application/json", headers=headers)
+    return Response(gzip.decompress(snapshot.body), media_type="application/json", headers=headers)
+
+
+@app.get("/metrics")
+async def metrics_endpoint(format: str = "prometheus"):
+    """Process metrics in the Prometheus text format, or as JSON with ?format=json."""
+    if format == "json":
+        return JSONResponse(metrics.snapshot())
+    return PlainTextResponse(metrics.render())
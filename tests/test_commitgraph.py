@@ -0,0 +1,126 @@
+import os
+import subprocess as sp
+
+import pytest
+
+from BACKSIDE.commitgraph import CommitGraph, GRAPH_PATH, write_commit_graph
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_CONFIG_NOSYSTEM": "1",
+    "HOME": os.devnull,
+}
+
+
+def git(repo: str, *args: str, time: int = 0) -> str:
+    env = {
+        **os.environ,
+        **GIT_ENV,
+        "GIT_AUTHOR_DATE": f"{1_700_000_000 + time} +0000",
+        "GIT_COMMITTER_DATE": f"{1_700_000_000 + time} +0000",
+    }
+    return sp.check_output(["git", *args], cwd=repo, env=env, text=True).strip()
+
+
+@pytest.fixture(scope="module")
+def repo(tmp_path_factory):
+    """
+    main with two merged feature branches (one merged back twice), an octopus merge
+    and an unmerged side branch, so that reachability differs from first-parent order.
+    """
+    path = str(tmp_path_factory.mktemp("repo"))
+    git(path, "init", "-q", "-b", "main")
+    clock = iter(range(1000))
+
+    def commit(message: str):
+        git(path, "commit", "-q", "--allow-empty", "-m", message, time=next(clock))
+
+    def merge(*branches: str):
+        git(path, "merge", "-q", "--no-ff", "-m", f"merge {' '.join(branches)}", *branches,
+            time=next(clock))
+
+    for i in range(3):
+        commit(f"main {i}")
+    git(path, "checkout", "-q", "-b", "feature")
+    for i in range(3):
+        commit(f"feature {i}")
+    git(path, "checkout", "-q", "main")
+    commit("main 3")
+    merge("feature")
+    git(path, "checkout", "-q", "feature")
+    commit("feature 3")
+    git(path, "checkout", "-q", "-b", "nested")
+    commit("nested 0")
+    git(path, "checkout", "-q", "feature")
+    merge("nested")
+    git(path, "checkout", "-q", "main")
+    merge("feature")
+    for name in ("a", "b", "c"):
+        git(path, "checkout", "-q", "-b", f"octopus-{name}", "main")
+        commit(f"octopus {name}")
+    git(path, "checkout", "-q", "main")
+    merge("octopus-a", "octopus-b", "octopus-c")
+    git(path, "checkout", "-q", "-b", "side", "HEAD~2")
+    commit("side 0")
+    git(path, "checkout", "-q", "main")
+    commit("main 4")
+
+    write_commit_graph(path)
+    assert os.path.exists(os.path.join(path, GRAPH_PATH))
+    return path
+
+
+@pytest.fixture(scope="module")
+def graph(repo):
+    graph = CommitGraph(os.path.join(repo, GRAPH_PATH))
+    yield graph
+    graph.close()
+
+
+def all_commits(repo: str):
+    return git(repo, "rev-list", "--all").split()
+
+
+def test_is_ancestor_matches_git(repo, graph):
+    commits = all_commits(repo)
+    assert len(commits) == graph.count
+    for ancestor in commits:
+        for descendant in commits:
+            expected = sp.run(
+                ["git", "merge-base", "--is-ancestor", ancestor, descendant], cwd=repo
+            ).returncode == 0
+            assert graph.is_ancestor(ancestor, descendant) is expected, (ancestor, descendant)
+
+
+def test_first_parent_chain_matches_git(repo, graph):
+    for head in ("main", "feature", "side", "octopus-b"):
+        head_oid = git(repo, "rev-parse", head)
+        chain = git(repo, "rev-list", "--first-parent", "--reverse", head).split()
+        assert graph.first_parent_chain(head_oid) == chain
+        assert graph.first_parent_root(head_oid) == chain[0]
+        for stop in chain:
+            expected = git(
+                repo, "rev-list", "--first-parent", "--reverse", f"{stop}..{head_oid}"
+            ).split()
+            assert graph.first_parent_chain(head_oid, stop) == expected
+
+
+def test_parents_match_git(repo, graph):
+    for oid in all_commits(repo):
+        parents = git(repo, "rev-list", "--parents", "-n", "1", oid).split()[1:]
+        position = graph.position(oid)
+        assert [graph.oid(p) for p in graph.parents(position)] == parents
+
+
+def test_unknown_commits(repo, graph):
+    head = git(repo, "rev-parse", "main")
+    missing = "0" * 40
+    assert graph.position(missing) is None
+    assert graph.is_ancestor(missing, head) is None
+    assert graph.first_parent_chain(missing) is None
+    side = git(repo, "rev-parse", "side")
+    # stop is not on the first-parent chain of main
+    assert graph.first_parent_chain(head, side) is None
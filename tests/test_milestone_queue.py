@@ -0,0 +1,149 @@
+"""
+Redelivery behaviour of the milestone worker group. Runs against the Redis at
+REDIS_URL when one answers, otherwise against an in-process fakeredis server.
+
+    python -m pytest tests/test_milestone_queue.py
+"""
+
+import asyncio
+import json
+import uuid
+
+import fakeredis
+import pytest
+import redis
+from redis.asyncio import Redis
+
+from BACKSIDE import milestone_queue
+from BACKSIDE.milestone_queue import MilestoneWorker
+
+CLAIM_IDLE = 0.3
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    """Factory for clients of one server; unique stream and group keys per test."""
+    client = redis.Redis.from_url(milestone_queue.REDIS_URL)
+    try:
+        client.ping()
+        factory = lambda: Redis.from_url(milestone_queue.REDIS_URL, decode_responses=True)
+    except redis.exceptions.ConnectionError:
+        server = fakeredis.FakeServer()
+        client = fakeredis.FakeRedis(server=server)
+        factory = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    suffix = uuid.uuid4().hex
+    monkeypatch.setattr(milestone_queue, "TASK_STREAM", f"test:{suffix}:tasks")
+    monkeypatch.setattr(milestone_queue, "WORKER_GROUP", f"test:{suffix}:workers")
+    pid = f"test-{suffix}"
+    yield factory, pid
+    client.delete(milestone_queue.TASK_STREAM, milestone_queue.RESULT_STREAM(pid))
+    client.close()
+
+
+def new_worker(connect, name: str) -> MilestoneWorker:
+    factory, _ = connect
+    worker = MilestoneWorker(name, redis=factory(), claim_idle=CLAIM_IDLE)
+    worker.summarized = []
+
+    async def summarize(processor, fields):
+        worker.summarized.append(fields["index"])
+        return {"title": f"milestone {fields['index']}"}
+
+    worker._summarize = summarize
+    return worker
+
+
+async def submit(worker: MilestoneWorker, pid: str) -> str:
+    await milestone_queue.ensure_group(worker.redis)
+    return await worker.redis.xadd(
+        milestone_queue.TASK_STREAM,
+        {"pid": pid, "index": 0, "repo": "a/b", "start": "s", "end": "e", "prev_summary": ""},
+    )
+
+
+async def results(worker: MilestoneWorker, pid: str) -> list:
+    entries = await worker.redis.xrange(milestone_queue.RESULT_STREAM(pid))
+    return [fields for _, fields in entries]
+
+
+async def pending(worker: MilestoneWorker) -> list:
+    return await worker.redis.xpending_range(
+        milestone_queue.TASK_STREAM, milestone_queue.WORKER_GROUP, min="-", max="+", count=10
+    )
+
+
+def test_stalled_entry_is_reclaimed(connect):
+    _, pid = connect
+
+    async def scenario():
+        dead, alive = new_worker(connect, "dead"), new_worker(connect, "alive")
+        entry_id = await submit(alive, pid)
+        # the dead worker reads the entry and never acknowledges it
+        assert [e for e, _ in await dead._read_new("dead-0")] == [entry_id]
+        assert await alive._claim_stalled("alive-0") == []
+
+        await asyncio.sleep(CLAIM_IDLE * 1.5)
+        claimed = await alive._claim_stalled("alive-0")
+        assert [e for e, _ in claimed] == [entry_id]
+        assert await alive._deliveries(entry_id) == 2
+
+        await alive._handle("alive-0", None, entry_id, claimed[0][1])
+        assert alive.summarized == ["0"]
+        assert [json.loads(r["summary"]) for r in await results(alive, pid)] == [
+            {"title": "milestone 0"}
+        ]
+        assert await pending(alive) == []
+        await asyncio.gather(dead.redis.aclose(), alive.redis.aclose())
+
+    asyncio.run(scenario())
+
+
+def test_heartbeat_keeps_live_entry(connect):
+    _, pid = connect
+
+    async def scenario():
+        busy, other = new_worker(connect, "busy"), new_worker(connect, "other")
+        entry_id = await submit(busy, pid)
+        await busy._read_new("busy-0")
+        heartbeat = asyncio.create_task(busy._heartbeat("busy-0", entry_id))
+
+        await asyncio.sleep(CLAIM_IDLE * 3)
+        assert await other._claim_stalled("other-0") == []
+        # JUSTID re-claims do not count as deliveries
+        assert await busy._deliveries(entry_id) == 1
+
+        heartbeat.cancel()
+        await asyncio.sleep(CLAIM_IDLE * 1.5)
+        assert [e for e, _ in await other._claim_stalled("other-0")] == [entry_id]
+        await asyncio.gather(busy.redis.aclose(), other.redis.aclose())
+
+    asyncio.run(scenario())
+
+
+def test_error_posted_after_max_deliveries(connect):
+    _, pid = connect
+
+    async def scenario():
+        worker = new_worker(connect, "last")
+        entry_id = await submit(worker, pid)
+        await worker._read_new("crashed-0")
+        for i in range(milestone_queue.default_max_deliveries):
+            await worker.redis.xautoclaim(
+                milestone_queue.TASK_STREAM,
+                milestone_queue.WORKER_GROUP,
+                f"crashed-{i + 1}",
+                0,
+                start_id="0-0",
+            )
+        assert await worker._deliveries(entry_id) == milestone_queue.default_max_deliveries + 1
+
+        claimed = await worker.redis.xrange(milestone_queue.TASK_STREAM, entry_id, entry_id)
+        await worker._handle("last-0", None, entry_id, claimed[0][1])
+        assert worker.summarized == []
+        (result,) = await results(worker, pid)
+        assert "summary" not in result
+        assert result["error"].startswith("Gave up on the milestone after")
+        assert await pending(worker) == []
+        await worker.redis.aclose()
+
+    asyncio.run(scenario())
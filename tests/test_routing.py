@@ -0,0 +1,64 @@
+from BACKSIDE.classifier import PathClassifier
+from BACKSIDE.gitmodels import FileChange
+from BACKSIDE.milestones import RawMilestone
+from BACKSIDE.routing import (
+    FULL_ROUTE,
+    SMALL_ROUTE,
+    TEMPLATE_ROUTE,
+    route_milestone,
+    template_summary,
+)
+
+
+def milestone(*changes: FileChange, messages=("change",)) -> RawMilestone:
+    return RawMilestone(
+        time_start=0,
+        time_end=1,
+        start_commit_hash="a" * 40,
+        end_commit_hash="b" * 40,
+        messages=list(messages),
+        changes=list(changes),
+        _repo_path=".",
+        _classifier=PathClassifier(),
+    )
+
+
+def test_small_source_edit_goes_to_the_small_model():
+    change = FileChange("M", "src/app.py", insertions=2, deletions=1)
+    decision = route_milestone(milestone(change))
+    assert decision.route == SMALL_ROUTE
+
+
+def test_lockfile_only_milestone_uses_a_template():
+    change = FileChange("M", "uv.lock", insertions=300, deletions=280)
+    decision = route_milestone(milestone(change))
+    assert decision.route == TEMPLATE_ROUTE
+    title = template_summary(milestone(change))["title"]
+    assert title == "Dependency and configuration updates"
+
+
+def test_small_docs_edit_uses_a_template():
+    decision = route_milestone(milestone(FileChange("M", "docs/usage.md", insertions=3)))
+    assert decision.route == TEMPLATE_ROUTE
+
+
+def test_large_docs_rewrite_goes_to_a_model():
+    decision = route_milestone(milestone(FileChange("M", "docs/usage.md", insertions=400)))
+    assert decision.route != TEMPLATE_ROUTE
+
+
+def test_rename_only_milestone_uses_a_template():
+    renames = [FileChange("R100", f"lib/m{i}.py", old_path=f"src/m{i}.py") for i in range(4)]
+    decision = route_milestone(milestone(*renames))
+    assert decision.route == TEMPLATE_ROUTE
+    assert template_summary(milestone(*renames))["title"] == "File renames"
+
+
+def test_rename_with_edits_is_not_a_template():
+    change = FileChange("R090", "lib/m.py", old_path="src/m.py", insertions=1, deletions=1)
+    assert route_milestone(milestone(change)).route != TEMPLATE_ROUTE
+
+
+def test_large_source_change_goes_to_the_full_model():
+    changes = [FileChange("M", f"src/m{i}.py", insertions=200) for i in range(12)]
+    assert route_milestone(milestone(*changes)).route == FULL_ROUTE
@@ -0,0 +1,132 @@
+"""
+The blob-free size mode of the scorer against numstat, on a blob:none clone of a
+small repository served over file://, so that blobs are really missing.
+"""
+
+import os
+import subprocess as sp
+
+import pytest
+
+from BACKSIDE import gitobjects, scoring
+from BACKSIDE.scoring import (
+    NUMSTAT_MODE,
+    SIZE_MODE,
+    calculate_score,
+    estimate_score,
+    get_lines_per_change,
+)
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_CONFIG_NOSYSTEM": "1",
+    "HOME": os.devnull,
+}
+
+
+def git(repo: str, *args: str) -> str:
+    env = {**os.environ, **GIT_ENV}
+    return sp.check_output(["git", *args], cwd=repo, env=env, text=True).strip()
+
+
+def write(repo: str, path: str, lines: int, seed: int):
+    os.makedirs(os.path.dirname(os.path.join(repo, path)), exist_ok=True)
+    with open(os.path.join(repo, path), "w") as f:
+        f.writelines(f"line {i} of {path}, version {seed}\n" for i in range(lines))
+
+
+def local_objects(repo: str) -> int:
+    stats = dict(line.split(": ") for line in git(repo, "count-objects", "-v").splitlines())
+    return int(stats["count"]) + int(stats["in-pack"])
+
+
+@pytest.fixture(scope="module")
+def origin(tmp_path_factory):
+    """
+    Small edits, a large rewrite, an added and a deleted file, and a moved file.
+    returns: (path, first-parent chain oldest first)
+    """
+    origin = str(tmp_path_factory.mktemp("origin"))
+    git(origin, "init", "-q", "-b", "main")
+    git(origin, "config", "uploadpack.allowFilter", "true")
+    git(origin, "config", "uploadpack.allowAnySHA1InWant", "true")
+
+    def commit(message: str):
+        git(origin, "add", "-A")
+        git(origin, "commit", "-q", "-m", message)
+
+    for i in range(6):
+        write(origin, f"src/module{i}.py", 40, 0)
+    commit("initial")
+    for version in range(1, 9):
+        # small edits: rewrite a few lines of one module
+        write(origin, f"src/module{version % 6}.py", 40, 0)
+        with open(os.path.join(origin, f"src/module{version % 6}.py"), "a") as f:
+            f.write(f"edit {version}\n" * 3)
+        commit(f"small edit {version}")
+    write(origin, "src/module0.py", 400, 1)
+    commit("large rewrite")
+    write(origin, "src/new.py", 200, 0)
+    os.remove(os.path.join(origin, "src/module5.py"))
+    commit("add and delete")
+    os.renames(
+        os.path.join(origin, "src/module4.py"), os.path.join(origin, "lib/module4.py")
+    )
+    commit("move")
+    return origin, git(origin, "rev-list", "--first-parent", "--reverse", "HEAD").split()
+
+
+@pytest.fixture
+def clone(origin, tmp_path, monkeypatch):
+    """A fresh blob:none clone of origin, calibrated on two commits only."""
+    monkeypatch.setattr(scoring, "default_calibration_commits", 2)
+    url = f"file://{origin[0]}"
+    git(str(tmp_path), "clone", "-q", "--filter=blob:none", "--no-checkout", url, ".")
+    return str(tmp_path)
+
+
+def test_missing_objects_are_the_blobs_the_clone_never_fetched(origin, clone):
+    chain = origin[1]
+    changes = gitobjects.diff_raw(clone, chain[-4], chain[-3])
+    blobs = {oid for change in changes for oid in (change.old_oid, change.new_oid) if oid}
+    before = local_objects(clone)
+    assert gitobjects.missing_objects(clone, chain[-4], chain[-3]) == blobs
+    # the check itself never downloads anything
+    assert local_objects(clone) == before
+
+
+def test_size_mode_never_fetches_blobs_after_calibration(origin, clone):
+    chain = origin[1]
+    assert get_lines_per_change(clone) > 0
+    before = local_objects(clone)
+    for c1, c2 in zip(chain, chain[1:]):
+        calculate_score(c1, c2, clone, mode=SIZE_MODE)
+    assert local_objects(clone) == before
+
+
+def test_size_mode_orders_ranges_like_numstat(origin, clone):
+    origin, chain = origin
+    # without blobs a modification counts as one typical change per commit touching
+    # it, so ranges order by the files and commits they cover
+    ranges = [(chain[1], chain[2]), (chain[1], chain[5]), (chain[0], chain[-1])]
+    estimated = [estimate_score(c1, c2, clone) for c1, c2 in ranges]
+    exact = [calculate_score(c1, c2, origin, mode=NUMSTAT_MODE) for c1, c2 in ranges]
+    assert estimated[0] < estimated[1] < estimated[2]
+    assert exact[0] < exact[1] < exact[2]
+
+
+def test_size_mode_uses_exact_sizes_when_blobs_are_local(origin):
+    origin, chain = origin
+    # the added file of 200 lines and the deleted one of 40, all blobs local in origin
+    score = estimate_score(chain[-3], chain[-2], origin)
+    exact = calculate_score(chain[-3], chain[-2], origin, mode=NUMSTAT_MODE)
+    assert score == pytest.approx(exact, rel=0.25)
+
+
+def test_moved_files_cost_nothing(origin, clone):
+    origin, chain = origin
+    assert estimate_score(chain[-2], chain[-1], clone) == 0.0
+    assert estimate_score(chain[-2], chain[-1], origin) == 0.0
@@ -0,0 +1,105 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from BACKSIDE.segmentation import (
+    CommitChurn,
+    balanced_boundaries,
+    count_segments,
+    find_threshold_for_target,
+    segment_boundaries,
+)
+
+
+def random_prefix(rng: np.random.Generator, n: int) -> np.ndarray:
+    weights = rng.integers(0, 50, size=n).astype(np.float64)
+    return np.concatenate(([0.0], np.cumsum(weights[1:])))
+
+
+def cost(prefix: np.ndarray, boundaries, target: int, merge_mask=None, merge_bonus=0.0) -> float:
+    """The objective balanced_boundaries minimizes, evaluated directly."""
+    q = prefix / (prefix[-1] / target)
+    squares = sum((q[b] - q[a]) ** 2 for a, b in zip(boundaries, boundaries[1:]))
+    bonus = 0.0
+    if merge_mask is not None:
+        bonus = merge_bonus * sum(bool(merge_mask[b]) for b in boundaries[1:-1])
+    return squares - bonus
+
+
+def exhaustive_best(prefix: np.ndarray, target: int, merge_mask=None, merge_bonus=0.0) -> float:
+    last = len(prefix) - 1
+    return min(
+        cost(prefix, [0, *inner, last], target, merge_mask, merge_bonus)
+        for inner in itertools.combinations(range(1, last), target - 1)
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_balanced_boundaries_matches_exhaustive_partitions(seed):
+    rng = np.random.default_rng(seed)
+    prefix = random_prefix(rng, int(rng.integers(3, 11)))
+    if prefix[-1] <= 0:
+        pytest.skip("no work in this history")
+    last = len(prefix) - 1
+    for target in range(1, last + 1):
+        boundaries = balanced_boundaries(prefix, target)
+        assert boundaries[0] == 0 and boundaries[-1] == last
+        assert len(boundaries) == target + 1
+        assert all(a < b for a, b in zip(boundaries, boundaries[1:]))
+        assert cost(prefix, boundaries, target) == pytest.approx(
+            exhaustive_best(prefix, target)
+        )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_balanced_boundaries_merge_bonus_matches_exhaustive_partitions(seed):
+    rng = np.random.default_rng(seed)
+    prefix = random_prefix(rng, int(rng.integers(3, 11)))
+    if prefix[-1] <= 0:
+        pytest.skip("no work in this history")
+    merge_mask = rng.random(len(prefix)) < 0.4
+    last = len(prefix) - 1
+    for target in range(1, last + 1):
+        boundaries = balanced_boundaries(prefix, target, merge_mask, merge_bonus=0.5)
+        assert len(boundaries) == target + 1
+        assert cost(prefix, boundaries, target, merge_mask, 0.5) == pytest.approx(
+            exhaustive_best(prefix, target, merge_mask, 0.5)
+        )
+
+
+def achievable_targets(prefix: np.ndarray) -> set:
+    """Every milestone count some threshold produces: counts only change at work differences."""
+    differences = np.unique(np.abs(prefix[:, None] - prefix[None, :]))
+    thresholds = np.concatenate((differences, np.maximum(differences - 1e-6, 0)))
+    return set(count_segments(prefix, thresholds).tolist())
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_threshold_search_hits_achievable_targets(seed):
+    rng = np.random.default_rng(seed)
+    prefix = random_prefix(rng, int(rng.integers(20, 80)))
+    if prefix[-1] <= 0:
+        pytest.skip("no work in this history")
+    churn = CommitChurn(commits=[], weights=np.diff(prefix, prepend=0.0), prefix=prefix)
+    for target in sorted(achievable_targets(prefix)):
+        threshold, boundaries = find_threshold_for_target(churn, target)
+        assert int(count_segments(prefix, [threshold])[0]) == target
+        assert boundaries == segment_boundaries(prefix, threshold)
+        assert len(boundaries) == target + 1
+
+
+def test_threshold_search_caps_target_at_commits_with_work():
+    prefix = np.array([0.0, 5.0, 5.0, 5.0, 9.0, 9.0, 12.0])
+    churn = CommitChurn(commits=[], weights=np.diff(prefix, prepend=0.0), prefix=prefix)
+    threshold, boundaries = find_threshold_for_target(churn, 6)
+    assert threshold == 0.0
+    assert boundaries == [0, 1, 4, 6]
+
+
+def test_threshold_search_on_uniform_work():
+    prefix = np.arange(101, dtype=np.float64)
+    churn = CommitChurn(commits=[], weights=np.ones(101), prefix=prefix)
+    for target in (1, 2, 5, 10, 25, 100):
+        _, boundaries = find_threshold_for_target(churn, target)
+        assert len(boundaries) == target + 1
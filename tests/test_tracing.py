@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+from BACKSIDE import tracing
+from BACKSIDE.tracing import Tracer
+
+
+def spans(tracer: Tracer) -> dict:
+    return {e["name"]: e for e in tracer.events if e["ph"] == "X"}
+
+
+def test_concurrent_tasks_get_their_own_tracks():
+    tracer = Tracer("test")
+
+    async def work(name: str):
+        with tracing.span(name):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        token = tracing.activate(tracer)
+        try:
+            await asyncio.gather(work("a"), work("b"))
+            with tracing.span("outside"):
+                await asyncio.to_thread(lambda: None)
+        finally:
+            tracing.deactivate(token)
+
+    asyncio.run(main())
+    recorded = spans(tracer)
+    a, b = recorded["a"], recorded["b"]
+    # the spans overlap in time, so they must not share a track
+    assert a["ts"] < b["ts"] + b["dur"] and b["ts"] < a["ts"] + a["dur"]
+    assert a["tid"] != b["tid"]
+    names = {e["tid"]: e["args"]["name"] for e in tracer.events if e["name"] == "thread_name"}
+    assert names[a["tid"]].startswith("task ")
+    assert names[recorded["outside"]["tid"]].startswith("task ")
+
+
+def test_spans_outside_a_loop_use_the_thread():
+    tracer = Tracer("test")
+    token = tracing.activate(tracer)
+    try:
+        with tracing.span("sync"):
+            pass
+    finally:
+        tracing.deactivate(token)
+    assert spans(tracer)["sync"]["tid"] == threading.get_ident()